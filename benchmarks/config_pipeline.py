@@ -0,0 +1,148 @@
+"""Time and peak memory of each stage of processing a config, on a generated config.
+
+Usage:
+    python benchmarks/config_pipeline.py --blocks 64 --extends-depth 4 --table-size 32 --choices 4 --latin-square 8
+"""
+import copy
+import json
+from pathlib import Path
+import random
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+import click
+import toml
+from loguru import logger
+from tabulate import tabulate
+
+from experiment_server._participant_ordering import construct_participant_condition
+from experiment_server._process_config import (
+    _replace_variables,
+    compile_config,
+    process_config_file,
+    resolve_extends,
+    resolve_function_calls,
+)
+
+
+def generate_config(blocks: int, extends_depth: int, table_size: int, choices: int, latin_square: int) -> Dict[str, Any]:
+    """
+    Generate a config with `blocks` blocks split into `latin_square` groups ordered with a latin
+    square. Each block extends a chain of `extends_depth` template blocks and has a nested table
+    with `table_size` keys (one of which uses a variable) and `choices` calls to `choices`.
+    """
+    templates = []
+    for depth in range(extends_depth):
+        template = {"name": f"template_{depth}", "config": {f"template_{depth}_value": depth, "stim_dir": "${STIM_DIR}"}}
+        if depth > 0:
+            template["extends"] = f"template_{depth - 1}"
+        templates.append(template)
+
+    main_blocks = []
+    for block_idx in range(blocks):
+        config: Dict[str, Any] = {
+            "trials": "$TRIALS",
+            "table": {f"key_{key_idx}": {"value": key_idx, "label": f"{block_idx}-{key_idx}"} for key_idx in range(table_size)},
+        }
+        config["table"]["key_0"] = f"${{STIM_DIR}}/block_{block_idx}.png"
+        for choice_idx in range(choices):
+            # `unique` retries a limited number of times, keep enough values to choose from
+            config[f"choice_{choice_idx}"] = {"function_name": "choices", "args": [list(range(4 * blocks * choices))], "params": {"unique": True}}
+        block = {"name": f"block_{block_idx}", "config": config}
+        if extends_depth > 0:
+            block["extends"] = templates[-1]["name"]
+        main_blocks.append(block)
+
+    groups_count = max(1, min(latin_square, blocks))
+    group_size = blocks // groups_count
+    order = [[b["name"] for b in main_blocks[i * group_size: (i + 1) * group_size]] for i in range(groups_count)]
+    return {
+        "blocks": templates + main_blocks,
+        "configuration": {
+            "order": order,
+            "groups_strategy": "latin_square",
+            "within_groups_strategy": "randomize",
+            "variables": {"TRIALS": 10, "STIM_DIR": "stimuli"},
+        },
+    }
+
+
+def _measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Mean/min time (ms) of `func` over `repeat` calls and the peak memory (KB) of one call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"mean_ms": sum(times) / len(times) * 1000, "min_ms": min(times) * 1000, "peak_kb": peak_size / 1024}
+
+
+@click.command()
+@click.option("--blocks", default=64, type=click.IntRange(min=1), help="Number of blocks in the order.")
+@click.option("--extends-depth", default=4, type=click.IntRange(min=0), help="Length of the chain of blocks each block extends.")
+@click.option("--table-size", default=32, type=click.IntRange(min=1), help="Number of keys in the nested table of each block.")
+@click.option("--choices", default=4, type=click.IntRange(min=0), help="Number of `choices` calls in each block.")
+@click.option("--latin-square", default=8, type=click.IntRange(min=1), help="Number of groups ordered with a latin square.")
+@click.option("-r", "--repeat", default=20, type=click.IntRange(min=1), help="Number of times each stage is run.")
+@click.option("--json", "as_json", default=False, is_flag=True, help="Write the results as JSON.")
+def main(blocks, extends_depth, table_size, choices, latin_square, repeat, as_json):
+    """Report the time and peak memory of each stage of processing a generated config."""
+    logger.remove()
+    configuration = generate_config(blocks, extends_depth, table_size, choices, latin_square)
+    variables = configuration["configuration"]["variables"]
+    order = configuration["configuration"]["order"]
+    participant_index = 2
+
+    # Inputs of each stage are the outputs of the stage before it, as in `compile_config`
+    replaced_blocks = _replace_variables(configuration["blocks"], variables)
+    resolved_blocks = resolve_extends([dict(c) for c in replaced_blocks])
+    main_blocks = [c for c in resolved_blocks if c["name"].startswith("block_")]
+
+    def _construct_participant_condition():
+        random.seed(participant_index)
+        return construct_participant_condition(main_blocks, participant_index, order=copy.deepcopy(order),
+                                               init_block_names=[], final_block_names=[],
+                                               groups_strategy="latin_square", within_groups_strategy="randomize")
+
+    def _resolve_function_calls():
+        random.seed(participant_index)
+        return resolve_function_calls(main_blocks)
+
+    compiled_config = compile_config(configuration)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_file = Path(tmp_dir) / "config.toml"
+        with open(config_file, "w") as f:
+            toml.dump(configuration, f)
+
+        stages = {
+            "toml.load": lambda: toml.load(config_file),
+            "_replace_variables": lambda: _replace_variables(configuration["blocks"], variables),
+            "resolve_extends": lambda: resolve_extends([dict(c) for c in replaced_blocks]),
+            "construct_participant_condition": _construct_participant_condition,
+            "resolve_function_calls": _resolve_function_calls,
+            "compile_config": lambda: compile_config(configuration),
+            "CompiledConfig.resolve": lambda: compiled_config.resolve(participant_index, suppress_message=True),
+            "process_config_file": lambda: process_config_file(config_file, participant_index, suppress_message=True),
+        }
+        results = {name: _measure(func, repeat) for name, func in stages.items()}
+
+    if as_json:
+        click.echo(json.dumps({"blocks": blocks, "extends_depth": extends_depth, "table_size": table_size,
+                               "choices": choices, "latin_square": latin_square, "stages": results}, indent=2))
+    else:
+        click.echo(f"blocks: {blocks}    extends depth: {extends_depth}    table size: {table_size}    "
+                   f"choices: {choices}    latin square: {latin_square}")
+        click.echo(tabulate([[name] + list(r.values()) for name, r in results.items()],
+                            headers=["stage", "mean (ms)", "min (ms)", "peak (KB)"], floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Memory used per participant by `Experiment`.
+
+Usage:
+    python benchmarks/participant_memory.py [CONFIG_FILE] -n 100000
+"""
+import gc
+from pathlib import Path
+import tracemalloc
+
+import click
+from loguru import logger
+
+from experiment_server._api import Experiment
+
+
+@click.command()
+@click.argument("config-file", default=str(Path(__file__).parent.parent / "sample_config.toml"), type=click.Path(exists=True))
+@click.option("-n", "--participants", default=10000, type=click.IntRange(min=1), help="Number of participants to add.")
+@click.option("-b", "--blocks", default=1, type=click.IntRange(min=0), help="Number of blocks each participant moves through after being added.")
+def main(config_file, participants, blocks):
+    """Report the bytes used per participant after adding `participants` and moving
+    each of them through `blocks` blocks."""
+    logger.remove()
+    experiment = Experiment(config_file, 1)
+    try:
+        gc.collect()
+        tracemalloc.start()
+        start_size, _ = tracemalloc.get_traced_memory()
+        for participant_index in range(2, participants + 2):
+            experiment.add_participant_index(participant_index)
+        gc.collect()
+        added_size, _ = tracemalloc.get_traced_memory()
+
+        for participant_index in range(2, participants + 2):
+            for _ in range(blocks):
+                experiment.move_to_next(participant_index)
+        gc.collect()
+        moved_size, peak_size = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if experiment.watchdog is not None:
+            experiment.watchdog.end_watch()
+
+    click.echo(f"config file:                      {config_file}")
+    click.echo(f"participants:                     {participants}")
+    click.echo(f"bytes per participant (added):    {(added_size - start_size) / participants:.1f}")
+    click.echo(f"bytes per participant ({blocks} blocks): {(moved_size - start_size) / participants:.1f}")
+    click.echo(f"peak bytes per participant:       {(peak_size - start_size) / participants:.1f}")
+
+
+if __name__ == "__main__":
+    main()
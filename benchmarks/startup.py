@@ -0,0 +1,77 @@
+"""Startup time of the CLI subcommands, measured with `python -X importtime`.
+
+Usage:
+    python benchmarks/startup.py [CONFIG_FILE] -r 5
+"""
+import json
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import click
+from tabulate import tabulate
+
+
+def _commands(config_file: str, tmp_dir: str) -> Dict[str, List[str]]:
+    return {
+        "--help": ["--help"],
+        "run --help": ["run", "--help"],
+        "ui --help": ["ui", "--help"],
+        "verify-config-file": ["verify-config-file", config_file],
+        "generate-config-json": ["generate-config-json", config_file, "-r", "1", "-d", tmp_dir],
+        "new-config-file": ["new-config-file", str(Path(tmp_dir) / "new")],
+    }
+
+
+def _run(args: List[str]) -> Tuple[float, float, List[Tuple[str, float]]]:
+    """Run the CLI with `args`. Returns the wall time (ms), the import time (ms) and the top level imports with their cumulative time (ms)."""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "from experiment_server.cli import cli; cli()"] + args,
+                            capture_output=True, text=True)
+    wall_time = (time.perf_counter() - start) * 1000
+
+    top_level_imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented
+        if not name[1:].startswith(" "):
+            top_level_imports.append((name.strip(), int(cumulative) / 1000))
+    return wall_time, sum(t for _, t in top_level_imports), top_level_imports
+
+
+@click.command()
+@click.argument("config-file", default=str(Path(__file__).parent.parent / "sample_config.toml"), type=click.Path(exists=True))
+@click.option("-r", "--repeat", default=5, type=click.IntRange(min=1), help="Number of times each command is run, the fastest run is reported.")
+@click.option("--json", "as_json", default=False, is_flag=True, help="Write the results as JSON.")
+def main(config_file, repeat, as_json):
+    """Report the wall time and import time of each subcommand, and its slowest top level imports."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, args in _commands(config_file, tmp_dir).items():
+            runs = []
+            for _ in range(repeat):
+                runs.append(_run(args))
+                # `new-config-file` fails if the file exists
+                (Path(tmp_dir) / "new" / "new_config.toml").unlink(missing_ok=True)
+            wall_time, import_time, top_level_imports = min(runs, key=lambda r: r[0])
+            results[name] = {
+                "wall_ms": wall_time,
+                "import_ms": import_time,
+                "slowest_imports": dict(sorted(top_level_imports, key=lambda i: i[1], reverse=True)[:5]),
+            }
+
+    if as_json:
+        click.echo(json.dumps(results, indent=2))
+    else:
+        click.echo(tabulate([[name, r["wall_ms"], r["import_ms"], ", ".join(f"{m} ({t:.0f})" for m, t in r["slowest_imports"].items())]
+                             for name, r in results.items()],
+                            headers=["command", "wall (ms)", "imports (ms)", "slowest imports (ms)"], floatfmt=".1f"))
+
+
+if __name__ == "__main__":
+    main()
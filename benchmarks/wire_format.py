@@ -0,0 +1,81 @@
+"""Payload size and encode/decode time of the `/api/all-configs` and `/api/config` responses as JSON, MessagePack and CBOR.
+
+Usage:
+    python benchmarks/wire_format.py --blocks 64 --table-size 32 -r 20
+"""
+import json
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import click
+from loguru import logger
+from tabulate import tabulate
+
+from config_pipeline import generate_config
+from experiment_server._process_config import compile_config
+from experiment_server._wire_format import WIRE_FORMATS, available_wire_formats, dumps, loads
+
+
+def _formats() -> Dict[str, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]]:
+    """The encoders and decoders to compare. `json (indent=4)` is what the server sends when JSON is requested."""
+    formats = {
+        "json (indent=4)": (lambda value: json.dumps(value, indent=4).encode(), json.loads),
+        "json": (lambda value: json.dumps(value, separators=(",", ":")).encode(), json.loads),
+    }
+    for name in available_wire_formats():
+        media_type = WIRE_FORMATS[name]
+        formats[name] = (lambda value, media_type=media_type: dumps(media_type, value),
+                         lambda data, media_type=media_type: loads(media_type, data))
+    return formats
+
+
+def _min_ms(func: Callable[[], Any], repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+@click.command()
+@click.option("--blocks", default=64, type=click.IntRange(min=1), help="Number of blocks in the order.")
+@click.option("--table-size", default=32, type=click.IntRange(min=1), help="Number of keys in the nested table of each block.")
+@click.option("--choices", default=4, type=click.IntRange(min=0), help="Number of `choices` calls in each block.")
+@click.option("-r", "--repeat", default=20, type=click.IntRange(min=1), help="Number of times each payload is encoded/decoded, the fastest run is reported.")
+@click.option("--json", "as_json", default=False, is_flag=True, help="Write the results as JSON.")
+def main(blocks, table_size, choices, repeat, as_json):
+    """Report the size and the encode/decode time of the config responses in each wire format."""
+    logger.remove()
+    configuration = generate_config(blocks, 2, table_size, choices, 1)
+    all_configs = compile_config(configuration).resolve(1, suppress_message=True)
+    payloads = {"all-configs": all_configs, "config": all_configs[0]}
+    missing = [name for name in WIRE_FORMATS if name not in available_wire_formats()]
+    if missing and not as_json:
+        click.echo(f"Not installed, skipped: {', '.join(missing)}")
+
+    results: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for payload_name, payload in payloads.items():
+        results[payload_name] = {}
+        for format_name, (encode, decode) in _formats().items():
+            data = encode(payload)
+            assert decode(data) == json.loads(json.dumps(payload))
+            results[payload_name][format_name] = {
+                "bytes": len(data),
+                "encode_ms": _min_ms(lambda: encode(payload), repeat),
+                "decode_ms": _min_ms(lambda: decode(data), repeat),
+            }
+
+    if as_json:
+        click.echo(json.dumps({"blocks": blocks, "table_size": table_size, "choices": choices, "payloads": results}, indent=2))
+    else:
+        rows: List[List[Any]] = []
+        for payload_name, formats in results.items():
+            for format_name, r in formats.items():
+                rows.append([payload_name, format_name, r["bytes"], r["encode_ms"], r["decode_ms"]])
+        click.echo(f"blocks: {blocks}    table size: {table_size}    choices: {choices}")
+        click.echo(tabulate(rows, headers=["response", "format", "bytes", "encode (ms)", "decode (ms)"], floatfmt=".3f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
-from importlib_metadata import version
 import logging
+from typing import TYPE_CHECKING
 from loguru import logger
 
-__version__ = version(__package__)
+if TYPE_CHECKING:
+    from experiment_server._server import server_process
+    from experiment_server._client import Client
+    from experiment_server._api import Experiment
 
 
 class __InterceptHandler(logging.Handler):
@@ -24,8 +27,22 @@ class __InterceptHandler(logging.Handler):
 
 logging.basicConfig(handlers=[__InterceptHandler()], level=0)
 
-from experiment_server._server import server_process
-from experiment_server._client import Client
-from experiment_server._api import Experiment
-
 __all__ = ['server_process', 'Client', 'Experiment']
+
+
+def __getattr__(name):
+    # Imported when first used, so that importing the package (e.g., for the CLI) does not
+    # import tornado, requests, etc.
+    if name == "server_process":
+        from experiment_server._server import server_process
+        return server_process
+    elif name == "Client":
+        from experiment_server._client import Client
+        return Client
+    elif name == "Experiment":
+        from experiment_server._api import Experiment
+        return Experiment
+    elif name == "__version__":
+        from importlib_metadata import version
+        return version(__package__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,170 @@
+import json
+from pathlib import Path
+import random
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from loguru import logger
+
+from experiment_server.utils import ExperimentServerConfigurationException
+
+
+# Number of shuffled rounds of a population kept in memory
+_PERMUTATION_CACHE_SIZE = 64
+
+
+class CohortAllocator:
+    """
+    Allocates the values of the `choices` calls with `scope = "cohort"` across all participants.
+
+    The values of a group of calls (see `id` in the function calls) are drawn without
+    replacement from a pool shared by all participants: the population is shuffled and the
+    values are handed out in that order, `k` at a time. Once all values are allocated, a new
+    round starts with a new shuffled order. The shuffled orders are derived from the group's
+    signature and the random seed of the config, so only the number of values allocated and
+    where each participant's calls start in the pool are kept.
+
+    A participant gets the same values every time their config is resolved (e.g., after a
+    reload or a reset). If `state_file` is given, each allocation is appended to it as a line
+    of JSON, and the allocations in it are loaded when created, so participants keep their
+    values across restarts. The lines are written by a background thread so that allocating
+    does not wait on the file, use `flush` to write them before the process exits. The
+    population of a group can not change once values of it are allocated.
+    """
+    def __init__(self, state_file: Union[str, Path, None] = None) -> None:
+        self.state_file = None if state_file is None else Path(state_file)
+        self._lock = threading.Lock()
+        # Number of values allocated of each group
+        self._allocated_counts: Dict[str, int] = {}
+        # Position in the pool of each call of a participant, by group and participant index
+        self._offsets: Dict[str, Dict[int, List[int]]] = {}
+        # Size of the population of each group, the allocated positions are only valid for it
+        self._population_sizes: Dict[str, int] = {}
+        self._permutations: Dict[Tuple[str, int, int], List[int]] = {}
+        # Lines not written to `state_file` yet, and the thread writing them
+        self._pending_lines: List[str] = []
+        self._writer: Optional[threading.Thread] = None
+        # Held while writing to `state_file`, taken before `_lock`
+        self._file_lock = threading.Lock()
+
+        if self.state_file is not None and self.state_file.exists():
+            self._load()
+
+    def allocate(self, signature: str, population: Sequence[Any], k: int, participant_index: int, call_index: int, random_seed: int) -> List[Any]:
+        """
+        Return the `k` values of the `call_index`th call of the group `signature` made for
+        `participant_index`, allocating them if it is the first time the call is made.
+        """
+        population_size = len(population)
+        with self._lock:
+            self._check_population(signature, population_size)
+            offsets = self._offsets.setdefault(signature, {}).setdefault(participant_index, [])
+            if call_index < len(offsets):
+                offset = offsets[call_index]
+            else:
+                offset = self._allocated_counts.get(signature, 0)
+                self._allocated_counts[signature] = offset + k
+                offsets.append(offset)
+                self._population_sizes[signature] = population_size
+                self._save(signature, participant_index, offset, k, population_size)
+
+            values = []
+            for position in range(offset, offset + k):
+                permutation = self._permutation(signature, population_size, position // population_size, random_seed)
+                values.append(population[permutation[position % population_size]])
+        return values
+
+    def allocated_count(self, signature: str) -> int:
+        """Number of values allocated of the group `signature`."""
+        return self._allocated_counts.get(signature, 0)
+
+    def check_population(self, signature: str, population_size: int) -> None:
+        """
+        Raise `ExperimentServerConfigurationException` if values of the group `signature` were
+        allocated from a population whose size is not `population_size`.
+        """
+        with self._lock:
+            self._check_population(signature, population_size)
+
+    def flush(self) -> None:
+        """Write the allocations not written to `state_file` yet."""
+        with self._file_lock:
+            with self._lock:
+                lines, self._pending_lines = self._pending_lines, []
+            if lines and self.state_file is not None:
+                with open(self.state_file, "a") as f:
+                    f.write("".join(lines))
+
+    def _check_population(self, signature: str, population_size: int) -> None:
+        allocated_population_size = self._population_sizes.get(signature, None)
+        if allocated_population_size is not None and allocated_population_size != population_size:
+            raise ExperimentServerConfigurationException(
+                f"The population of the cohort function call group {signature} changed from {allocated_population_size} to {population_size} values "
+                "after values of it were allocated. Use a new `id` for the changed population.")
+
+    def _permutation(self, signature: str, population_size: int, round_index: int, random_seed: int) -> List[int]:
+        # The population size of a group does not change (see `_check_population`)
+        key = (signature, round_index, random_seed)
+        try:
+            return self._permutations[key]
+        except KeyError:
+            pass
+        if len(self._permutations) >= _PERMUTATION_CACHE_SIZE:
+            self._permutations.clear()
+        permutation = list(range(population_size))
+        # Seeding with a string is the same across processes, unlike `hash`
+        random.Random(f"{random_seed}:{signature}:{round_index}").shuffle(permutation)
+        self._permutations[key] = permutation
+        return permutation
+
+    def _save(self, signature: str, participant_index: int, offset: int, k: int, population_size: int) -> None:
+        """Queue an allocation to be written to `state_file`, expects `_lock` to be held."""
+        if self.state_file is None:
+            return
+        self._pending_lines.append(json.dumps({"signature": signature, "participant_index": participant_index, "offset": offset, "k": k,
+                                               "population_size": population_size}) + "\n")
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_pending_lines, daemon=True)
+            self._writer.start()
+
+    def _write_pending_lines(self) -> None:
+        while True:
+            self.flush()
+            with self._lock:
+                if not self._pending_lines:
+                    self._writer = None
+                    return
+
+    def _load(self) -> None:
+        assert self.state_file is not None
+        with open(self.state_file, "rb+") as f:
+            size = 0
+            line = b""
+            line_valid = True
+            for line_number, line in enumerate(f, 1):
+                size += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    allocation = json.loads(line)
+                    signature = allocation["signature"]
+                    participant_index, offset, k = allocation["participant_index"], allocation["offset"], allocation["k"]
+                    population_size = allocation.get("population_size", None)
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.warning(f"Skipping line {line_number} of {self.state_file}, it is not a valid allocation: {e}")
+                    line_valid = False
+                    continue
+                line_valid = True
+                self._offsets.setdefault(signature, {}).setdefault(participant_index, []).append(offset)
+                self._allocated_counts[signature] = max(self._allocated_counts.get(signature, 0), offset + k)
+                if population_size is not None:
+                    self._population_sizes[signature] = population_size
+            # The last line can be cut short (e.g., the process was killed while writing it), it
+            # would be merged with the next allocation appended to the file
+            if line and not line.endswith(b"\n"):
+                if line_valid:
+                    f.write(b"\n")
+                else:
+                    logger.warning(f"Removing the incomplete last line of {self.state_file}")
+                    f.truncate(size - len(line))
+        logger.info(f"Loaded the allocations of {len(self._allocated_counts)} cohort function call group(s) from {self.state_file}")
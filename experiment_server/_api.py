@@ -1,21 +1,34 @@
+from bisect import bisect_right, insort
+import heapq
+from collections import deque
+from copy import deepcopy
 from sys import stdout
-from typing import Any, Callable, Dict, Iterable, List, Union
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple, Union
 
 from loguru import logger
-from experiment_server._process_config import process_config_file
+from experiment_server._allocation import CohortAllocator
+from experiment_server._config_patch import diff_configs
+from experiment_server._metrics import CacheStats, Histogram
+from experiment_server._process_config import CompiledConfig, LazyParticipantBlocks, compile_config_file
 from pathlib import Path
 import json
+import threading
+import time
 
 from experiment_server.utils import ExperimentServerException, FileModifiedWatcher
 
 
 class ParticipantState:
+    __slots__ = ("participant_index", "_block_id", "config", "active")
+
     def __init__(self, config, participant_index, active):
         """
         Track a single participant's progress through an experiment configuration.
 
         Args:
             config (List[Dict[str, Any]]): Ordered list of block dictionaries for this participant.
+                Can be a `LazyParticipantBlocks`, in which case blocks are resolved when they are
+                first accessed.
             participant_index (int): 1-based participant index.
             active (bool): True if participant is currently between START and END (inclusive of blocks).
         """
@@ -39,33 +52,42 @@ class ParticipantState:
         Otherwise active = True.
         An assertion ensures consistency between block_id and the block's own 'config.block_id'.
         """
+        # `config` can be replaced by another thread on reload, use the same config throughout.
+        config = self.config
         if block_id < 0:
             self._block_id = -1
             self.active = False
-        elif block_id >= len(self.config):
-            self._block_id = len(self.config)
+        elif block_id >= len(config):
+            self._block_id = len(config)
             self.active = False
         else:
             self.active = True
             self._block_id = block_id
         if self.active:
-            assert self._block_id == self.config[self._block_id]["config"]["block_id"]
+            assert self._block_id == config[self._block_id]["config"]["block_id"]
 
     @property
     def block(self) -> Dict[str, Any]|None:
         """Return the current block dict or None if before START or after END."""
-        if self.block_id >= len(self.config) or self.block_id < 0:
+        config = self.config
+        block_id = self.block_id
+        if block_id >= len(config) or block_id < 0:
             return None
-        return self.config[self.block_id]
+        return config[block_id]
 
     @property
     def block_name(self) -> str:
         """Human-readable block position: 'START', 'END' or the current block name."""
-        if self.block_id >= len(self.config):
+        config = self.config
+        block_id = self.block_id
+        if block_id >= len(config):
             return "END"
-        if self.block_id < 0:
+        if block_id < 0:
             return "START"
-        return self.config[self.block_id]["name"]
+        if isinstance(config, LazyParticipantBlocks):
+            # Avoid resolving the block only to get the name
+            return config.block_names[block_id]
+        return config[block_id]["name"]
 
     def move_to_next_block(self) -> str:
         """Advance to the next block and return its block_name."""
@@ -74,26 +96,201 @@ class ParticipantState:
 
     def status_string(self) -> str:
         """Single-line status summary suitable for logs or simple UIs."""
-        name = self.block["name"] if self.block is not None else "N/A"
+        name = self.block_name if self.active else "N/A"
         return f'Participant index: {self.participant_index}    \nBlock: {self._block_id} / {len(self.config)}    \n Name: {name}'
 
 
+class _BlockIndex:
+    """
+    The participants at each block id, kept up to date as participants are added, moved or
+    get a new config, so the number of participants in each block (or at START/END) is known
+    without going through all participants.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # Block id -> indices of the participants at it. -1 is START and the number of blocks
+        # of a participant is END.
+        self._participants: Dict[int, Set[int]] = {}
+        self._block_name_counts: Dict[str, int] = {}
+        # Block id -> number of active participants at it
+        self._active_counts: Dict[int, int] = {}
+        self._active_count = 0
+        # Participant index -> the (block id, block name, active) it is counted at
+        self._positions: Dict[int, Tuple[int, str, bool]] = {}
+
+    def update(self, participant_state: ParticipantState) -> None:
+        """Count `participant_state` at its current block. Expects the participant's lock to be held."""
+        participant_index = participant_state.participant_index
+        position = (participant_state.block_id, participant_state.block_name, participant_state.active)
+        with self._lock:
+            old_position = self._positions.get(participant_index, None)
+            if old_position == position:
+                return
+            if old_position is not None:
+                self._remove(participant_index, old_position)
+            self._positions[participant_index] = position
+            block_id, block_name, active = position
+            self._participants.setdefault(block_id, set()).add(participant_index)
+            self._block_name_counts[block_name] = self._block_name_counts.get(block_name, 0) + 1
+            if active:
+                self._active_counts[block_id] = self._active_counts.get(block_id, 0) + 1
+                self._active_count += 1
+
+    def _remove(self, participant_index: int, position: Tuple[int, str, bool]) -> None:
+        block_id, block_name, active = position
+        participants = self._participants[block_id]
+        participants.discard(participant_index)
+        if not participants:
+            del self._participants[block_id]
+        self._block_name_counts[block_name] -= 1
+        if self._block_name_counts[block_name] == 0:
+            del self._block_name_counts[block_name]
+        if active:
+            self._active_counts[block_id] -= 1
+            if self._active_counts[block_id] == 0:
+                del self._active_counts[block_id]
+            self._active_count -= 1
+
+    def participants(self, block_id: int) -> List[int]:
+        """The indices of the participants at `block_id`, in ascending order."""
+        with self._lock:
+            return sorted(self._participants.get(block_id, ()))
+
+    def summary(self) -> Dict[str, Any]:
+        """The counts of participants, see `Experiment.get_summary`."""
+        with self._lock:
+            participants_count = len(self._positions)
+            not_started_count = len(self._participants.get(-1, ()))
+            return {
+                "participants": participants_count,
+                "not_started": not_started_count,
+                "active": self._active_count,
+                "finished": participants_count - not_started_count - self._active_count,
+                # Keys are strings, as in JSON
+                "block_ids": {str(block_id): count for block_id, count in sorted(self._active_counts.items())},
+                "block_names": dict(self._block_name_counts),
+            }
+
+
+# Number of locks shared by the participants for moving between blocks.
+_PARTICIPANT_LOCK_STRIPES = 64
+
+# Default number of participants in a page of `Experiment.list_participants`.
+DEFAULT_PARTICIPANTS_PAGE_SIZE = 100
+
+# Number of changes to the configs kept by `Experiment` to compute the deltas returned by
+# `Experiment.get_all_configs_delta` from.
+_CONFIG_CHANGES_LOG_SIZE = 256
+
+
+class _ConfigChange(NamedTuple):
+    """A change to the configs of the participants, made in `version` of the configs."""
+    version: int
+    # JSON Patch operations on the configs of each participant whose configs changed, None
+    # if all the participant's configs are to be returned (see `_config_patch`)
+    patches: Dict[int, Optional[List[Dict[str, Any]]]]
+
+
+def _all_blocks_resolved(blocks) -> bool:
+    """
+    True if all the blocks of a participant are resolved. The configs are only all returned
+    (and can be patched by a client) after resolving all the blocks.
+    """
+    return not isinstance(blocks, LazyParticipantBlocks) or blocks.resolved_count == len(blocks)
+
+
+def _resolved_configs(blocks, new_blocks) -> Optional[List[Dict[str, Any]]]:
+    """The configs of `new_blocks`, resolving them, if all of `blocks` are resolved, None otherwise."""
+    if not _all_blocks_resolved(blocks):
+        return None
+    return [block["config"] for block in new_blocks]
+
+
+def _config_patch(blocks, new_configs: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+    """
+    The JSON Patch operations from the configs of `blocks` to `new_configs` (see
+    `_resolved_configs`), None if `new_configs` is None or not all of `blocks` are resolved.
+    """
+    if new_configs is None or not _all_blocks_resolved(blocks):
+        return None
+    return diff_configs([block["config"] for block in blocks], new_configs)
+
+
 class Experiment:
-    """Load and manage an experiment configuration file and participant states."""
+    """
+    Load and manage an experiment configuration file and participant states.
+
+    The experiment can be used from more than one thread (e.g., the server, the UI and the
+    thread watching the config file). Moving a participant between blocks or replacing their
+    config is done while holding the participant's lock, one of `_PARTICIPANT_LOCK_STRIPES`
+    locks shared by the participants. On reload, the new configs are created before any of
+    them replaces a participant's config; reading a participant's state does not take a lock.
+    Loading a new config file replaces the participants' states, so changes to a participant
+    look up their state after taking the participant's lock.
+    """
 
-    def __init__(self, config_file: str, default_participant_index: int = 1) -> None:
+    def __init__(self, config_file: str, default_participant_index: int = 1, allocation_state_file: Union[str, Path, None] = None) -> None:
         """
         Initialize experiment state and watch the configuration file for changes.
 
         Args:
             config_file (str): Path to the TOML configuration file.
             default_participant_index (int): Default 1-based index used when none is provided.
+            allocation_state_file (Union[str, Path, None]): File the values allocated to the
+                participants by `choices` with `scope = "cohort"` are kept in (see `CohortAllocator`).
+                Defaults to the config file with the suffix `.allocations.jsonl`. Only created
+                when a value is allocated.
         """
         self.on_file_change_callback:list[Callable] = []
         self.on_config_change_callback:list[Callable] = []
+        # Called with the index of a participant that was added, moved or reset, or with None
+        # when all participants changed (e.g., the config was reloaded). Can be called from any
+        # thread that uses the experiment.
+        self.on_participant_change_callback:list[Callable[[Optional[int]], None]] = []
 
         self.watchdog = None
         self.global_state: Dict[int, ParticipantState] = {}
+        # Largest participant index added or reserved so far, new indices are allocated above it
+        # without scanning `global_state`. Guarded by `_participant_index_lock`.
+        self._max_participant_index = 0
+        # Reserved indices released by `release_participant_index`, allocated before new indices.
+        # A heap, with the indices that are still released in the set (an index can be added
+        # after being released). Guarded by `_participant_index_lock`.
+        self._released_participant_indices_heap: List[int] = []
+        self._released_participant_indices: Set[int] = set()
+        # Indices being added, their configs are resolved without holding the lock.
+        # Guarded by `_participant_index_lock`.
+        self._adding_participant_indices: Set[int] = set()
+        # The indices in `global_state` in ascending order, for paging through the participants.
+        # Guarded by `_participant_index_lock`.
+        self._participant_indices: List[int] = []
+        self._participant_index_lock = threading.Lock()
+        # Incremented each time the config of any participant changes (the config is loaded or
+        # reloaded, a participant is reset or their config is updated), can be used to invalidate
+        # anything derived from the participants' configs. Guarded by `_participant_index_lock`.
+        self.config_version = 0
+        # The last changes to the configs, to compute the deltas returned by `get_all_configs_delta`
+        # from. All the changes made after `_config_changes_start` (a version) are in the log.
+        # Guarded by `_participant_index_lock`.
+        self._config_changes: deque[_ConfigChange] = deque(maxlen=_CONFIG_CHANGES_LOG_SIZE)
+        self._config_changes_start = 0
+        self._participant_locks = tuple(threading.Lock() for _ in range(_PARTICIPANT_LOCK_STRIPES))
+        # Updated while holding the participant's lock after each move or change of config
+        self._block_index = _BlockIndex()
+
+        # Stats reported by the server's `/metrics`
+        self._stats_lock = threading.Lock()
+        self.blocks_completed_count = 0
+        self.reload_count = 0
+        self.reload_failure_count = 0
+        self.reload_durations = Histogram()
+        self.config_processing_durations = Histogram()
+        self.ordering_row_cache_stats = CacheStats()
+        self.block_cache_stats = CacheStats()
+        if allocation_state_file is None:
+            allocation_state_file = Path(config_file).with_suffix(".allocations.jsonl")
+        self.cohort_allocator = CohortAllocator(allocation_state_file)
+        self._compiled_config: CompiledConfig
         self.config_file = Path(config_file)
         self.default_participant_index = default_participant_index
 
@@ -105,9 +302,7 @@ class Experiment:
     def config_file(self, value):
         """Load a new config file. All participants states will be reset."""
         try:
-            for ppid in self.global_state.keys():
-                self.global_state[ppid] = ParticipantState(
-                    process_config_file(value, ppid), ppid, False)
+            self._publish_compiled_config(self._compile_config_file(value), reset_states=True)
 
             if self.watchdog is not None:
                 self.watchdog.end_watch()
@@ -142,26 +337,26 @@ class Experiment:
         assert value > 0, "Default participant index should be >0"
         self._default_participant_index = value
 
-        if self._default_participant_index not in self.global_state:
-            self.global_state[self._default_participant_index] = ParticipantState(
-                process_config_file(self._config_file, self._default_participant_index),
-                self._default_participant_index,
-                False,
-            )
+        self.add_participant_index(self._default_participant_index)
 
     def _config_file_modified_callback(self):
         """Reload configurations for all known participants when the file changes."""
         logger.info("Reloading config")
+        start = time.perf_counter()
+        with self._stats_lock:
+            self.reload_count += 1
         try:
-            for participantState in self.global_state.values():
-                config = process_config_file(self._config_file, participantState.participant_index)
-                participantState.config = config
+            self._publish_compiled_config(self._compile_config_file(self._config_file), reset_states=False)
+            with self._stats_lock:
+                self.reload_durations.observe(time.perf_counter() - start)
             for _callback in self.on_file_change_callback:
                 try:
                     _callback(True)
                 except Exception as _e:
                     logger.exception(f"Failed to call callback {_callback}: {_e}")
         except Exception as e:
+            with self._stats_lock:
+                self.reload_failure_count += 1
             for _callback in self.on_file_change_callback:
                 try:
                     _callback(False)
@@ -169,27 +364,268 @@ class Experiment:
                     logger.exception(f"Failed to call callback {_callback}: {_e}")
             logger.exception(f"Failed to load config {e}")
 
+    def _compile_config_file(self, config_file) -> CompiledConfig:
+        start = time.perf_counter()
+        compiled_config = compile_config_file(config_file)
+        with self._stats_lock:
+            self.config_processing_durations.observe(time.perf_counter() - start)
+        compiled_config.ordering_row_cache_stats = self.ordering_row_cache_stats
+        compiled_config.block_cache_stats = self.block_cache_stats
+        compiled_config.check_cohort_populations(self.cohort_allocator)
+        compiled_config.cohort_allocator = self.cohort_allocator
+        return compiled_config
+
+    def _publish_compiled_config(self, compiled_config: CompiledConfig, reset_states: bool) -> None:
+        """
+        Use `compiled_config` for all participants.
+
+        Participants added after this call get their config from `compiled_config`. The configs
+        of the existing participants are created first and then swapped in, each while holding
+        the participant's lock. If `reset_states` is True, the participants are also moved to START.
+        The changes to each participant's configs are logged (see `get_all_configs_delta`).
+        """
+        with self._participant_index_lock:
+            self._compiled_config = compiled_config
+            participant_indices = list(self.global_state.keys())
+
+        configs = {participant_index: compiled_config.resolve_lazy(participant_index)
+                   for participant_index in participant_indices}
+        # Compared with the current configs to log the changes, only the configs of the
+        # participants whose configs were all returned are resolved
+        new_configs = {participant_index: _resolved_configs(self.global_state[participant_index].config, config)
+                       for participant_index, config in configs.items()}
+
+        # The configs are swapped in and the version incremented together
+        with self._participant_index_lock:
+            patches = {}
+            for participant_index, config in configs.items():
+                # Replaced while holding the lock, moves look up the state after taking it
+                with self._participant_lock(participant_index):
+                    participant_state = self.global_state[participant_index]
+                    patch = _config_patch(participant_state.config, new_configs[participant_index])
+                    if reset_states:
+                        participant_state = self.global_state[participant_index] = ParticipantState(config, participant_index, False)
+                    else:
+                        participant_state.config = config
+                    # The block names can change
+                    self._block_index.update(participant_state)
+                if patch is None or len(patch) > 0:
+                    patches[participant_index] = patch
+            self._log_config_change(patches)
+        self._participant_changed(None)
+
+    def _log_config_change(self, patches: Dict[int, Optional[List[Dict[str, Any]]]]) -> None:
+        """
+        Increment `config_version` and log the changes to the configs of the participants in
+        `patches`. Expects `_participant_index_lock` to be held.
+        """
+        self.config_version += 1
+        if len(self._config_changes) == self._config_changes.maxlen:
+            # The oldest change is dropped
+            self._config_changes_start = self._config_changes[0].version
+        self._config_changes.append(_ConfigChange(self.config_version, patches))
+
+    def _participant_changed(self, participant_index: Optional[int]) -> None:
+        """Call the `on_participant_change_callback`s."""
+        for _callback in self.on_participant_change_callback:
+            try:
+                _callback(participant_index)
+            except Exception as _e:
+                logger.exception(f"Failed to call callback {_callback}: {_e}")
+
+    def _participant_lock(self, participant_index: int) -> threading.Lock:
+        """The lock to hold when moving the participant or replacing their config."""
+        return self._participant_locks[participant_index % _PARTICIPANT_LOCK_STRIPES]
+
     def get_next_participant(self) -> int:
-        """Allocate and return the next participant index (max existing + 1)."""
-        new_participant_index = max(self.global_state.keys()) + 1
-        self.add_participant_index(new_participant_index)
+        """
+        Allocate and return the next participant index: the smallest released index (see
+        `release_participant_index`) if any, the largest added or reserved index + 1 otherwise.
+        """
+        with self._participant_index_lock:
+            new_participant_index = self._max_participant_index + 1
+            heap = self._released_participant_indices_heap
+            while len(heap) > 0:
+                participant_index = heapq.heappop(heap)
+                if participant_index in self._released_participant_indices:
+                    self._released_participant_indices.discard(participant_index)
+                    new_participant_index = participant_index
+                    break
+            # Reserved before the lock is released
+            self._max_participant_index = max(self._max_participant_index, new_participant_index)
+            self._adding_participant_indices.add(new_participant_index)
+        try:
+            self._add_participant_state(new_participant_index)
+        except Exception:
+            # Allocated again by the next call
+            self.release_participant_index(new_participant_index)
+            raise
+        self._participant_changed(new_participant_index)
         return new_participant_index
 
+    def reserve_participant_indices(self, count: int) -> range:
+        """
+        Reserve `count` consecutive participant indices without adding them.
+
+        The reserved indices will not be returned by `get_next_participant`. They can be
+        handed out by a recruitment front-end and added later with `add_participant_index`.
+
+        Args:
+            count (int): Number of indices to reserve, should be >0.
+
+        Returns:
+            range: The reserved participant indices.
+        """
+        if count < 1:
+            raise ExperimentServerException(f"Number of participant indices to reserve should be >0, got {count}")
+        with self._participant_index_lock:
+            first_participant_index = self._max_participant_index + 1
+            self._max_participant_index += count
+        return range(first_participant_index, first_participant_index + count)
+
+    def release_participant_index(self, participant_index: int) -> bool:
+        """
+        Release a reserved participant index that will not be added, e.g., a recruitment front-end
+        returning the indices it did not use (see `reserve_participant_indices`). Released indices
+        are allocated by `get_next_participant` before new indices, smallest first.
+
+        Args:
+            participant_index (int): The reserved index to release.
+
+        Returns:
+            bool: False if the index was not reserved (i.e., it is larger than the largest added
+            or reserved index), was added or was already released.
+        """
+        with self._participant_index_lock:
+            if (participant_index < 1 or participant_index > self._max_participant_index
+                    or participant_index in self.global_state or participant_index in self._adding_participant_indices
+                    or participant_index in self._released_participant_indices):
+                return False
+            self._released_participant_indices.add(participant_index)
+            heapq.heappush(self._released_participant_indices_heap, participant_index)
+        return True
+
     def add_participant_index(self, participant_index) -> bool:
         """
         Add a participant by index.
 
-        Returns True if added, False if the index already exists.
+        Returns True if added, False if the index already exists (or is being added).
         """
         if participant_index in self.global_state:
             return False
-        self.global_state[participant_index] = ParticipantState(
-            process_config_file(self._config_file, participant_index),
-            participant_index,
-            False,
-        )
+        with self._participant_index_lock:
+            if participant_index in self.global_state or participant_index in self._adding_participant_indices:
+                return False
+            self._adding_participant_indices.add(participant_index)
+        self._add_participant_state(participant_index)
+        self._participant_changed(participant_index)
         return True
 
+    def _add_participant_state(self, participant_index: int) -> None:
+        """
+        Resolve the config of the participant and add their state, `participant_index` should be
+        in `_adding_participant_indices`. The config is resolved without holding
+        `_participant_index_lock`, the state is added and the high-water mark updated while holding it.
+        """
+        try:
+            while True:
+                with self._participant_index_lock:
+                    compiled_config = self._compiled_config
+                config = compiled_config.resolve_lazy(participant_index)
+                with self._participant_index_lock:
+                    # A reload only replaces the configs of the participants added before it
+                    if self._compiled_config is not compiled_config:
+                        continue
+                    participant_state = self.global_state[participant_index] = ParticipantState(config, participant_index, False)
+                    with self._participant_lock(participant_index):
+                        self._block_index.update(participant_state)
+                    if participant_index > self._max_participant_index:
+                        self._max_participant_index = participant_index
+                    # Left in the heap, skipped when popped
+                    self._released_participant_indices.discard(participant_index)
+                    self._adding_participant_indices.discard(participant_index)
+                    insort(self._participant_indices, participant_index)
+                    return
+        except Exception:
+            with self._participant_index_lock:
+                self._adding_participant_indices.discard(participant_index)
+            raise
+
+    def list_participants(self, after: Optional[int] = None, limit: int = DEFAULT_PARTICIPANTS_PAGE_SIZE,
+                          active: Optional[bool] = None, block_name: Optional[str] = None,
+                          first: Optional[int] = None, last: Optional[int] = None) -> Tuple[List[ParticipantState], Optional[int]]:
+        """
+        Return a page of the participants in ascending order of their index, optionally filtered.
+
+        Args:
+            after (Optional[int]): Cursor, only participants with an index larger than `after` are
+                returned. Use the cursor returned with the previous page to get the next page.
+            limit (int): Maximum number of participants returned, should be >0.
+            active (Optional[bool]): If given, only the participants that are (or are not) active.
+            block_name (Optional[str]): If given, only the participants in the block with this
+                name (or "START"/"END").
+            first (Optional[int]): If given, only participants with an index >= `first`.
+            last (Optional[int]): If given, only participants with an index <= `last`.
+
+        Returns:
+            Tuple[List[ParticipantState], Optional[int]]: The states of the participants and the
+            cursor of the next page, None if there are no more participants.
+        """
+        if limit < 1:
+            raise ExperimentServerException(f"`limit` should be >0, got {limit}")
+        if first is not None and (after is None or first > after):
+            after = first - 1
+
+        participant_states: List[ParticipantState] = []
+        while True:
+            # Participants can be inserted while paging, the indices are copied a chunk at a time
+            # while holding the lock and the next chunk is found from the last index seen
+            with self._participant_index_lock:
+                start = 0 if after is None else bisect_right(self._participant_indices, after)
+                participant_indices = self._participant_indices[start: start + limit + 1]
+                global_state = self.global_state
+            if len(participant_indices) == 0:
+                return participant_states, None
+            for participant_index in participant_indices:
+                if last is not None and participant_index > last:
+                    return participant_states, None
+                if len(participant_states) == limit:
+                    return participant_states, participant_states[-1].participant_index
+                participant_state = global_state[participant_index]
+                if active is not None and participant_state.active != active:
+                    continue
+                if block_name is not None and participant_state.block_name != block_name:
+                    continue
+                participant_states.append(participant_state)
+            after = participant_indices[-1]
+
+    def get_summary(self) -> Dict[str, Any]:
+        """
+        Return the number of participants in each block and state.
+
+        The counts are kept up to date as participants are added and moved, so this takes time
+        proportional to the number of blocks, not the number of participants.
+
+        Returns:
+            Dict[str, Any]: The number of `participants`, how many have `not_started` (at START),
+            are `active` and have `finished` (at END), the number of `blocks_completed` (see
+            `move_to_next`), and the number of active participants at each block id
+            (`block_ids`, with the block ids as strings) and at each block name (`block_names`,
+            including START and END).
+        """
+        summary = self._block_index.summary()
+        summary["blocks_completed"] = self.blocks_completed_count
+        return summary
+
+    def get_participants_in_block(self, block_id: int) -> List[int]:
+        """
+        Return the indices of the participants at `block_id`, in ascending order.
+
+        Args:
+            block_id (int): The block id, -1 for the participants at START.
+        """
+        return self._block_index.participants(block_id)
+
     def get_participant_state(self, participant_index) -> ParticipantState:
         """
         Return the ParticipantState for the given index.
@@ -212,24 +648,73 @@ class Experiment:
         """Advance the participant to the next block and return the new block_name."""
         if participant_index is None:
             participant_index = self.default_participant_index
-        return self.global_state[participant_index].move_to_next_block()
+        with self._participant_lock(participant_index):
+            # Looked up while holding the lock, the state can be replaced by a reload (see `_publish_compiled_config`)
+            participant_state = self.global_state[participant_index]
+            completed_block = participant_state.active
+            block_name = participant_state.move_to_next_block()
+            self._block_index.update(participant_state)
+        if completed_block:
+            with self._stats_lock:
+                self.blocks_completed_count += 1
+        self._participant_changed(participant_index)
+        return block_name
 
     def get_config(self, participant_index:int|None=None) -> Union[Dict[str, Any], None]:
         """
         Return the current block's config for the participant, or None if experiment not started or finished.
+
+        The config is a copy, the values shared with other participants' configs are not changed
+        by changing it.
         """
         if participant_index is None:
             participant_index = self.default_participant_index
         block = self.global_state[participant_index].block
         if block is None:
             return None
-        return block["config"]
+        return deepcopy(block["config"])
 
     def reset_participant(self, participant_index:int|None=None) -> bool:
-        """Reload the participant's configuration from file and replace their stored config."""
+        """Resolve the participant's configuration again from the loaded config file and replace their stored config."""
         if participant_index is None:
             participant_index = self.default_participant_index
-        self.global_state[participant_index].config = process_config_file(self._config_file, participant_index)
+        config = self._compiled_config.resolve_lazy(participant_index)
+        new_configs = _resolved_configs(self.global_state[participant_index].config, config)
+        with self._participant_index_lock, self._participant_lock(participant_index):
+            participant_state = self.global_state[participant_index]
+            patch = _config_patch(participant_state.config, new_configs)
+            participant_state.config = config
+            self._block_index.update(participant_state)
+            self._log_config_change({participant_index: patch})
+        self._participant_changed(participant_index)
+        return True
+
+    def update_config(self, values: Dict[str, Any], participant_index:int|None=None) -> bool:
+        """
+        Update the config of the participant's current block with `values`.
+
+        The config is replaced by an updated copy, so configs returned earlier (e.g., by
+        `get_all_configs`) do not change.
+
+        Args:
+            values (Dict[str, Any]): The keys of the config to set and their new values.
+            participant_index (int|None): The participant, the default participant if None.
+
+        Returns:
+            bool: False if the participant is not in a block (before START or after END).
+        """
+        if participant_index is None:
+            participant_index = self.default_participant_index
+        with self._participant_index_lock, self._participant_lock(participant_index):
+            participant_state = self.global_state[participant_index]
+            block = participant_state.block
+            if block is None:
+                return False
+            config = block["config"]
+            block["config"] = dict(config, **values)
+            self._log_config_change({participant_index: [dict(operation, path=f"/{participant_state.block_id}{operation['path']}")
+                                                         for operation in diff_configs(config, block["config"])]})
+        self._participant_changed(participant_index)
         return True
 
     def get_blocks_count(self, participant_index:int|None=None) -> int:
@@ -239,10 +724,54 @@ class Experiment:
         return len(self.global_state[participant_index].config)
 
     def get_all_configs(self, participant_index:int|None=None) -> List[dict]:
-        """Return the list of all block 'config' dicts for the participant in order."""
+        """Return copies of all the block 'config' dicts for the participant in order (see `get_config`)."""
+        if participant_index is None:
+            participant_index = self.default_participant_index
+        return deepcopy([c["config"] for c in self.global_state[participant_index].config])
+
+    def get_all_configs_delta(self, since: int, participant_index:int|None=None) -> Dict[str, Any]:
+        """
+        Return the participant's configs, as a delta from the configs returned by an earlier call.
+
+        The last `_CONFIG_CHANGES_LOG_SIZE` changes to the configs of all participants are kept,
+        the changes made by `update_config` as JSON Patch operations (see `diff_configs`). If
+        all the changes to the participant's configs since `since` are kept, only those changes
+        are returned and no block is resolved. A reload of the config file or a reset of the
+        participant is logged as the changes between the configs before and after it. If the
+        changes since `since` are no longer kept, all the configs are returned.
+
+        Args:
+            since (int): The `version` returned by an earlier call, e.g., 0 to get all the configs.
+            participant_index (int|None): The participant, the default participant if None.
+
+        Returns:
+            Dict[str, Any]: The current `version` and either the `patch` to apply to the configs
+            returned with `since`, or all the `configs` (as returned by `get_all_configs`).
+        """
         if participant_index is None:
             participant_index = self.default_participant_index
-        return [c["config"] for c in self.global_state[participant_index].config]
+        # The configs are changed and the version incremented while holding the lock
+        with self._participant_index_lock:
+            participant_state = self.global_state[participant_index]
+            version = self.config_version
+            patch: Optional[List[Dict[str, Any]]] = None
+            # Version 0 is before the config file was loaded, all the configs are returned
+            if 0 < since and self._config_changes_start <= since <= version:
+                patch = []
+                for change in self._config_changes:
+                    if change.version <= since or participant_index not in change.patches:
+                        continue
+                    change_patch = change.patches[participant_index]
+                    if change_patch is None:
+                        patch = None
+                        break
+                    patch.extend(change_patch)
+            if patch is None:
+                configs = [block["config"] for block in participant_state.config]
+
+        if patch is None:
+            return {"version": version, "configs": deepcopy(configs)}
+        return {"version": version, "since": since, "patch": patch}
 
     def move_to_block(self, block_id: int, participant_index:int|None=None) -> str:
         """
@@ -253,8 +782,13 @@ class Experiment:
         assert isinstance(block_id, int), "`block` should be an int"
         if participant_index is None:
             participant_index = self.default_participant_index
-        self.global_state[participant_index].block_id = block_id
-        return self.global_state[participant_index].block_name
+        with self._participant_lock(participant_index):
+            participant_state = self.global_state[participant_index]
+            participant_state.block_id = block_id
+            block_name = participant_state.block_name
+            self._block_index.update(participant_state)
+        self._participant_changed(participant_index)
+        return block_name
 
     def move_all_to_block(self, block_id: int) -> str:
         """
@@ -263,9 +797,14 @@ class Experiment:
         Returns the block_name of the first participant after the move.
         """
         assert isinstance(block_id, int), "`block` should be an int"
-        for participantState in self.global_state.values():
-            participantState.block_id = block_id
-        return list(self.global_state.values())[0].block_name
+        participant_indices = list(self.global_state.keys())
+        for participant_index in participant_indices:
+            with self._participant_lock(participant_index):
+                participantState = self.global_state[participant_index]
+                participantState.block_id = block_id
+                self._block_index.update(participantState)
+        self._participant_changed(None)
+        return self.global_state[participant_indices[0]].block_name
 
 
 def _generate_config_json(config_file: Union[str, Path], participant_indices: Iterable[int], out_dir: Union[str, Path, None]=None) -> None:
@@ -289,8 +828,9 @@ def _generate_config_json(config_file: Union[str, Path], participant_indices: It
             raise ExperimentServerException(f"`out_file_location` should be a directory. Got {out_dir}")
 
     out_files = []
+    compiled_config = compile_config_file(config_file)
     for participant_index in participant_indices:
-        config = process_config_file(config_file, participant_index, suppress_message=True)
+        config = compiled_config.resolve(participant_index, suppress_message=True)
         if out_dir is not None:
             out_file = Path(out_dir) / f"{Path(config_file).stem}-participant_{participant_index}.json"
             out_files.append(out_file)
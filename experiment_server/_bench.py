@@ -0,0 +1,138 @@
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+from loguru import logger
+from tabulate import tabulate
+
+from experiment_server import __version__
+from experiment_server._client import Client
+from experiment_server._server import server_process
+from experiment_server.utils import ExperimentServerException
+
+
+def _bench(config_file: Union[str, Path], participants: int = 10, trials: Optional[int] = None,
+           host: str = "127.0.0.1", port: Union[str, int] = "5000", startup_timeout: float = 10) -> Dict[str, Any]:
+    """
+    Launch the server with `config_file` in a new process and simulate `participants`
+    participants going through the experiment concurrently.
+
+    Each participant is added with `new-participant`, then for each block calls `move-to-next`,
+    `config` and `active`, which is what an experiment application would do for each block/trial.
+
+    Args:
+        config_file: Path to the TOML configuration file.
+        participants: Number of participants simulated concurrently.
+        trials: Number of blocks each participant goes through. All blocks if None.
+        host: Host to launch the server on.
+        port: Port to launch the server on.
+        startup_timeout: Seconds to wait for the server to start.
+
+    Returns:
+        A dict with the number of requests, the throughput (requests/second) and, for each
+        endpoint, the number of requests, failed requests and latency percentiles in milliseconds.
+    """
+    process = server_process(config_file=config_file, default_participant_index=1, host=host, port=port)
+    process.start()
+    try:
+        _wait_for_server(Client(host, port), process, startup_timeout)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=participants) as executor:
+            samples = list(executor.map(lambda _: _simulate_participant(Client(host, port), trials), range(participants)))
+        duration = time.perf_counter() - start
+    finally:
+        try:
+            Client(host, port).shutdown()
+        except requests.ConnectionError:
+            pass
+        process.join(5)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    latencies: Dict[str, List[float]] = {}
+    errors: Dict[str, int] = {}
+    for participant_samples in samples:
+        for endpoint, success, latency in participant_samples:
+            latencies.setdefault(endpoint, []).append(latency)
+            errors[endpoint] = errors.get(endpoint, 0) + (not success)
+
+    requests_count = sum(len(l) for l in latencies.values())
+    return {
+        "version": __version__,
+        "config_file": str(config_file),
+        "participants": participants,
+        "trials": trials,
+        "duration_s": duration,
+        "requests": requests_count,
+        "throughput_rps": requests_count / duration,
+        "endpoints": {endpoint: dict(count=len(l), errors=errors[endpoint], **_latency_summary(l))
+                      for endpoint, l in latencies.items()},
+    }
+
+
+def _wait_for_server(client: Client, process, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not process.is_alive():
+            raise ExperimentServerException("Server process exited before it started serving requests.")
+        try:
+            client.server_is_active()
+            return
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    raise ExperimentServerException(f"Server did not start within {timeout} seconds.")
+
+
+def _simulate_participant(client: Client, trials: Optional[int]) -> List[Tuple[str, bool, float]]:
+    """Go through the experiment as one participant. Returns (endpoint, success, latency in seconds) for each request."""
+    samples: List[Tuple[str, bool, float]] = []
+
+    def _timed(endpoint: str, func: Callable, *args) -> Tuple[bool, Any]:
+        start = time.perf_counter()
+        success, data = func(*args)
+        samples.append((endpoint, success, time.perf_counter() - start))
+        return success, data
+
+    success, participant_index = _timed("PUT /api/new-participant", client.new_participant)
+    if not success:
+        logger.error(f"Failed to add participant: {participant_index}")
+        return samples
+    success, blocks_count = _timed("GET /api/blocks-count", client.get_blocks_count, participant_index)
+    if not success:
+        return samples
+
+    for _ in range(blocks_count if trials is None else min(trials, blocks_count)):
+        _timed("POST /api/move-to-next", client.move_to_next, participant_index)
+        _timed("GET /api/config", client.get_config, participant_index)
+        _timed("GET /api/active", client.server_is_active, participant_index)
+    return samples
+
+
+def _latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Latency percentiles (in milliseconds) of `latencies` (in seconds)."""
+    latencies_ms = [l * 1000 for l in latencies]
+    if len(latencies_ms) > 1:
+        quantiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+        p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+    else:
+        p50 = p95 = p99 = latencies_ms[0]
+    return {
+        "mean_ms": statistics.fmean(latencies_ms),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+        "max_ms": max(latencies_ms),
+    }
+
+
+def _format_bench_results(results: Dict[str, Any]) -> str:
+    """Results of `_bench` as a table."""
+    columns = ["count", "errors", "mean_ms", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    rows = [[endpoint] + [summary[c] for c in columns] for endpoint, summary in results["endpoints"].items()]
+    return (f"participants: {results['participants']}    requests: {results['requests']}    "
+            f"duration: {results['duration_s']:.2f}s    throughput: {results['throughput_rps']:.1f} requests/s\n"
+            + tabulate(rows, headers=["endpoint"] + columns, floatfmt=".2f"))
@@ -1,7 +1,8 @@
-import json
-from typing import Tuple, Union
+from typing import Optional, Tuple, Union
+from urllib.parse import urlencode
 import requests
 
+from experiment_server import _wire_format
 from experiment_server.utils import ExperimentServerException
 
 
@@ -20,40 +21,64 @@ class Client:
       On success data is the parsed JSON response (or "" if empty). On failure
       success is False and data contains an error message.
 
+    Wire format
+
+    - The responses are requested as MessagePack or CBOR when the `msgpack`
+      (or `cbor2`) package is installed, which is faster to parse than JSON
+      for large configs, and as JSON otherwise. Set `wire_format` to request
+      a given format. The parsed responses are the same as with JSON.
+
     Main methods
 
     - move_to_next(participant_index=None)
     - get_config(participant_index=None)
     - server_is_active(participant_index=None)
     - get_blocks_count(participant_index=None)
-    - get_all_configs(participant_index=None)
+    - get_all_configs(participant_index=None, since=None)
     - move_to_block(block_id, participant_index=None)
     - new_participant()
     - add_participant(participant_index)
+    - reserve_participants(count)
+    - release_participant(participant_index)
+    - list_participants(after=None, limit=None, active=None, block_name=None, first=None, last=None)
+    - get_summary()
     - shutdown()
 
     Parameters:
         server_host (str): Hostname or IP of the server (default "127.0.0.1").
         server_port (str|int): Port of the server (default "5000").
+        wire_format (str): "auto" (default) to use the first installed of
+            "msgpack" and "cbor" and JSON if neither is installed, or one of
+            "json", "msgpack" and "cbor". Raises ExperimentServerException if
+            the package of the given wire format is not installed.
 
     """
-    def __init__(self, server_host:str ="127.0.0.1", server_port:Union[str, int]="5000") -> None:
+    def __init__(self, server_host:str ="127.0.0.1", server_port:Union[str, int]="5000", wire_format:str="auto") -> None:
         self._server_url = f"http://{server_host}:{server_port}"
+        if wire_format == "auto":
+            available_wire_formats = _wire_format.available_wire_formats()
+            wire_format = available_wire_formats[0] if available_wire_formats else "json"
+        self.wire_format = wire_format
+        if wire_format == "json":
+            self._headers = {}
+        else:
+            # Servers without support for the wire format respond with JSON
+            self._headers = {"Accept": f"{_wire_format.media_type(wire_format)}, {_wire_format.JSON_MEDIA_TYPE};q=0.5"}
 
     def _request(self, end_point:str, verb:str) -> Tuple[bool, dict]:
         url = self._server_url + f"/api/{end_point}"
         if verb == "GET":
-            r = requests.get(url)
+            r = requests.get(url, headers=self._headers)
         elif verb == "POST":
-            r = requests.post(url)
+            r = requests.post(url, headers=self._headers)
         elif verb == "PUT":
-            r = requests.put(url)
+            r = requests.put(url, headers=self._headers)
         else:
             raise ExperimentServerException("huh?")
 
         if r.status_code != 200:
             return False, {"message": f"status {r.status_code} with text: {r.text}"}
-        return True, json.loads(r.text) if len(r.text) > 0 else ""
+        return True, _wire_format.loads(r.headers.get("Content-Type", ""), r.content) if len(r.content) > 0 else ""
     
     def _get(self, end_point:str) -> Tuple[bool, dict]:
         return self._request(end_point, "GET")
@@ -95,12 +120,21 @@ class Client:
         url = _process_participant_index("blocks-count", participant_index)
         return self._get(url)
 
-    def get_all_configs(self, participant_index:int|None=None) -> Tuple[bool, dict]:
+    def get_all_configs(self, participant_index:int|None=None, since:int|None=None) -> Tuple[bool, dict]:
         """Returns all the configs as a list for the `participant_index`,
         if `participant_index` is not provided, returns the configs for
         the default participant. This is akin having all the results
-        from calling `config` for each block in one list."""
+        from calling `config` for each block in one list.
+
+        If `since` is given (0 for the first call), returns a dict with
+        the current `version` of the configs, and either all the
+        `configs`, or the `patch` (JSON Patch operations) to apply to
+        the configs returned with the `version` `since`, see
+        `experiment_server._config_patch.apply_patch`."""
         url = _process_participant_index("all-configs", participant_index)
+        if since is not None:
+            assert isinstance(since, int), "`since` should be a int"
+            url += f"?{urlencode({'since': since})}"
         return self._get(url)
 
     def move_to_block(self, block_id:int, participant_index:int|None=None) -> Tuple[bool, dict]:
@@ -117,8 +151,9 @@ class Client:
 
     def new_participant(self) -> Tuple[bool, dict]:
         """Adds a new participant and returns the new
-        participant_index. The new participant_index will be the largest
-        current participant_index +1."""
+        participant_index. The new participant_index will be the smallest
+        released participant_index (see `release_participant`), or the
+        largest current or reserved participant_index +1."""
         return self._put("new-participant");
 
     def add_participant(self, participant_index:int) -> Tuple[bool, dict]:
@@ -128,6 +163,48 @@ class Client:
         url = _process_participant_index("add-participant", participant_index)
         return self._put(url);
 
+    def reserve_participants(self, count:int) -> Tuple[bool, dict]:
+        """Reserve `count` consecutive participant indices without adding
+        them. Returns a dict with the `first` and `last` reserved
+        index. The reserved indices will not be returned by
+        `new_participant`, they can be added with `add_participant`."""
+        assert isinstance(count, int), "`count` should be a int"
+        return self._put(f"reserve-participants/{count}")
+
+    def release_participant(self, participant_index:int) -> Tuple[bool, dict]:
+        """Release a reserved `participant_index` that will not be added.
+        Released indices are returned by `new_participant` before new
+        indices. Fails if the index was not reserved, was added or was
+        already released."""
+        assert participant_index is not None
+        url = _process_participant_index("release-participant", participant_index)
+        return self._put(url);
+
+    def list_participants(self, after:Optional[int]=None, limit:Optional[int]=None, active:Optional[bool]=None,
+                          block_name:Optional[str]=None, first:Optional[int]=None, last:Optional[int]=None) -> Tuple[bool, dict]:
+        """Return a page of the participants in ascending order of
+        their index, optionally filtered by whether they are `active`,
+        the `block_name` they are in and the range of indices
+        [`first`, `last`]. Returns a dict with the `participants` (each
+        with its `participant_index`, `block_id`, `block_name` and
+        `active`) and the cursor of the `next` page, which is passed as
+        `after` to get the next page (None if there are no more
+        participants). `limit` is the size of the page (default 100,
+        at most 1000)."""
+        query = {"after": after, "limit": limit, "block": block_name, "first": first, "last": last,
+                 "active": None if active is None else str(active).lower()}
+        query = {k: v for k, v in query.items() if v is not None}
+        return self._get("participants" + (f"?{urlencode(query)}" if query else ""))
+
+    def get_summary(self) -> Tuple[bool, dict]:
+        """Return the number of participants in each block and
+        state: the number of `participants`, how many have
+        `not_started`, are `active` and have `finished`, the number of
+        `blocks_completed`, and the number of active participants at
+        each block id (`block_ids`) and at each block name
+        (`block_names`, including START and END)."""
+        return self._get("summary")
+
     def shutdown(self) -> Tuple[bool, dict]:
         """Shuts down the server."""
         return self._post("shutdown")
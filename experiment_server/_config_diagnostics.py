@@ -0,0 +1,237 @@
+"""Diagnostics of a config while it is being edited, from its (incremental) tree-sitter parse tree."""
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import toml
+from tree_sitter import Node, Tree
+
+from experiment_server._process_config import _compile_function_sites, _resolve_variables
+from experiment_server.utils import ExperimentServerConfigurationException
+
+# A location in the document as (row, byte column), same as the points of tree-sitter and
+# the highlights of Textual's `TextArea`.
+Point = Tuple[int, int]
+
+_TABLE_NODE_TYPES = ("table", "table_array_element")
+_KEY_NODE_TYPES = ("bare_key", "quoted_key", "dotted_key")
+
+
+class Diagnostic(NamedTuple):
+    """An error in the range [`start`, `end`) of the document."""
+    start: Point
+    end: Point
+    message: str
+
+
+class _SectionResult:
+    """The diagnostics of a section, relative to the start of the section, and what the
+    checks across sections need: the blocks defined and the block names referred to, which
+    are not known if the section could not be loaded."""
+    __slots__ = ("diagnostics", "block_names", "referred_block_names", "loaded")
+
+    def __init__(self, diagnostics: List[Diagnostic], block_names: List[str], referred_block_names: List[str], loaded: bool) -> None:
+        self.diagnostics = diagnostics
+        self.block_names = block_names
+        self.referred_block_names = referred_block_names
+        self.loaded = loaded
+
+
+class ConfigDiagnostics:
+    """
+    Checks a TOML config as it is edited, section by section.
+
+    A section is a table (e.g., `[configuration]` or `[[blocks]]`) along with the tables
+    nested under it that follow it (e.g., `[blocks.config]`). Each section is checked for
+    syntax errors, and if there are none, loaded and checked on its own (e.g., a block has
+    a `name` and a `config`, function calls are valid, variables do not refer to each other
+    in a cycle). The results are kept by the text of the section, so after an edit only the
+    sections whose text changed are checked again. Checks across sections (duplicate block
+    names and block names in `order`, `init_blocks`, `final_blocks` or `extends` that do not
+    exist) only use what was kept for each section.
+
+    This does not replace `verify_config`: values from variables, `extends` and the orders of
+    the participants are only checked when the whole config is compiled.
+    """
+    def __init__(self) -> None:
+        self._section_results: Dict[bytes, _SectionResult] = {}
+        self.checked_sections_count = 0
+
+    def update(self, tree: Tree, source: bytes) -> List[Diagnostic]:
+        """
+        Return the diagnostics of the document `source`, parsed as `tree`.
+
+        Args:
+            tree: The tree-sitter tree of `source`, e.g., the tree Textual's `TextArea` updates incrementally on each edit.
+            source: The text of the document, encoded as UTF-8.
+
+        Returns:
+            The diagnostics, in the order of the sections.
+        """
+        section_results: Dict[bytes, _SectionResult] = {}
+        sections = []
+        for nodes in _sections(tree.root_node, source):
+            text = source[nodes[0].start_byte:nodes[-1].end_byte]
+            result = section_results.get(text, None) or self._section_results.get(text, None)
+            if result is None:
+                result = _check_section(nodes, text)
+                self.checked_sections_count += 1
+            section_results[text] = result
+            sections.append((nodes[0], result))
+        # Only the results of the current sections are kept
+        self._section_results = section_results
+
+        diagnostics: List[Diagnostic] = []
+        for node, result in sections:
+            for diagnostic in result.diagnostics:
+                diagnostics.append(Diagnostic(_add(diagnostic.start, node.start_point), _add(diagnostic.end, node.start_point), diagnostic.message))
+        diagnostics.extend(_check_across_sections(sections))
+        return diagnostics
+
+
+def _sections(root: Node, source: bytes) -> List[List[Node]]:
+    """The top level nodes of the document grouped into sections. The pairs before the first table are a section."""
+    sections: List[List[Node]] = []
+    section_key: Optional[str] = None
+    for node in root.children:
+        if node.type == "comment":
+            continue
+        if node.type in _TABLE_NODE_TYPES:
+            key = _table_key(node, source)
+            if sections and section_key is not None and key is not None and key.startswith(section_key + "."):
+                sections[-1].append(node)
+                continue
+            section_key = key
+            sections.append([node])
+        elif sections and section_key is None:
+            sections[-1].append(node)
+        else:
+            sections.append([node])
+    return sections
+
+
+def _table_key(node: Node, source: bytes) -> Optional[str]:
+    for child in node.children:
+        if child.type in _KEY_NODE_TYPES:
+            return "".join(source[child.start_byte:child.end_byte].decode().split())
+    return None
+
+
+def _check_section(nodes: List[Node], text: bytes) -> _SectionResult:
+    start = nodes[0]
+    # Errors found after loading the section are shown on its table header
+    header = (tuple(start.start_point), _header_end(start) or tuple(start.end_point))
+
+    diagnostics: List[Diagnostic] = []
+    for node in nodes:
+        _syntax_errors(node, diagnostics)
+    if diagnostics:
+        return _SectionResult([_relative(d, start.start_point) for d in diagnostics], [], [], False)
+
+    def _error(message: str) -> None:
+        diagnostics.append(Diagnostic(header[0], header[1], message))
+
+    block_names: List[str] = []
+    referred_block_names: List[str] = []
+    try:
+        section = toml.loads(text.decode())
+    except Exception as e:
+        _error(f"Invalid TOML: {e}")
+        return _SectionResult([_relative(d, start.start_point) for d in diagnostics], [], [], False)
+
+    blocks = section.get("blocks", [])
+    if not isinstance(blocks, list):
+        _error("`blocks` is not a list.")
+        blocks = []
+    for block in blocks:
+        if "name" not in block:
+            _error("Block missing `name`.")
+        else:
+            block_names.append(str(block["name"]))
+        if "extends" in block:
+            referred_block_names.append(str(block["extends"]))
+        if "config" not in block and "extends" not in block:
+            _error("Block missing `config`.")
+        elif isinstance(block.get("config", None), dict):
+            try:
+                _compile_function_sites(block["config"], block.get("name", None))
+            except ExperimentServerConfigurationException as e:
+                _error(str(e))
+
+    configuration = section.get("configuration", {})
+    if isinstance(configuration, dict):
+        for key in ("order", "init_blocks", "final_blocks"):
+            referred_block_names.extend(_strings(configuration.get(key, [])))
+        variables = configuration.get("variables", {})
+        if isinstance(variables, dict):
+            try:
+                _resolve_variables(variables)
+            except ExperimentServerConfigurationException as e:
+                _error(str(e))
+    return _SectionResult([_relative(d, start.start_point) for d in diagnostics], block_names, referred_block_names, True)
+
+
+def _header_end(node: Node) -> Optional[Point]:
+    """End of the `[...]`/`[[...]]` of a table node."""
+    if node.type not in _TABLE_NODE_TYPES:
+        return None
+    for child in node.children:
+        if child.type in ("]", "]]"):
+            return tuple(child.end_point)
+    return None
+
+
+def _syntax_errors(node: Node, diagnostics: List[Diagnostic]) -> None:
+    if not node.has_error:
+        return
+    if node.is_missing:
+        diagnostics.append(Diagnostic(tuple(node.start_point), tuple(node.end_point), f"Missing `{node.type}`"))
+        return
+    if node.type == "ERROR":
+        diagnostics.append(Diagnostic(tuple(node.start_point), tuple(node.end_point), "Syntax error"))
+        return
+    for child in node.children:
+        _syntax_errors(child, diagnostics)
+
+
+def _check_across_sections(sections: List[Tuple[Node, _SectionResult]]) -> List[Diagnostic]:
+    diagnostics = []
+    block_names = set()
+    for node, result in sections:
+        for name in result.block_names:
+            if name in block_names:
+                diagnostics.append(Diagnostic(tuple(node.start_point), _header_end(node) or tuple(node.end_point), f"Duplicate block name: {name}"))
+            block_names.add(name)
+    # The blocks of a section that could not be loaded are not known
+    if not all(result.loaded for _, result in sections):
+        return diagnostics
+    for node, result in sections:
+        for name in result.referred_block_names:
+            if name not in block_names:
+                diagnostics.append(Diagnostic(tuple(node.start_point), _header_end(node) or tuple(node.end_point), f"Block `{name}` does not exist."))
+    return diagnostics
+
+
+def _strings(value: Any) -> List[str]:
+    """All the strings in `value`, at any depth of arrays and tables."""
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list):
+        return [s for v in value for s in _strings(v)]
+    if isinstance(value, dict):
+        return [s for v in value.values() for s in _strings(v)]
+    return []
+
+
+def _relative(diagnostic: Diagnostic, origin: Point) -> Diagnostic:
+    return Diagnostic(_subtract(diagnostic.start, origin), _subtract(diagnostic.end, origin), diagnostic.message)
+
+
+def _subtract(point: Point, origin: Point) -> Point:
+    if point[0] == origin[0]:
+        return (0, point[1] - origin[1])
+    return (point[0] - origin[0], point[1])
+
+
+def _add(point: Point, origin: Point) -> Point:
+    if point[0] == 0:
+        return (origin[0], point[1] + origin[1])
+    return (point[0] + origin[0], point[1])
@@ -0,0 +1,98 @@
+"""Deltas between the configs of a participant as JSON Patch (RFC 6902) operations."""
+from typing import Any, Dict, List
+
+
+def diff_configs(old: Any, new: Any) -> List[Dict[str, Any]]:
+    """
+    The JSON Patch operations (`add`, `remove` and `replace`) that turn `old` into `new`.
+
+    Tables are compared key by key and arrays element by element, so a change in one value of
+    a block is a single operation. Values that are the same object (e.g., blocks shared between
+    the versions of the configs) are not compared. An array whose length changed is replaced,
+    except for the outermost array (the list of blocks), where the blocks are added/removed at
+    the end.
+
+    Args:
+        old: The configs the client has, e.g., the result of `Experiment.get_all_configs`.
+        new: The current configs.
+
+    Returns:
+        List[Dict[str, Any]]: The operations, with the `path` of each as a JSON Pointer.
+    """
+    patch: List[Dict[str, Any]] = []
+    if isinstance(old, list) and isinstance(new, list) and len(old) != len(new):
+        for index in range(min(len(old), len(new))):
+            _diff(old[index], new[index], f"/{index}", patch)
+        for index in range(len(old), len(new)):
+            patch.append({"op": "add", "path": f"/{index}", "value": new[index]})
+        # From the end, so the indices of the blocks not removed yet do not change
+        for index in range(len(old) - 1, len(new) - 1, -1):
+            patch.append({"op": "remove", "path": f"/{index}"})
+        return patch
+    _diff(old, new, "", patch)
+    return patch
+
+
+def _diff(old: Any, new: Any, path: str, patch: List[Dict[str, Any]]) -> None:
+    if old is new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key, value in old.items():
+            if key not in new:
+                patch.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+            else:
+                _diff(value, new[key], f"{path}/{_escape(key)}", patch)
+        for key, value in new.items():
+            if key not in old:
+                patch.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": value})
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for index, (old_value, new_value) in enumerate(zip(old, new)):
+            _diff(old_value, new_value, f"{path}/{index}", patch)
+    # `1 == 1.0 == True` in python, but they are different values in JSON
+    elif type(old) is not type(new) or old != new:
+        patch.append({"op": "replace", "path": path, "value": new})
+
+
+def apply_patch(document: Any, patch: List[Dict[str, Any]]) -> Any:
+    """
+    Apply the operations returned by `diff_configs` to `document`.
+
+    `document` is not modified: the tables and arrays along the path of each operation are
+    copied, the rest is shared with `document`.
+
+    Args:
+        document: The configs the patch was computed from.
+        patch: The operations.
+
+    Returns:
+        The patched document.
+    """
+    for operation in patch:
+        keys = [_unescape(key) for key in operation["path"].split("/")[1:]]
+        if not keys:
+            document = operation["value"]
+            continue
+        document = _apply(document, keys, operation)
+    return document
+
+
+def _apply(container: Any, keys: List[str], operation: Dict[str, Any]) -> Any:
+    container = list(container) if isinstance(container, list) else dict(container)
+    key: Any = int(keys[0]) if isinstance(container, list) else keys[0]
+    if len(keys) > 1:
+        container[key] = _apply(container[key], keys[1:], operation)
+    elif operation["op"] == "remove":
+        del container[key]
+    elif operation["op"] == "add" and isinstance(container, list):
+        container.insert(key, operation["value"])
+    else:
+        container[key] = operation["value"]
+    return container
+
+
+def _escape(key: Any) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(key: str) -> str:
+    return key.replace("~1", "/").replace("~0", "~")
@@ -0,0 +1,61 @@
+"""Logging on the hot paths: loading participants' configs and serving requests."""
+import itertools
+import sys
+from typing import Optional
+
+from loguru import logger
+
+
+# Messages are only formatted if a handler accepts the level, the arguments are callables
+# evaluated at that point. `depth=1` attributes the record to the caller.
+_lazy_logger = logger.opt(lazy=True, depth=1)
+
+_hot_path_log_level = "INFO"
+_request_log_sample_every = 1
+_request_log_counter = itertools.count()
+# Id of the stderr handler added by `configure_logging`
+_stderr_handler_id: Optional[int] = None
+
+
+def configure_logging(hot_path_log_level: str = "INFO", request_log_sample_rate: float = 1.0, enqueue: bool = True) -> None:
+    """
+    Configure the logs written while loading configs and serving requests.
+
+    Args:
+        hot_path_log_level: Level of the logs of resolved configs and of each request (e.g. "DEBUG"
+            to hide them when the handlers only accept "INFO" and above).
+        request_log_sample_rate: Fraction of the per-request logs to write, in (0, 1]. e.g., 0.1
+            writes the log of every 10th request.
+        enqueue: If True, replaces loguru's default stderr handler with a handler writing to stderr
+            from a background thread, so that writing the logs never blocks the caller. Handlers
+            added by the application are kept. If False, the handler added by an earlier call
+            (if any) is replaced with one writing from the caller's thread.
+    """
+    global _hot_path_log_level, _request_log_sample_every, _stderr_handler_id
+    if not 0 < request_log_sample_rate <= 1:
+        raise ValueError(f"`request_log_sample_rate` should be in (0, 1], got {request_log_sample_rate}")
+    # Raises ValueError for unknown levels
+    logger.level(hot_path_log_level)
+    _hot_path_log_level = hot_path_log_level
+    _request_log_sample_every = max(1, round(1 / request_log_sample_rate))
+
+    if enqueue or _stderr_handler_id is not None:
+        # Only loguru's default handler (id 0) or the handler added here is replaced
+        try:
+            logger.remove(0 if _stderr_handler_id is None else _stderr_handler_id)
+        except ValueError:
+            # Removed by the application, which handles the logs itself
+            _stderr_handler_id = None
+            return
+        _stderr_handler_id = logger.add(sys.stderr, enqueue=enqueue)
+
+
+def log_hot_path(message: str, *args) -> None:
+    """Log `message` at the hot path log level. `args` are callables returning the values to format `message` with."""
+    _lazy_logger.log(_hot_path_log_level, message, *args)
+
+
+def log_request(message: str, *args) -> None:
+    """Same as `log_hot_path`, but only a sample of the calls are logged (see `configure_logging`)."""
+    if next(_request_log_counter) % _request_log_sample_every == 0:
+        _lazy_logger.log(_hot_path_log_level, message, *args)
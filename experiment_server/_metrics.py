@@ -0,0 +1,115 @@
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from experiment_server._api import Experiment
+
+
+# Upper bounds (seconds) of the histogram buckets, the last bucket (+Inf) is implicit.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts of observed values in buckets, along with the sum and count of the values."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class CacheStats:
+    """Number of hits and misses of a cache."""
+    __slots__ = ("hits", "misses")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+class ServerMetrics:
+    """
+    Metrics of a server serving `experiment`, exposed in the Prometheus text format by `render`.
+
+    Requests are recorded with `observe_request`, which only updates the histogram of the
+    request's (handler, method, action, status). Everything else is read from the experiment
+    when rendering.
+    """
+    def __init__(self, experiment: "Experiment") -> None:
+        self.experiment = experiment
+        self.request_durations: Dict[Tuple[str, str, str, int], Histogram] = {}
+
+    def observe_request(self, handler: str, method: str, action: str, status: int, duration: float) -> None:
+        key = (handler, method, action, status)
+        try:
+            histogram = self.request_durations[key]
+        except KeyError:
+            histogram = self.request_durations[key] = Histogram()
+        histogram.observe(duration)
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        experiment = self.experiment
+        lines: List[str] = []
+
+        _add_metric(lines, "experiment_server_request_duration_seconds", "histogram",
+                    "Time taken to process requests by handler, method, action and status.")
+        for (handler, method, action, status), histogram in sorted(self.request_durations.items()):
+            _add_histogram(lines, "experiment_server_request_duration_seconds", histogram,
+                           f'handler="{handler}",method="{method}",action="{_escape(action)}",code="{status}"')
+
+        summary = experiment.get_summary()
+        _add_metric(lines, "experiment_server_participants", "gauge", "Number of participants by state.")
+        lines.append(f'experiment_server_participants{{state="active"}} {summary["active"]}')
+        lines.append(f'experiment_server_participants{{state="inactive"}} {summary["participants"] - summary["active"]}')
+
+        _add_metric(lines, "experiment_server_blocks_completed_total", "counter", "Number of blocks participants moved on from.")
+        lines.append(f"experiment_server_blocks_completed_total {experiment.blocks_completed_count}")
+
+        _add_metric(lines, "experiment_server_config_reloads_total", "counter", "Number of reloads of the config file by result.")
+        # Read together, the counters are updated from the thread watching the config file
+        with experiment._stats_lock:
+            reload_count, reload_failure_count = experiment.reload_count, experiment.reload_failure_count
+        lines.append(f'experiment_server_config_reloads_total{{result="success"}} {reload_count - reload_failure_count}')
+        lines.append(f'experiment_server_config_reloads_total{{result="failure"}} {reload_failure_count}')
+
+        _add_metric(lines, "experiment_server_config_reload_duration_seconds", "histogram", "Time taken to reload the config file.")
+        _add_histogram(lines, "experiment_server_config_reload_duration_seconds", experiment.reload_durations, "")
+
+        _add_metric(lines, "experiment_server_config_processing_duration_seconds", "histogram", "Time taken to load and compile the config file.")
+        _add_histogram(lines, "experiment_server_config_processing_duration_seconds", experiment.config_processing_durations, "")
+
+        _add_metric(lines, "experiment_server_cache_requests_total", "counter", "Number of cache lookups by cache and result.")
+        for cache, stats in (("ordering_rows", experiment.ordering_row_cache_stats), ("blocks", experiment.block_cache_stats)):
+            lines.append(f'experiment_server_cache_requests_total{{cache="{cache}",result="hit"}} {stats.hits}')
+            lines.append(f'experiment_server_cache_requests_total{{cache="{cache}",result="miss"}} {stats.misses}')
+
+        return "\n".join(lines) + "\n"
+
+
+def _add_metric(lines: List[str], name: str, metric_type: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _add_histogram(lines: List[str], name: str, histogram: Histogram, labels: str) -> None:
+    separator = "," if labels else ""
+    cumulative_count = 0
+    for upper_bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+        cumulative_count += count
+        le = "+Inf" if upper_bound == float("inf") else repr(upper_bound)
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{le}"}} {cumulative_count}')
+    labels = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_sum{labels} {histogram.sum}")
+    lines.append(f"{name}_count{labels} {histogram.count}")
+
+
+def _escape(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,6 +1,6 @@
 import random
 import itertools
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 from easydict import EasyDict as edict
 
 from experiment_server.utils import ExperimentServerConfigurationException, balanced_latin_square
@@ -18,7 +18,8 @@ def construct_participant_condition(config: List[Dict],
                                     within_groups_strategy:Union[str,None]=None,
                                     groups_strategy:Union[str,None]=None,
                                     init_blocks_strategy:Union[str,None]=None,
-                                    final_blocks_strategy:Union[str,None]=None) -> List:
+                                    final_blocks_strategy:Union[str,None]=None,
+                                    rng:Optional[random.Random]=None) -> List:
     """
     Construct the per-participant ordered list of block configurations based on a global experiment
     configuration, ordering specification, and a participant index.
@@ -32,8 +33,8 @@ def construct_participant_condition(config: List[Dict],
     Behavior details and constraints:
         - Names in `order`, `init_block_names`, and `final_block_names` are validated to be strings and must
           match unique names in `config`. Duplicate names in `config` cause an error.
-        - When `groups_strategy` or `within_groups_strategy` is "randomize", Python's random.shuffle is used
-          (non-deterministic unless the caller seeds the RNG).
+        - When `groups_strategy` or `within_groups_strategy` is "randomize", the blocks are shuffled
+          with `rng` or the global `random` state (non-deterministic unless the caller seeds it).
         - When "latin_square" is requested for groups or within-group ordering, a balanced Latin square
           generator is used and `participant_index` selects the row; latin-square requires equal-sized
           values where appropriate (e.g., all groups must have the same size when using within-group
@@ -104,6 +105,9 @@ def construct_participant_condition(config: List[Dict],
 
         final_blocks_strategy (Union[str, None]): Strategy for ordering final blocks. Same semantics and allowed values as init_blocks_strategy.
 
+        rng (Optional[random.Random]): Random number generator used by the "randomize" strategies. If None,
+            the global `random` state is used.
+
     Returns:
         List: A list of block configuration dictionaries (the original dicts from `config`) in the final
             order constructed for the participant: [init_blocks..., main_blocks..., final_blocks...].
@@ -118,7 +122,10 @@ def construct_participant_condition(config: List[Dict],
             * unsupported strategy names
             * inconsistent group sizes for latin-square within-group ordering
             * improper dict key sets or types when dict-based per-participant selection is used
+            * block names in the order that are not in config
     """
+    shuffle = random.shuffle if rng is None else rng.shuffle
+
     if within_groups_strategy is None:
         within_groups_strategy = ORDERING_STRATEGY.as_is
     elif within_groups_strategy not in list(ORDERING_STRATEGY.values()):
@@ -162,7 +169,7 @@ def construct_participant_condition(config: List[Dict],
         _filtered_order = [_process_dict_orders(participant_index, order, groups_strategy, "order", ORDERING_STRATEGY), ]
 
     if groups_strategy == ORDERING_STRATEGY.randomize:
-        random.shuffle(_filtered_order)
+        shuffle(_filtered_order)
     elif groups_strategy == ORDERING_STRATEGY.latin_square:
         _latin_square = balanced_latin_square(len(_filtered_order))
         _participant_order = _latin_square[(participant_index - 1) % len(_filtered_order)]
@@ -171,7 +178,7 @@ def construct_participant_condition(config: List[Dict],
 
     if within_groups_strategy == ORDERING_STRATEGY.randomize:
         for group in _filtered_order:
-            random.shuffle(group)
+            shuffle(group)
     elif within_groups_strategy == ORDERING_STRATEGY.latin_square:
         elements_in_group = set([len(_g) for _g  in _filtered_order])
         if len(elements_in_group) != 1:
@@ -188,15 +195,18 @@ def construct_participant_condition(config: List[Dict],
     _filtered_init_order = _process_init_final_block(participant_index, init_block_names, init_blocks_strategy, "init_blocks", INIT_FINAL_ORDERING_STRATEGY)
 
     if init_blocks_strategy == INIT_FINAL_ORDERING_STRATEGY.randomize:
-        random.shuffle(_filtered_init_order)
+        shuffle(_filtered_init_order)
 
     assert isinstance(final_blocks_strategy, str)
     _filtered_final_order = _process_init_final_block(participant_index, final_block_names, final_blocks_strategy, "final_blocks", INIT_FINAL_ORDERING_STRATEGY)
 
     if final_blocks_strategy == INIT_FINAL_ORDERING_STRATEGY.randomize:
-        random.shuffle(_filtered_final_order)
+        shuffle(_filtered_final_order)
 
     chained_order = _filtered_init_order + list(itertools.chain(*_filtered_order)) + _filtered_final_order
+    unknown_names = [name for name in chained_order if name not in name_to_config_mapping]
+    if len(unknown_names) > 0:
+        raise ExperimentServerConfigurationException(f"Unknown block name(s) in the order for participant {participant_index}: {unknown_names}")
     return [name_to_config_mapping[i] for i in chained_order]
 
 
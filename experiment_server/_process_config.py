@@ -1,8 +1,18 @@
+from collections.abc import Sequence
+import copy
+import math
 from pathlib import Path
 import random
+import re
+import threading
 import warnings
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+from easydict import EasyDict as edict
+from experiment_server._allocation import CohortAllocator
+from experiment_server._logging import log_hot_path
+from experiment_server._metrics import CacheStats
+from experiment_server._tracing import span
 from experiment_server._participant_ordering import construct_participant_condition, ORDERING_STRATEGY
 from experiment_server.utils import ExperimentServerConfigurationException, ExperimentServerException, merge_dicts
 from loguru import logger
@@ -16,6 +26,11 @@ TOP_LEVEL_RESERVED_KEYS = ["name", "config", "extends"]
 SECTIONS = ["main_configuration", "init_configuration", "final_configuration", "template_values", "order", "settings"]
 ALLOWED_SETTINGS = ["randomize_within_groups", "randomize_groups"]
 
+# Resolving the blocks of a participant (see `LazyParticipantBlocks`) is done by one thread
+# at a time, participants share one of the locks by their index.
+_RESOLVE_LOCK_STRIPES = 64
+_resolve_locks = [threading.Lock() for _ in range(_RESOLVE_LOCK_STRIPES)]
+
 
 def process_config_file(f: Union[str, Path], participant_index: int, suppress_message:bool=False) -> List[Dict[str, Any]]:
     """
@@ -57,8 +72,9 @@ def process_config_file(f: Union[str, Path], participant_index: int, suppress_me
 
     Notes:
         The function delegates group and per-participant ordering logic to the participant
-          ordering utilities; randomization behavior depends on the provided configuration's
-          "random_seed" combined with participant_index and on the global random state.
+          ordering utilities; the orders and function calls of a participant draw from a
+          `random.Random` seeded with the configuration's "random_seed" + participant_index,
+          the global random state is not used.
         The function performs variable replacement, resolves "extends" inheritance (merging
           dictionaries), and evaluates configured function-calls such as choices(...) before
           returning the final block list.
@@ -68,18 +84,62 @@ def process_config_file(f: Union[str, Path], participant_index: int, suppress_me
     if participant_index < 1:
         raise ExperimentServerConfigurationException(f"Participant index needs to be greater than 0, got {participant_index}")
 
+    return compile_config_file(f).resolve(participant_index, suppress_message)
+
+
+def compile_config_file(f: Union[str, Path]) -> "CompiledConfig":
+    """
+    Load and compile an experiment configuration file once, so that it can be resolved
+    for any number of participants without re-reading or re-processing the file.
+
+    Parameters:
+        f (Union[str, Path]):
+            Path or string filename pointing to the configuration file. Files must have a
+            ".toml" suffix; other formats will raise an ExperimentServerExcetion.
+
+    Returns:
+        CompiledConfig: See `CompiledConfig.resolve` to get the blocks for a participant.
+
+    Raises:
+        ExperimentServerConfigurationExcetion:
+            If required variables are missing, inheritance references are invalid, or other
+            configuration validation errors occur.
+        ExperimentServerExcetion:
+            If the file type is unsupported (non-.toml).
+    """
     if Path(f).suffix == ".toml":
-        return _process_toml(f, participant_index, suppress_message)
+        return _compile_toml(f)
     else:
         raise ExperimentServerException("Invalid file type. Expected `.toml`")
 
 
 def _process_toml(f: Union[str, Path], participant_index:int, suppress_message:bool=False) -> List[Dict[str, Any]]:
-    loaded_configuration = toml.load(f)
-    return _process_config(loaded_configuration, participant_index, suppress_message)
+    return _compile_toml(f).resolve(participant_index, suppress_message)
+
+
+def _compile_toml(f: Union[str, Path]) -> "CompiledConfig":
+    with span("toml.load", file=str(f)) as attributes:
+        loaded_configuration = toml.load(f)
+        attributes["blocks"] = len(loaded_configuration.get("blocks", []))
+    return compile_config(loaded_configuration)
 
 
 def _process_config(configuration: dict[Any, Any], participant_index:int, suppress_message:bool=False) -> List[Dict[str, Any]]:
+    return compile_config(configuration).resolve(participant_index, suppress_message)
+
+
+def compile_config(configuration: dict[Any, Any]) -> "CompiledConfig":
+    """
+    Compile a loaded configuration (e.g. the output of `toml.load`).
+
+    Everything that does not depend on the participant is done here: validation, variable
+    substitution, resolving `extends` and locating the function calls in each block.
+    """
+    with span("compile_config"):
+        return _compile_config(configuration)
+
+
+def _compile_config(configuration: dict[Any, Any]) -> "CompiledConfig":
     try:
         configurations = configuration["configuration"]
     except KeyError:
@@ -114,9 +174,9 @@ def _process_config(configuration: dict[Any, Any], participant_index:int, suppre
     final_blocks_strategy = configurations.get("final_blocks_strategy", None)
 
     random_seed = configurations.get("random_seed", 0)
-    random.seed(random_seed + participant_index)
 
-    all_blocks = _replace_variables(configuration["blocks"], variables)
+    with span("replace_variables", variables=len(variables)):
+        all_blocks = _replace_variables(configuration["blocks"], variables)
     if not isinstance(all_blocks, list):
         raise ExperimentServerConfigurationException(f"`blocks` is not a list.")
 
@@ -130,33 +190,416 @@ def _process_config(configuration: dict[Any, Any], participant_index:int, suppre
             raise ExperimentServerConfigurationException(f"One or more block(s) missing `name`.")
         if "config" not in c and "extends" not in c:
             raise ExperimentServerConfigurationException(f"One or more block(s) missing `config`.")
-        c["name"] = str(c["name"])
 
-    blocks = construct_participant_condition(all_blocks, participant_index, order=order,
-                                             init_block_names=init_blocks_names,
-                                             final_block_names=final_blocks_names,
-                                             groups_strategy=order_groups_strategy,
-                                             within_groups_strategy=order_within_groups_strategy,
-                                             init_blocks_strategy=init_blocks_strategy,
-                                             final_blocks_strategy=final_blocks_strategy)
+    # Only the top level is copied, `resolve_extends` adds/removes keys at that level and
+    # `merge_dicts` creates new dicts for the blocks that extend another block.
+    all_blocks = [dict(c, name=str(c["name"])) for c in all_blocks]
+    with span("resolve_extends", blocks=len(all_blocks)):
+        resolved_blocks = {c["name"]: c for c in resolve_extends(list(all_blocks))}
+    if len(resolved_blocks) != len(all_blocks):
+        seen_names = set()
+        for c in all_blocks:
+            if c["name"] in seen_names:
+                raise ExperimentServerConfigurationException(f"Duplicate block name: {c['name']}")
+            seen_names.add(c["name"])
+
+    with span("compile_function_calls", blocks=len(resolved_blocks)):
+        return CompiledConfig(resolved_blocks, order,
+                              init_block_names=init_blocks_names,
+                              final_block_names=final_blocks_names,
+                              groups_strategy=order_groups_strategy,
+                              within_groups_strategy=order_within_groups_strategy,
+                              init_blocks_strategy=init_blocks_strategy,
+                              final_blocks_strategy=final_blocks_strategy,
+                              random_seed=random_seed)
+
+
+class _FunctionCallSite:
+    """A function call found in a block, called again for every participant.
+    The function name and its `args`/`params` are validated when created."""
+    __slots__ = ("call",)
+
+    def __init__(self, call: Dict[str, Any], block_name: Optional[str]) -> None:
+        self.call = call
+        for key in ("function_name", "args"):
+            if key not in call:
+                raise ExperimentServerConfigurationException(f"A function call in block `{block_name}` is missing `{key}`: {call}")
+        if call["function_name"] != "choices":
+            raise ExperimentServerConfigurationException(f"Unknown function {call['function_name']} in block `{block_name}`")
+        ChoicesFunction(call["args"], call.get("params", None))
+
+    def render(self, function_calls: "_FunctionCalls") -> Any:
+        return _resolve_function(**self.call, function_calls=function_calls, rng=function_calls.rng)
+
+
+class _VariableSite:
+    """A string referring to variables: either `"$name"`, replaced by the value of the
+    variable, or a string with `"${name}"` placeholders, which are interpolated. `"$$"`
+    in a string is replaced by a literal `"$"`."""
+    __slots__ = ("value", "names", "interpolated")
+
+    def __init__(self, value: str, names: List[str]) -> None:
+        self.value = value
+        self.names = names
+        self.interpolated = _VARIABLE_INTERPOLATION_PATTERN.search(value) is not None
+
+    def render(self, variables: Dict[str, Any]) -> Any:
+        for name in self.names:
+            if name not in variables:
+                raise ExperimentServerConfigurationException(f"The variable `{name}` does not exsist in `configuration.variables`")
+
+        if not self.interpolated:
+            return variables[self.names[0]]
+        match = _VARIABLE_INTERPOLATION_PATTERN.fullmatch(self.value)
+        if match is not None and match.group(1) is not None:
+            return variables[match.group(1)]
+        return _VARIABLE_INTERPOLATION_PATTERN.sub(_interpolate_match(variables), self.value)
+
+
+class _ContainerSites:
+    """A dict or list with at least one site below it.
+    Only the keys (or indices) in `sites` are rendered, all other values are shared by reference."""
+    __slots__ = ("static", "sites", "keys")
+
+    def __init__(self, static: Union[Dict[str, Any], List[Any]], sites: List[Tuple[Any, Union["_ContainerSites", _FunctionCallSite, _VariableSite]]]) -> None:
+        self.static = static
+        self.sites = sites
+        self.keys = frozenset(k for k, _ in sites)
+
+    def render(self, context: Any) -> Union[Dict[str, Any], List[Any]]:
+        resolved_config: Union[Dict[str, Any], List[Any]]
+        if isinstance(self.static, dict):
+            resolved_config = dict(self.static)
+        else:
+            resolved_config = list(self.static)
+        for k, site in self.sites:
+            resolved_config[k] = site.render(context)
+        return resolved_config
+
 
-    block_names = [c["name"] for c in blocks]
+def _is_function_call(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) in (2, 3, 4) and all([_k in ["function_name", "args", "params", "id"] for _k in value.keys()])
 
-    # Using merge_dicts to ensure the values are references
-    resolved_blocks = {c["name"]: c for c in resolve_extends([merge_dicts(b, {}) for b in all_blocks])}
 
-    # Use block names to get resolved blocks in the expected order
-    blocks = [resolved_blocks[c] for c in block_names]
-    blocks = resolve_function_calls(blocks)
+def _compile_function_sites(config: Dict[str, Any], block_name: Optional[str]) -> Optional[_ContainerSites]:
+    """Find the function calls in `config` of the block `block_name`, in the same order
+    `_resolve_function_calls` visits them. Returns None if there are none."""
+    sites: List[Tuple[Any, Union[_ContainerSites, _FunctionCallSite, _VariableSite]]] = []
+    for k, v in config.items():
+        if isinstance(v, dict):
+            if _is_function_call(v):
+                sites.append((k, _FunctionCallSite(v, block_name)))
+            else:
+                child_sites = _compile_function_sites(v, block_name)
+                if child_sites is not None:
+                    sites.append((k, child_sites))
+    if len(sites) == 0:
+        return None
+    return _ContainerSites(config, sites)
 
-    for (idx, c) in enumerate(blocks):
-        c["config"]["participant_index"] = participant_index
-        c["config"]["name"] = c["name"]
-        c["config"]["block_id"] = idx
-    
-    if not suppress_message:
-        logger.info("Configuration loaded: \n" + json.dumps(blocks, indent=2))
-    return blocks
+
+class CompiledConfig:
+    """
+    An experiment configuration processed up to the point where it depends on the participant.
+
+    Use `compile_config_file` or `compile_config` to create one. The blocks returned by
+    `resolve` share the values that are the same for all participants (anything that is not
+    the result of a function call) by reference. Only the block dict and its `config` dict are
+    new for each participant, treat nested values as read only.
+    """
+    def __init__(self, blocks: Dict[str, Dict[str, Any]], order: Union[dict, list],
+                 init_block_names: Union[dict, list], final_block_names: Union[dict, list],
+                 groups_strategy: Union[str, None], within_groups_strategy: Union[str, None],
+                 init_blocks_strategy: Union[str, None], final_blocks_strategy: Union[str, None],
+                 random_seed: int) -> None:
+        self.blocks = blocks
+        self.order = order
+        self.init_block_names = init_block_names
+        self.final_block_names = final_block_names
+        self.groups_strategy = groups_strategy
+        self.within_groups_strategy = within_groups_strategy
+        self.init_blocks_strategy = init_blocks_strategy
+        self.final_blocks_strategy = final_blocks_strategy
+        self.random_seed = random_seed
+        self._block_sites = {name: _compile_function_sites(c, name) for name, c in blocks.items()}
+        self._cohort_calls = {_call_signature(**site.call): site.call
+                              for sites in self._block_sites.values() if sites is not None
+                              for _, site in _iter_leaf_sites(sites)
+                              if isinstance(site.call.get("params", None), dict) and site.call["params"].get("scope", None) == CHOICES_SCOPE.cohort}
+        # Replaced by `Experiment` to share (and persist) the allocations across configs
+        self.cohort_allocator = CohortAllocator()
+        self._ordering_rows: Dict[Tuple[str, ...], _OrderingRow] = {}
+        # Can be replaced to collect the stats of more than one `CompiledConfig`
+        self.ordering_row_cache_stats = CacheStats()
+        self.block_cache_stats = CacheStats()
+
+    def resolve(self, participant_index: int, suppress_message: bool=False) -> List[Dict[str, Any]]:
+        """
+        Return the list of resolved blocks for `participant_index` in execution order.
+        See `process_config_file` for more details.
+        """
+        if participant_index < 1:
+            raise ExperimentServerConfigurationException(f"Participant index needs to be greater than 0, got {participant_index}")
+        with span("resolve", participant_index=participant_index):
+            rng = random.Random(self.random_seed + participant_index)
+
+            with span("ordering", participant_index=participant_index):
+                block_names = self._block_names(participant_index, rng)
+            function_calls = self._new_function_calls(participant_index, rng)
+            with span("function_calls", participant_index=participant_index, blocks=len(block_names)):
+                blocks = [self._resolve_block(name, block_id, participant_index, function_calls)
+                          for block_id, name in enumerate(block_names)]
+
+        if not suppress_message:
+            log_hot_path("Configuration loaded: \n{}", lambda: json.dumps(blocks, indent=2))
+        return blocks
+
+    def resolve_lazy(self, participant_index: int, suppress_message: bool=False) -> "LazyParticipantBlocks":
+        """
+        Same as `resolve`, but only the order of the blocks is computed now. Each block is
+        resolved the first time it is accessed, see `LazyParticipantBlocks`.
+        """
+        if participant_index < 1:
+            raise ExperimentServerConfigurationException(f"Participant index needs to be greater than 0, got {participant_index}")
+        block_names = self.block_names(participant_index)
+
+        # Participants with the same order share the row
+        try:
+            ordering_row = self._ordering_rows[block_names]
+            self.ordering_row_cache_stats.hits += 1
+        except KeyError:
+            self.ordering_row_cache_stats.misses += 1
+            ordering_row = self._ordering_rows.setdefault(block_names, _OrderingRow(
+                block_names,
+                max([block_id for block_id, name in enumerate(block_names) if self._block_sites[name] is not None], default=-1)))
+        return LazyParticipantBlocks(self, participant_index, ordering_row, suppress_message)
+
+    def block_names(self, participant_index: int) -> Tuple[str, ...]:
+        """
+        Names of the blocks in order for `participant_index`, without resolving the blocks.
+        The global `random` state is left unchanged.
+        """
+        if participant_index < 1:
+            raise ExperimentServerConfigurationException(f"Participant index needs to be greater than 0, got {participant_index}")
+        with span("ordering", participant_index=participant_index):
+            return tuple(self._block_names(participant_index, random.Random(self.random_seed + participant_index)))
+
+    def ordering_period(self) -> int:
+        """
+        Number of participants after which the orders repeat, i.e., participants `i` and
+        `i + ordering_period()` get the same order. This is the least common multiple of the
+        number of rows of the latin squares and the number of entries of the orders given as
+        tables. Orders using `randomize` also depend on the random seed of each participant,
+        see `is_randomized`.
+        """
+        periods = [1]
+        for block_names in (self.init_block_names, self.final_block_names):
+            if isinstance(block_names, dict):
+                periods.append(len(block_names))
+
+        within_groups_strategy = self.within_groups_strategy
+        if isinstance(self.order, dict):
+            periods.append(len(self.order))
+            groups_per_row = [[group] for group in self.order.values()]
+        elif all([isinstance(group, list) for group in self.order]):
+            groups_per_row = [self.order]
+        else:
+            # A flat list is a single group, ordered with the strategy of the groups
+            groups_per_row = [[self.order]]
+            within_groups_strategy = self.groups_strategy
+
+        for groups in groups_per_row:
+            if self.groups_strategy == ORDERING_STRATEGY.latin_square:
+                periods.append(len(groups))
+            if within_groups_strategy == ORDERING_STRATEGY.latin_square and len(groups) > 0:
+                periods.append(len(groups[0]) * len(groups))
+        return math.lcm(*periods)
+
+    def is_randomized(self) -> bool:
+        """True if any part of the order uses the `randomize` strategy."""
+        strategies = [self.groups_strategy, self.init_blocks_strategy, self.final_blocks_strategy]
+        # A flat list is ordered with the strategy of the groups
+        if isinstance(self.order, dict) or all([isinstance(group, list) for group in self.order]):
+            strategies.append(self.within_groups_strategy)
+        return ORDERING_STRATEGY.randomize in strategies
+
+    def _block_names(self, participant_index: int, rng: random.Random) -> List[str]:
+        """Block names in order for the participant, `rng` is the participant's random number generator."""
+        # `construct_participant_condition` shuffles the lists in the order in place.
+        blocks = construct_participant_condition(list(self.blocks.values()), participant_index,
+                                                 order=copy.deepcopy(self.order),
+                                                 init_block_names=copy.deepcopy(self.init_block_names),
+                                                 final_block_names=copy.deepcopy(self.final_block_names),
+                                                 groups_strategy=self.groups_strategy,
+                                                 within_groups_strategy=self.within_groups_strategy,
+                                                 init_blocks_strategy=self.init_blocks_strategy,
+                                                 final_blocks_strategy=self.final_blocks_strategy,
+                                                 rng=rng)
+        return [c["name"] for c in blocks]
+
+    def _new_function_calls(self, participant_index: int, rng: random.Random) -> "_FunctionCalls":
+        """The state of the function calls of a participant, with the calls allocated across the cohort."""
+        return _FunctionCalls(rng, {signature: CohortChoicesFunction(call["args"], call.get("params", None), signature,
+                                                                     self.cohort_allocator, participant_index, self.random_seed)
+                                    for signature, call in self._cohort_calls.items()})
+
+    def check_cohort_populations(self, cohort_allocator: CohortAllocator) -> None:
+        """
+        Raise `ExperimentServerConfigurationException` if the population of a `choices` call with
+        `scope = "cohort"` changed after `cohort_allocator` allocated values of it.
+        """
+        for signature, call in self._cohort_calls.items():
+            largs, kwargs = _unpack_args(call["args"])
+            population = largs[0] if len(largs) > 0 else kwargs.get("population", None)
+            if isinstance(population, list):
+                cohort_allocator.check_population(signature, len(population))
+
+    def _resolve_block(self, name: str, block_id: int, participant_index: int, function_calls: Optional["_FunctionCalls"]) -> Dict[str, Any]:
+        sites = self._block_sites[name]
+        if sites is None:
+            block = dict(self.blocks[name])
+        else:
+            block = sites.render(function_calls)
+        if sites is None or "config" not in sites.keys:
+            block["config"] = dict(block["config"])
+        block["config"]["participant_index"] = participant_index
+        block["config"]["name"] = block["name"]
+        block["config"]["block_id"] = block_id
+        return block
+
+
+class _FunctionCalls(dict):
+    """The function calls of a participant by their signature (see `_call_signature`), calls
+    with the same signature share their state. `rng` is the participant's random number generator."""
+    __slots__ = ("rng",)
+
+    def __init__(self, rng: random.Random, function_calls: Dict[str, Any]) -> None:
+        super().__init__(function_calls)
+        self.rng = rng
+
+
+class _OrderingRow:
+    """An order of blocks, shared by all participants with the same order."""
+    __slots__ = ("block_names", "last_function_call_block_id")
+
+    def __init__(self, block_names: Tuple[str, ...], last_function_call_block_id: int) -> None:
+        self.block_names = block_names
+        self.last_function_call_block_id = last_function_call_block_id
+
+
+class LazyParticipantBlocks(Sequence):
+    """
+    The blocks of a participant (see `CompiledConfig.resolve_lazy`), behaves like the list
+    returned by `CompiledConfig.resolve`.
+
+    The names of the blocks (`block_names`) are computed when created, a block is resolved
+    the first time it is accessed. As function calls depend on the calls made in the earlier
+    blocks (e.g., `unique` in `choices`), a block with function calls is resolved after
+    resolving all the blocks before it, which gives the same values as `resolve`. Blocks
+    can be accessed from more than one thread, each block is resolved once. Participants are
+    resolved concurrently, each with their own random number generator.
+    """
+    __slots__ = ("participant_index", "_ordering_row", "_compiled_config", "_suppress_message", "_blocks",
+                 "_next_ordered_block_id", "_function_calls")
+
+    def __init__(self, compiled_config: CompiledConfig, participant_index: int, ordering_row: _OrderingRow,
+                 suppress_message: bool=False) -> None:
+        self.participant_index = participant_index
+        self._ordering_row = ordering_row
+        self._compiled_config = compiled_config
+        self._suppress_message = suppress_message
+        # Created when the first block is resolved
+        self._blocks: Optional[List[Optional[Dict[str, Any]]]] = None
+
+        # Index of the next block to resolve in order. Blocks up to the last block with
+        # function calls are resolved in order. The function calls (and the random number
+        # generator) are only kept while there are blocks with function calls left to resolve.
+        self._next_ordered_block_id = 0
+        self._function_calls: Optional[_FunctionCalls] = None
+
+    @property
+    def block_names(self) -> Tuple[str, ...]:
+        return self._ordering_row.block_names
+
+    def __len__(self) -> int:
+        return len(self._ordering_row.block_names)
+
+    def __getitem__(self, block_id):
+        if isinstance(block_id, slice):
+            return [self[i] for i in range(*block_id.indices(len(self)))]
+        if block_id < 0:
+            block_id += len(self)
+        if block_id < 0 or block_id >= len(self):
+            raise IndexError("block index out of range")
+        blocks = self._blocks
+        if blocks is None or blocks[block_id] is None:
+            with _resolve_locks[self.participant_index % _RESOLVE_LOCK_STRIPES]:
+                resolved_block_ids = self._resolve(block_id)
+            # Logged after releasing the lock, formatting the blocks can take a while
+            if not self._suppress_message:
+                for resolved_block_id in resolved_block_ids:
+                    self._log_block(resolved_block_id)
+            return self._blocks[block_id]
+        self._compiled_config.block_cache_stats.hits += 1
+        return blocks[block_id]
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (list, LazyParticipantBlocks)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(participant_index={self.participant_index}, block_names={self.block_names!r}, resolved_count={self.resolved_count})"
+
+    @property
+    def resolved_count(self) -> int:
+        """Number of blocks resolved so far."""
+        if self._blocks is None:
+            return 0
+        return len(self._blocks) - self._blocks.count(None)
+
+    def _resolve(self, block_id: int) -> List[int]:
+        """
+        Resolve `block_id` (and the blocks it depends on) if not resolved yet, returns the ids of
+        the blocks resolved. Expects the participant's lock in `_resolve_locks` to be held.
+        """
+        resolved_block_ids = []
+        if self._blocks is None:
+            self._blocks = [None] * len(self)
+        last_function_call_block_id = self._ordering_row.last_function_call_block_id
+        if self._next_ordered_block_id <= min(block_id, last_function_call_block_id):
+            if self._function_calls is None:
+                # First block with function calls, replay the ordering to get the
+                # same random state `resolve` would have.
+                rng = random.Random(self._compiled_config.random_seed + self.participant_index)
+                self._compiled_config._block_names(self.participant_index, rng)
+                self._function_calls = self._compiled_config._new_function_calls(self.participant_index, rng)
+
+            for _block_id in range(self._next_ordered_block_id, min(block_id, last_function_call_block_id) + 1):
+                if self._blocks[_block_id] is None:
+                    self._blocks[_block_id] = self._resolve_block(_block_id, self._function_calls)
+                    resolved_block_ids.append(_block_id)
+                self._next_ordered_block_id = _block_id + 1
+
+            if self._next_ordered_block_id > last_function_call_block_id:
+                self._function_calls = None
+
+        if self._blocks[block_id] is None:
+            self._blocks[block_id] = self._resolve_block(block_id, None)
+            resolved_block_ids.append(block_id)
+        return resolved_block_ids
+
+    def _resolve_block(self, block_id: int, function_calls: Optional[_FunctionCalls]) -> Dict[str, Any]:
+        self._compiled_config.block_cache_stats.misses += 1
+        with span("resolve_block", participant_index=self.participant_index, block_id=block_id):
+            return self._compiled_config._resolve_block(self.block_names[block_id], block_id, self.participant_index, function_calls)
+
+    def _log_block(self, block_id: int) -> None:
+        # The block is only formatted if the log is written, see `log_hot_path`
+        assert self._blocks is not None
+        block = self._blocks[block_id]
+        log_hot_path("Block {} loaded for participant {}: \n{}",
+                     lambda: block_id, lambda: self.participant_index, lambda: json.dumps(block, indent=2))
 
 
 def _resolve_extends(c, configs, seen_configs):
@@ -212,45 +655,118 @@ def _replace_variables(config: Union[Dict[str, Any], List[Any]], variabels: Dict
     Recursively substitute variable placeholders in a config.
 
     Any string beginning with '$' is replaced by the value from `variabels`
-    using the name after the '$'. Nested dicts and lists are traversed and
-    preserved in structure.
+    using the name after the '$'. Strings containing `${name}` are interpolated
+    with the value of `name` (a string that is only `${name}` is replaced by the
+    value itself). `$$` in a string is an escaped '$', e.g. `"$$5"` is replaced
+    by `"$5"`. Nested dicts and lists, at any depth, are traversed and preserved
+    in structure. Variables can refer to other variables.
 
     Args:
         config: A dict or list tree containing values to resolve.
         variabels: Mapping of variable names (without '$') to replacement values.
 
     Returns:
-        A new dict or list with all '$'-prefixed variables substituted.
+        A dict or list with all variables substituted. Only the dicts and lists
+        leading to a substituted value are new, everything else is shared with `config`.
 
     Raises:
-        ExperimentServerConfigurationExcetion: if a referenced variable is not found.
+        ExperimentServerConfigurationExcetion: if a referenced variable is not found, or
+            variables refer to each other in a cycle.
     """
-    resolved_config: Union[Dict, List]
+    sites = _compile_variable_sites(config)
+    if sites is None:
+        return config
+    return sites.render(_resolve_variables(variabels))
+
+
+# `$$` (an escaped `$`) or a `${name}` placeholder, only the placeholders have a group
+_VARIABLE_INTERPOLATION_PATTERN = re.compile(r"\$\$|\$\{([^}]+)\}")
+
+
+def _variable_names(value: str) -> Optional[List[str]]:
+    """Names of the variables referred to in `value`, None if `value` does not refer
+    to variables nor has an escaped `$`."""
+    matches = list(_VARIABLE_INTERPOLATION_PATTERN.finditer(value))
+    if len(matches) == 0:
+        return [value[1:]] if value.startswith("$") else None
+    return [match.group(1) for match in matches if match.group(1) is not None]
+
+
+def _interpolate_match(variables: Dict[str, Any]) -> Callable[["re.Match[str]"], str]:
+    def _interpolate(match: "re.Match[str]") -> str:
+        name = match.group(1)
+        if name is None:
+            return "$"
+        return _interpolated_value(name, variables[name])
+    return _interpolate
+
+
+def _interpolated_value(name: str, value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        raise ExperimentServerConfigurationException(f"The variable `{name}` is a table/array, it can only be used as `${name}` or `${{{name}}}`, not within a string.")
+    return json.dumps(value)
+
+
+def _compile_variable_sites(config: Any) -> Optional[_ContainerSites]:
+    """Find all strings referring to variables in the dicts and lists of `config`.
+    Returns None if there are none."""
     if isinstance(config, dict):
-        resolved_config = {}
-        for k, v in config.items():
-            if isinstance(v, str) and v.startswith("$"):
-                try:
-                    resolved_config[k] = variabels[v[1:]]
-                except KeyError:
-                    raise ExperimentServerConfigurationException(f"The variable `{v}` does not exsist in `configuration.variables`")
-            elif isinstance(v, dict):
-                resolved_config[k] = _replace_variables(v, variabels)
-            else:
-                resolved_config[k] = v
+        items = config.items()
     elif isinstance(config, list):
-        resolved_config = []
-        for v in config:
-            if isinstance(v, str) and v.startswith("$"):
-                try:
-                    resolved_config.append(variabels[v[1:]])
-                except KeyError:
-                    raise ExperimentServerConfigurationException(f"The variable `{v}` does not exsist in `configuration.variables`")
-            elif isinstance(v, dict):
-                resolved_config.append(_replace_variables(v, variabels))
-            else:
-                resolved_config.append(v)
-    return resolved_config
+        items = enumerate(config)
+    else:
+        return None
+
+    sites: List[Tuple[Any, Union[_ContainerSites, _FunctionCallSite, _VariableSite]]] = []
+    for k, v in items:
+        if isinstance(v, str):
+            names = _variable_names(v)
+            if names is not None:
+                sites.append((k, _VariableSite(v, names)))
+        else:
+            child_sites = _compile_variable_sites(v)
+            if child_sites is not None:
+                sites.append((k, child_sites))
+    if len(sites) == 0:
+        return None
+    return _ContainerSites(config, sites)
+
+
+def _resolve_variables(variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Substitute the variables used in the values of other variables."""
+    variable_sites = {name: _compile_variable_sites({name: value}) for name, value in variables.items()}
+    if all([sites is None for sites in variable_sites.values()]):
+        return variables
+
+    resolved_variables: Dict[str, Any] = {}
+
+    def _resolve(name: str, seen: List[str]) -> None:
+        if name in resolved_variables or name not in variables:
+            return
+        if name in seen:
+            raise ExperimentServerConfigurationException(f"Variables refer to each other in a cycle: {' -> '.join(seen + [name])}")
+        sites = variable_sites[name]
+        if sites is None:
+            resolved_variables[name] = variables[name]
+            return
+        for _, site in _iter_leaf_sites(sites):
+            for _name in site.names:
+                _resolve(_name, seen + [name])
+        resolved_variables[name] = sites.render(resolved_variables)[name]
+
+    for name in variables:
+        _resolve(name, [])
+    return resolved_variables
+
+
+def _iter_leaf_sites(sites: _ContainerSites):
+    for k, site in sites.sites:
+        if isinstance(site, _ContainerSites):
+            yield from _iter_leaf_sites(site)
+        else:
+            yield k, site
 
 
 def resolve_function_calls(configs: list) -> list:
@@ -285,48 +801,72 @@ def _unpack_args(args) -> Tuple[list, dict]:
     return largs, kwargs
 
 
-def _resolve_function(function_name:str, args: Union[List,Dict], function_calls: dict, params: Any=None, id: Any=None) -> Any:
-    """Call the function and return the value."""
+def _call_signature(function_name: str, args: Union[List, Dict], params: Any=None, id: Any=None) -> str:
+    """Calls with the same signature share their state (e.g., `unique` in `choices`).
+    The signature is the same across processes, it is used to persist cohort allocations."""
     if id is None:
-        call_signature = hash(json.dumps({"function_name": function_name, "args": args, "params": params}, sort_keys=True))
-    else:
-        call_signature = id
+        return json.dumps({"function_name": function_name, "args": args, "params": params}, sort_keys=True)
+    return json.dumps({"id": id})
+
 
+def _resolve_function(function_name:str, args: Union[List,Dict], function_calls: dict, params: Any=None, id: Any=None,
+                      rng: Optional[random.Random]=None) -> Any:
+    """Call the function and return the value. The function draws from `rng`, or the global `random` state if None."""
+    call_signature = _call_signature(function_name, args, params, id)
     if function_name == "choices":
         try:
             function_call_group = function_calls[call_signature]
         except KeyError:
-            function_call_group = function_calls[call_signature] = ChoicesFunction(args, params)
+            function_call_group = function_calls[call_signature] = ChoicesFunction(args, params, rng)
+            if function_call_group.scope == CHOICES_SCOPE.cohort:
+                raise ExperimentServerConfigurationException("`choices` with `scope = \"cohort\"` can only be resolved for a participant, use `CompiledConfig.resolve`.")
         return function_call_group(args, params)
     else:
         raise ExperimentServerConfigurationException(f"Unknown function {function_name}")
 
 
+CHOICES_SCOPE = edict({v:v for v in ["participant", "cohort"]})
+
+
 class ChoicesFunction:
     """Wrapper for random.choices function call.
-    `args` will be passed to `random.choices`.
-    If `params` has `unique` whose value is True, will ensure no duplicate values seen in any of the choices call."""
-    def __init__(self, args, params) -> None:
+    `args` will be passed to `rng.choices` (the global `random.choices` if `rng` is None).
+    If `params` has `unique` whose value is True, will ensure no duplicate values seen in any of the choices call.
+    If `params` has `scope` whose value is "cohort", the values are drawn without replacement across all
+    participants, see `CohortChoicesFunction`."""
+    def __init__(self, args, params, rng: Optional[random.Random]=None) -> None:
         self.args = args
+        self.rng = rng
         self.largs, self.kwargs = _unpack_args(args)
         self.unique = False
+        self.scope = CHOICES_SCOPE.participant
         self.params = params
         if params is not None:
             if not isinstance(params, dict):
                 raise ExperimentServerConfigurationException(f"`params` for `choices` should be a dict.")
-            if len(params) not in (0, 1):
-                raise ExperimentServerConfigurationException(f"Function `choices` expected 0 or 1 keys in params, got {len(params)}")
-            if len(params) == 1 and "unique" not in params:
-                raise ExperimentServerConfigurationException(f"Unexpected key in `params` of `choices`. Allowed keys: [`unique`]")
+            if not all([k in ["unique", "scope"] for k in params]):
+                raise ExperimentServerConfigurationException(f"Unexpected key in `params` of `choices`. Allowed keys: [`unique`, `scope`]")
             if "unique" in params:
                 self.unique = params.get("unique")
+            if "scope" in params:
+                self.scope = params.get("scope")
+                if self.scope not in list(CHOICES_SCOPE.values()):
+                    raise ExperimentServerConfigurationException(f"Allowed values for `scope` of `choices` are {list(CHOICES_SCOPE.values())}, got {self.scope}")
+        if self.scope == CHOICES_SCOPE.cohort:
+            if self.unique:
+                raise ExperimentServerConfigurationException(f"`unique` can not be used with `scope = \"cohort\"` in `choices`, the values are not repeated across the cohort.")
+            if len(self.largs) > 1 or "weights" in self.kwargs or "cum_weights" in self.kwargs:
+                raise ExperimentServerConfigurationException(f"Weights are not supported by `choices` with `scope = \"cohort\"`.")
+            if not isinstance(self.largs[0] if len(self.largs) > 0 else self.kwargs.get("population", None), list):
+                raise ExperimentServerConfigurationException(f"The population of `choices` with `scope = \"cohort\"` should be an array.")
         self.previous_choices = []
 
     def __call__(self, args, params) -> Any:
         # Sanity check, making sure nothing changes between calls
         assert self.args == args
         assert params == self.params
-        choice = random.choices(*self.largs, **self.kwargs)
+        choices = random.choices if self.rng is None else self.rng.choices
+        choice = choices(*self.largs, **self.kwargs)
         if self.unique:
             # Making sure there are only unique values
             i = 0
@@ -335,7 +875,7 @@ class ChoicesFunction:
                     # KLUDGE: Chouldn't find unique values?
                     break
                 i += 1
-                choice = random.choices(*self.largs, **self.kwargs)
+                choice = choices(*self.largs, **self.kwargs)
 
             self.previous_choices.extend(choice)
 
@@ -345,14 +885,44 @@ class ChoicesFunction:
         return choice
 
 
+class CohortChoicesFunction(ChoicesFunction):
+    """`choices` with `scope = "cohort"` for one participant. The values are allocated by a
+    `CohortAllocator` shared by all participants, the global `random` state is not used."""
+    def __init__(self, args, params, signature: str, allocator: CohortAllocator, participant_index: int, random_seed: int) -> None:
+        super().__init__(args, params)
+        self.signature = signature
+        self.allocator = allocator
+        self.participant_index = participant_index
+        self.random_seed = random_seed
+        self.population = self.largs[0] if len(self.largs) > 0 else self.kwargs["population"]
+        self.k = self.kwargs.get("k", 1)
+        self.calls_count = 0
+
+    def __call__(self, args, params) -> Any:
+        assert self.args == args
+        assert params == self.params
+        choice = self.allocator.allocate(self.signature, self.population, self.k, self.participant_index, self.calls_count, self.random_seed)
+        self.calls_count += 1
+        return choice
+
+
+# Participants checked by `check_orderings` when the orders repeat after more participants
+MAX_VERIFIED_PARTICIPANTS = 10000
+# Participants shown in the table logged by `verify_config`
+_PREVIEW_PARTICIPANTS = 5
+
+
 def verify_config(f: Union[str, Path], test_func:Optional[Callable[[List[Dict[str, Any]]], Tuple[bool, str]]]=None, raise_on_error:bool=False) -> Tuple[bool, Optional[str]]:
     """
-    Verify an experiment TOML config by constructing participant orders for participants 1–5.
+    Verify an experiment TOML config by checking the order of every distinct ordering row.
 
-    For each participant index 1..5 this loads the resolved configuration via
-    `process_config_file`. If provided, `test_func` is called with the resolved blocks and
-    must return (True, reason) on success; otherwise an assertion or exception is raised. On
-    success a summary table is logged and the function returns True.
+    The config is compiled once and the orders of the participants up to the ordering
+    period (see `check_orderings`) are checked without resolving the blocks, so verifying
+    a design with many conditions takes about as long as one with a few. If provided,
+    `test_func` is called with the resolved blocks of the first participant with each
+    distinct order and must return (True, reason) on success; otherwise an assertion or
+    exception is raised. On success the orders of the first 5 participants and the
+    coverage of the check are logged and the function returns True.
 
     Args:
         f: Path or filename of the TOML configuration file.
@@ -369,8 +939,11 @@ def verify_config(f: Union[str, Path], test_func:Optional[Callable[[List[Dict[st
     # with logger.catch(reraise=raise_on_error, message="Config verification failed"):
 
     try:
-        df = _get_table_for_participants(f, test_func)
-        logger.info(f"Ordering for 5 participants: \n\n{tabulate(df, headers='firstrow', tablefmt='fancy_grid')}\n")
+        compiled_config = compile_config_file(f)
+        coverage = check_orderings(compiled_config, test_func)
+        df = _ordering_table(compiled_config, _PREVIEW_PARTICIPANTS)
+        logger.info(f"Ordering for {_PREVIEW_PARTICIPANTS} participants: \n\n{tabulate(df, headers='firstrow', tablefmt='fancy_grid')}\n")
+        logger.info(_format_coverage(coverage))
         logger.info(f"Config file verification successful for {f}")
         return (True, None)
     except Exception as e:
@@ -380,39 +953,113 @@ def verify_config(f: Union[str, Path], test_func:Optional[Callable[[List[Dict[st
         return (False, "\n".join(format_exception_only(e)))
 
 
-def _get_table_for_participants(f: Union[str, Path], test_func:Optional[Callable[[List[Dict[str, Any]]], Tuple[bool, str]]]=None) -> list[list[Any]]:
-    config_blocks: Dict[int, Dict[str, Any]] = {}
-    # collect configs for participants 1..5 (same range as original)
-    for participant_index in range(1, 6):
-        config = process_config_file(f, participant_index=participant_index, suppress_message=True)
-        config_blocks[participant_index] = {f"block_{idx + 1}": c["name"] for idx, c in enumerate(config)}
+def check_orderings(compiled_config: CompiledConfig,
+                    test_func:Optional[Callable[[List[Dict[str, Any]]], Tuple[bool, str]]]=None,
+                    max_participants: int=MAX_VERIFIED_PARTICIPANTS) -> Dict[str, Any]:
+    """
+    Check the orders of participants 1 to `CompiledConfig.ordering_period` (at least 5 if the
+    order is randomized, at most `max_participants`).
+
+    Each distinct order is checked once, without resolving the blocks: all blocks in the order
+    need a `config` table and the calls to `choices` with `unique` need enough elements for
+    all the calls in the order.
+
+    Args:
+        compiled_config: The config to check.
+        test_func: Optional callable called with the resolved blocks of the first participant
+            with each distinct order, returning a (bool, str) tuple indicating success and an
+            optional reason.
+        max_participants: Maximum number of participants to check.
+
+    Returns:
+        A dict with the `ordering_period`, whether the order is `randomized`, the number of
+        `participants_checked`, the number of `distinct_orders` among them and the `coverage`,
+        the fraction of the ordering period checked.
+
+    Raises:
+        ExperimentServerConfigurationException: If the order of a participant is invalid.
+        AssertionError: If `test_func` fails.
+    """
+    ordering_period = compiled_config.ordering_period()
+    randomized = compiled_config.is_randomized()
+    participants_count = ordering_period
+    if randomized:
+        participants_count = max(participants_count, _PREVIEW_PARTICIPANTS)
+    participants_count = min(participants_count, max_participants)
+
+    checked_orders = set()
+    for participant_index in range(1, participants_count + 1):
+        block_names = compiled_config.block_names(participant_index)
+        if block_names in checked_orders:
+            continue
+        checked_orders.add(block_names)
+        _check_ordering_row(compiled_config, block_names)
         if test_func is not None:
-            test_result, reason = test_func(config)
+            test_result, reason = test_func(compiled_config.resolve(participant_index, suppress_message=True))
             assert test_result, f"test_func failed for {participant_index} with reason, {reason}"
 
-    # collect all block keys and sort by numeric suffix
-    all_blocks = set()
-    for d in config_blocks.values():
-        all_blocks.update(d.keys())
+    return {
+        "ordering_period": ordering_period,
+        "randomized": randomized,
+        "participants_checked": participants_count,
+        "distinct_orders": len(checked_orders),
+        "coverage": min(1.0, participants_count / ordering_period),
+    }
+
+
+def _check_ordering_row(compiled_config: CompiledConfig, block_names: Tuple[str, ...]) -> None:
+    """Check the blocks in an order without resolving them, see `check_orderings`."""
+    unique_choices_counts: Dict[Any, int] = {}
+    for name in block_names:
+        if not isinstance(compiled_config.blocks[name].get("config", None), dict):
+            raise ExperimentServerConfigurationException(f"Block `{name}` is missing a `config` table.")
+        sites = compiled_config._block_sites[name]
+        if sites is None:
+            continue
+        for _, site in _iter_leaf_sites(sites):
+            params = site.call.get("params", None)
+            if not params or not params.get("unique", False):
+                continue
+            largs, kwargs = _unpack_args(site.call["args"])
+            population = largs[0] if len(largs) > 0 else kwargs.get("population", None)
+            if not isinstance(population, (list, str, dict)):
+                continue
+            signature = _call_signature(**site.call)
+            unique_choices_counts[signature] = unique_choices_counts.get(signature, 0) + kwargs.get("k", 1)
+            if unique_choices_counts[signature] > len(population):
+                raise ExperimentServerConfigurationException(f"There are more calls to `choices` than number of elements in `args` in block `{name}` of the order {list(block_names)}")
+
+
+def _format_coverage(coverage: Dict[str, Any]) -> str:
+    message = f"Checked the orders of {coverage['participants_checked']} participant(s), with {coverage['distinct_orders']} distinct order(s). "
+    if coverage["randomized"]:
+        return message + (f"The order is randomized, orders of other participants may differ "
+                          f"(the latin squares/tables repeat every {coverage['ordering_period']} participant(s)).")
+    return message + f"The order repeats every {coverage['ordering_period']} participant(s) ({coverage['coverage']:.0%} checked)."
 
-    def block_key(block_name: str) -> int:
-        try:
-            return int(block_name.split("_", 1)[1])
-        except Exception:
-            return 100000
 
-    sorted_blocks = sorted(all_blocks, key=block_key)
+def _get_table_for_participants(f: Union[str, Path], test_func:Optional[Callable[[List[Dict[str, Any]]], Tuple[bool, str]]]=None) -> list[list[Any]]:
+    compiled_config = compile_config_file(f)
+    # Blocks are only resolved if `test_func` is given
+    check_orderings(compiled_config, test_func)
+    return _ordering_table(compiled_config, _PREVIEW_PARTICIPANTS)
+
+
+def _ordering_table(compiled_config: CompiledConfig, participants_count: int) -> list[list[Any]]:
+    """Table of the block names of participants 1 to `participants_count`, with a row per block."""
+    participants = list(range(1, participants_count + 1))
+    config_blocks = {participant_index: compiled_config.block_names(participant_index) for participant_index in participants}
+    blocks_count = max([len(block_names) for block_names in config_blocks.values()], default=0)
 
     # header row: 'block' followed by participant labels
-    participants = list(range(1, 6))
     header: List[Any] = ["block"] + [f"participant_{i}" for i in participants]
 
     table: List[List[Any]] = [header]
-    for block in sorted_blocks:
-        row = [block]
+    for block_idx in range(blocks_count):
+        row: List[Any] = [f"block_{block_idx + 1}"]
         for p in participants:
-            row.append(config_blocks.get(p, {}).get(block, None))
+            block_names = config_blocks[p]
+            row.append(block_names[block_idx] if block_idx < len(block_names) else None)
         table.append(row)
 
     return table
-
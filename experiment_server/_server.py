@@ -1,33 +1,164 @@
 #!/usr/bin/env python
 """Main script."""
 
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from pathlib import Path
 from multiprocessing import Process
+import threading
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
 
 from tornado.web import RequestHandler, Application, StaticFileHandler
 from tornado.platform.asyncio import AsyncIOMainLoop
 import tornado.ioloop
 import asyncio
+import jinja2
 import json
 
-from experiment_server._api import Experiment
+from experiment_server._api import DEFAULT_PARTICIPANTS_PAGE_SIZE, Experiment
+from experiment_server._logging import configure_logging, log_request
+from experiment_server._metrics import CacheStats, ServerMetrics
+from experiment_server import _wire_format
+from experiment_server._static import AssetHandler, IndexHandler, StaticAssets
 from experiment_server.utils import ExperimentServerConfigurationException, ExperimentServerException
 
 
+# Number of threads used to add/reset participants outside the IOLoop.
+_EXECUTOR_MAX_WORKERS = 4
+# Largest page of participants returned by `list-participants`/`participants`.
+_MAX_PARTICIPANTS_PAGE_SIZE = 1000
+# Number of rendered config fragments kept by `_Fragments`.
+_FRAGMENT_CACHE_SIZE = 256
+# Keys of a block's config that can not be edited from the web UI.
+_READ_ONLY_CONFIG_KEYS = ("participant_index", "block_id", "name")
+
+
+class _ExperimentExecutor:
+    """
+    Runs the `Experiment` calls that (re)process a participant's config in a thread pool, so
+    that the IOLoop keeps serving the other participants in the meantime. Only to be used from
+    the IOLoop.
+
+    Calls for a participant index that is already being added/reset are not run again, they
+    wait for the call in flight instead.
+    """
+    def __init__(self, experiment:Experiment, max_workers:int=_EXECUTOR_MAX_WORKERS) -> None:
+        self.experiment = experiment
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="experiment-server")
+        self._admissions: Dict[int, asyncio.Future] = {}
+        self._resets: Dict[int|None, asyncio.Future] = {}
+
+    def _run(self, func, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def get_next_participant(self) -> int:
+        return await self._run(self.experiment.get_next_participant)
+
+    async def add_participant_index(self, participant_index:int) -> bool:
+        """Same as `Experiment.add_participant_index`. Returns False if the participant is being added by another call."""
+        if participant_index in self.experiment.global_state:
+            return False
+        in_flight = self._admissions.get(participant_index)
+        if in_flight is not None:
+            await in_flight
+            return False
+        future = self._admissions[participant_index] = self._run(self.experiment.add_participant_index, participant_index)
+        try:
+            return await future
+        finally:
+            del self._admissions[participant_index]
+
+    async def reset_participant(self, participant_index:int|None) -> bool:
+        in_flight = self._resets.get(participant_index)
+        if in_flight is not None:
+            return await in_flight
+        future = self._resets[participant_index] = self._run(self.experiment.reset_participant, participant_index)
+        try:
+            return await future
+        finally:
+            del self._resets[participant_index]
+
+
+class _Fragments:
+    """
+    The HTML fragments of the web UI, rendered from the autoescaped templates in `templates/`.
+
+    The templates are loaded and compiled once. The fragments of a participant's config are
+    cached by the participant index, block id and `Experiment.config_version`, along with a
+    generation of the participant that is incremented when the participant changes (e.g., is
+    reset) or their config is edited (see `invalidate`).
+    """
+    def __init__(self, experiment:Experiment, cache_size:int=_FRAGMENT_CACHE_SIZE) -> None:
+        environment = jinja2.Environment(loader=jinja2.FileSystemLoader(Path(__file__).parent / "templates"), autoescape=True)
+        self._templates = {name: environment.get_template(name) for name in environment.list_templates()}
+        self.experiment = experiment
+        self.cache_size = cache_size
+        self.cache_stats = CacheStats()
+        self._cache: OrderedDict[Tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._participant_generations: Dict[int, int] = {}
+        experiment.on_participant_change_callback.append(self.invalidate)
+
+    def render(self, template_name:str, **context) -> str:
+        return self._templates[template_name].render(**context)
+
+    def render_config(self, template_name:str, participant_index:Optional[int]) -> Optional[str]:
+        """
+        Render `template_name` with the config of the participant's current block, or return
+        the cached fragment. Returns None if the participant is not in a block.
+        """
+        participant_state = self.experiment.get_participant_state(participant_index)
+        participant_index = participant_state.participant_index
+        # The key is read before the config, so a config loaded meanwhile is not cached as the new one
+        with self._lock:
+            key = (template_name, participant_index, participant_state.block_id, self.experiment.config_version,
+                   self._generation, self._participant_generations.get(participant_index, 0))
+            fragment = self._cache.get(key, None)
+            if fragment is not None:
+                self._cache.move_to_end(key)
+                self.cache_stats.hits += 1
+                return fragment
+            self.cache_stats.misses += 1
+
+        config = self.experiment.get_config(participant_index)
+        if config is None:
+            return None
+        fragment = self.render(template_name, config=config, read_only_keys=_READ_ONLY_CONFIG_KEYS)
+        with self._lock:
+            self._cache[key] = fragment
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return fragment
+
+    def invalidate(self, participant_index:Optional[int]) -> None:
+        """Drop the cached fragments of the participant, or of all participants if None."""
+        with self._lock:
+            if participant_index is None:
+                self._generation += 1
+            else:
+                self._participant_generations[participant_index] = self._participant_generations.get(participant_index, 0) + 1
+
+
 def _create_app(experiment:Experiment):
-    resource_parameters = {"experiment": experiment}
+    metrics = ServerMetrics(experiment)
+    resource_parameters = {"experiment": experiment, "executor": _ExperimentExecutor(experiment), "metrics": metrics}
+    web_parameters = dict(resource_parameters, fragments=_Fragments(experiment))
 
     static_location = (Path(__file__).parent  / "static" ).absolute()
-    
+    asset_parameters = {"assets": StaticAssets(static_location)}
+
     application = Application([
-        (r"/()",StaticFileHandler, {'path': str(static_location / "index.html")}),
-        (r"/index()",StaticFileHandler, {'path': str(static_location / "index.html")}),
-        (r"/web/([^/]+)", WebHandler, resource_parameters),
-        (r"/web/([^/]+)/([0-9]+)", WebHandler, resource_parameters),
+        (r"/()", IndexHandler, asset_parameters),
+        (r"/index()", IndexHandler, asset_parameters),
+        (r"/assets/([0-9a-f]+)/(.+)", AssetHandler, asset_parameters),
+        (r"/web/([^/]+)", WebHandler, web_parameters),
+        (r"/web/([^/]+)/([0-9]+)", WebHandler, web_parameters),
         (r"/api/([^/]+)", ExperimentHandler, resource_parameters),
         (r"/api/([^/]+)/([0-9]+)", ExperimentHandler, resource_parameters),
         (r"/api/([^/]+)/([0-9]+)/([0-9]+)", ExperimentHandler, resource_parameters),
+        (r"/metrics", MetricsHandler, {"metrics": metrics}),
         (r"/(.*)",StaticFileHandler, {'path': static_location, 'default_filename': "index.html"})
     ])
     return application
@@ -48,32 +179,109 @@ async def _init_api(config_file, default_participant_index, host="127.0.0.1", po
     experiment = Experiment(config_file, default_participant_index)
     application = _create_app(experiment=experiment)
     application.listen(port=port, address=host)
-    await asyncio.Event().wait()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # The allocations are written in the background, e.g., when interrupted
+        experiment.cohort_allocator.flush()
 
 
-def _server(config_file, default_participant_index, host="127.0.0.1", port=5000):
+def _server(config_file, default_participant_index, host="127.0.0.1", port=5000, hot_path_log_level="INFO", log_sample_rate=1.0):
+    # Done here so that the servers started with `server_process` are configured as well
+    configure_logging(hot_path_log_level=hot_path_log_level, request_log_sample_rate=log_sample_rate)
     asyncio.run(_init_api(config_file, default_participant_index, host, port))
 
 
-def server_process(config_file, default_participant_index=None, host="127.0.0.1", port="5000"):
+def server_process(config_file, default_participant_index=None, host="127.0.0.1", port="5000", hot_path_log_level="INFO", log_sample_rate=1.0):
     """Returns a Process object which can be used to launch experiment_server.
     For example:
     ```py
     p = server_process(config_file=config_file)
     p.start()
     ```
+    The server writes its logs to stderr from a background thread, with the per-request logs
+    at `hot_path_log_level` and only a `log_sample_rate` fraction of them written (see
+    `experiment_server._logging.configure_logging`).
     """
     p = Process(target=_server,
                 kwargs={
                     "default_participant_index":default_participant_index,
-                    "host":host, "port":port, "config_file":config_file
+                    "host":host, "port":port, "config_file":config_file,
+                    "hot_path_log_level":hot_path_log_level, "log_sample_rate":log_sample_rate,
                 })
     return p
 
 
-class WebHandler(RequestHandler):
-    def initialize(self, experiment:Experiment):
+def _participants_query(get_argument: Callable[[str], Optional[str]], names: Dict[str, str]) -> Dict[str, Any]:
+    """
+    The arguments of `Experiment.list_participants` from the query arguments of a request.
+
+    Args:
+        get_argument: Returns the value of a query argument or None.
+        names: Name of the query argument of each of `after`, `limit`, `active`, `block_name`,
+            `first` and `last`. Empty values are ignored.
+
+    Raises:
+        ValueError: If a value is invalid.
+    """
+    arguments = {}
+    for key, name in names.items():
+        value = get_argument(name)
+        if value is None or value == "":
+            continue
+        if key == "active":
+            if value not in ("true", "false"):
+                raise ValueError(f"`{name}` should be `true` or `false`, got {value}")
+            arguments[key] = value == "true"
+        elif key == "block_name":
+            arguments[key] = value
+        else:
+            try:
+                arguments[key] = int(value)
+            except ValueError:
+                raise ValueError(f"`{name}` should be an integer, got {value}") from None
+    limit = arguments.get("limit", DEFAULT_PARTICIPANTS_PAGE_SIZE)
+    if not 0 < limit <= _MAX_PARTICIPANTS_PAGE_SIZE:
+        raise ValueError(f"`{names['limit']}` should be > 0 and <= {_MAX_PARTICIPANTS_PAGE_SIZE}, got {limit}")
+    return arguments
+
+
+class _MetricsMixin:
+    """
+    Records the duration of each request in `ServerMetrics`, by the action (first path argument).
+
+    Only the handler's `ACTIONS` are recorded by name, other actions (and methods the handler
+    does not support) are recorded as "other", so requests cannot add series to the metrics.
+    """
+    ACTIONS: FrozenSet[str] = frozenset()
+
+    def on_finish(self):
+        action = self.path_args[0] if self.path_args else ""
+        if action not in self.ACTIONS:
+            action = "other"
+        method = self.request.method if self.request.method in self.SUPPORTED_METHODS else "other"
+        self.metrics.observe_request(self.__class__.__name__, method, action, self.get_status(), self.request.request_time())
+
+
+class MetricsHandler(RequestHandler):
+    def initialize(self, metrics:ServerMetrics):
+        self.metrics = metrics
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.write(self.metrics.render())
+
+
+class WebHandler(_MetricsMixin, RequestHandler):
+    ACTIONS = frozenset(("status-string", "acive-participant-change", "config", "config-editable", "reset-participant",
+                         "move-to-block", "move-to-next", "move-all-to-block", "new-participant", "add-participant",
+                         "list-participants", "update-config"))
+
+    def initialize(self, experiment:Experiment, executor:_ExperimentExecutor, metrics:ServerMetrics, fragments:_Fragments):
         self.experiment = experiment
+        self.executor = executor
+        self.metrics = metrics
+        self.fragments = fragments
         self.output_written: bool = False
 
     def write_to_output(self, message):
@@ -120,42 +328,8 @@ class WebHandler(RequestHandler):
 
         return participant_id
 
-    def _get_config_table(self, config) -> str:
-        table_output = "<table class=\"table\"><tr><th>key</th><th>value</th></tr>"
-        for k,v in config.items():
-            table_output += f"<tr><td>{k}</td><td>{v}</td></tr>"
-        btn  = """<button type="button" class="btn btn-primary"
-                          hx-get="/web/config-editable"
-                          hx-trigger="click"
-                          hx-include="#checkUseDefault,#txtPPID"
-                          hx-swap="none"/>Edit</button>"""
-
-        table_output += f"<tr><td></td><td>{btn}</td></tr>"
-        table_output += "</table>"
-        return table_output
-
-    def _get_editable_config_table(self, config) -> str:
-        table_output = """<form hx-post="/web/update-config" hx-include="#checkUseDefault,#txtPPID"><table class="table"><tr><th>key</th><th>value</th></tr>"""
-        for k,v in config.items():
-            if k in ["participant_index", "block_id", "name"]:
-                table_output += f"<tr><td>{k}</td><td>{v}</td></tr>"
-            else:
-                _name = f"_c_{k}"
-                table_output += f"<tr><td><label for={_name}>{k}</label></td><td><input type=\"text\" id={_name} name={_name} placeholder=\"{v}\"></td></tr>"
-
-        btn  = """<button type="submit" class="btn btn-primary" />Submit</button>
-                  <button type="button" class="btn btn-secondary"
-                          hx-get="/web/config"
-                          hx-trigger="click"
-                          hx-include="#checkUseDefault,#txtPPID"
-                          hx-swap="none"/>Cancel</button>"""
-
-        table_output += f"<tr><td></td><td>{btn}</td></tr>"
-        table_output += "</table></form>"
-        return table_output
-
     # NOTE: I am abusing the GET here!
-    def get(self, action=None):
+    async def get(self, action=None):
         if action in ["status-string", "acive-participant-change", "config", "config-editable", "reset-participant", "move-to-block", "move-to-next"]:
             participant_id = self._process_participant_id()
 
@@ -167,21 +341,21 @@ class WebHandler(RequestHandler):
                 self.write_to_output("")
 
             elif action == "config":
-                config = self.experiment.get_config(participant_id)
-                if config is not None:
-                    self.write_info(self._get_config_table(config))
+                config_table = self.fragments.render_config("config_table.html", participant_id)
+                if config_table is not None:
+                    self.write_info(config_table)
                 else:
                     self.write_warn(f"participant {participant_id} not active. A call to `/move-to-next` must be made before calling `/config`")
 
             elif action == "config-editable":
-                config = self.experiment.get_config(participant_id)
-                if config is not None:
-                    self.write_info(self._get_editable_config_table(config))
+                config_table = self.fragments.render_config("editable_config_table.html", participant_id)
+                if config_table is not None:
+                    self.write_info(config_table)
                 else:
                     self.write_warn(f"participant {participant_id} not active. A call to `/move-to-next` must be made before calling `/config`")
 
             elif action == "reset-participant":
-                self.experiment.reset_participant(participant_id)
+                await self.executor.reset_participant(participant_id)
                 _str = f"index {participant_id}" if participant_id is not None else "default index"
                 self.write_info(f"Reset config for all blocks for participant with {_str}")
 
@@ -223,7 +397,7 @@ class WebHandler(RequestHandler):
                 self.write_danger(e)
 
         elif action == "new-participant":
-            self.write_info("New participant id added: " + str(self.experiment.get_next_participant()))
+            self.write_info("New participant id added: " + str(await self.executor.get_next_participant()))
 
         elif action == "add-participant":
             new_participant_id = self.get_argument("newPPID", "-", True)
@@ -233,18 +407,22 @@ class WebHandler(RequestHandler):
                 self.write_danger("Invaid input")
                 return
 
-            added_participant = self.experiment.add_participant_index(new_participant_id)
+            added_participant = await self.executor.add_participant_index(new_participant_id)
             if not added_participant:
                 self.write_warn(f"Participant id {new_participant_id} already exists.")
             else:
                 self.write_info(f"Added new participant with id: {new_participant_id}")
 
         elif action == "list-participants":
-            table_output = "<table class=\"table\"><tr><th>participant ID</th><th>Block ID</th><th>Block Name</th></tr>"
-            for idx, state in self.experiment.global_state.items():
-                table_output += f"<tr><td>{idx}</td><td>{state.block_id}</td><td>{state.block_name}</td></tr>"
-            table_output += "</table>"
-            self.write_info(table_output)
+            try:
+                arguments = _participants_query(lambda name: self.get_argument(name, None, True), {
+                    "after": "after", "limit": "limit", "active": "selListActive",
+                    "block_name": "txtListBlock", "first": "txtListFirst", "last": "txtListLast"})
+            except ValueError as e:
+                self.write_danger(e)
+                return
+            participant_states, next_cursor = self.experiment.list_participants(**arguments)
+            self.write_info(self.fragments.render("participants_table.html", participant_states=participant_states, next_cursor=next_cursor))
 
     def post(self, action=None):
         participant_id = self._process_participant_id()
@@ -253,34 +431,54 @@ class WebHandler(RequestHandler):
             valid_submission = True
             config = self.experiment.get_config(participant_id)
             if config is not None:
+                values = {}
                 for key in config.keys():
-                    if key in ["participant_index", "block_id", "name"]:
+                    if key in _READ_ONLY_CONFIG_KEYS:
                         continue
                     try:
                         param_key = f"_c_{key}"
                         new_value = self.get_argument(param_key)
                         if len(new_value) == 0:
                             continue  # value was not set!
-                        new_value = json.loads(new_value)
-                        config[key] = new_value  # its a dict! it's a reference value!
+                        values[key] = json.loads(new_value)
                     except Exception as e:
                         logger.exception(f"Failed to process key {key} with {e}")
                         logger.error(f"Failed to process key {key} with {e}")
                         valid_submission = False
+                if values:
+                    self.experiment.update_config(values, participant_id)
 
             if valid_submission:
                 output = "<b>Update Successful</b></br>"
-                output += self._get_config_table(config)
+                output += self.fragments.render_config("config_table.html", participant_id) or ""
                 self.write_info(output)
             else:
                 output = "<b>Update Failed</b></br>"
-                output += self._get_editable_config_table(config)
+                output += self.fragments.render_config("editable_config_table.html", participant_id) or ""
                 self.write_warn(output)
 
 
-class ExperimentHandler(RequestHandler):
-    def initialize(self, experiment:Experiment):
+class ExperimentHandler(_MetricsMixin, RequestHandler):
+    ACTIONS = frozenset(("blocks-count", "block-id", "active", "config", "summary-data", "summary", "all-configs",
+                         "status-string", "participants", "move-to-next", "move-to-block", "move-all-to-block",
+                         "shutdown", "new-participant", "reserve-participants", "release-participant",
+                         "add-participant"))
+
+    def initialize(self, experiment:Experiment, executor:_ExperimentExecutor, metrics:ServerMetrics):
         self.experiment = experiment
+        self.executor = executor
+        self.metrics = metrics
+
+    def write_data(self, value: Any, indent: Optional[int] = None) -> None:
+        """Write `value` as MessagePack/CBOR if the client accepts it (see `_wire_format.negotiate`), as JSON otherwise."""
+        self.set_header("Vary", "Accept")
+        media_type = _wire_format.negotiate(self.request.headers.get("Accept", None))
+        if media_type is None:
+            # Tornado writes a dict as JSON with the `application/json` content type
+            self.write(value if isinstance(value, dict) and indent is None else json.dumps(value, indent=indent))
+        else:
+            self.set_header("Content-Type", media_type)
+            self.write(_wire_format.dumps(media_type, value))
 
     def get(self, action=None, param=None):
         # The experiment methods treat None as default pp
@@ -295,28 +493,56 @@ class ExperimentHandler(RequestHandler):
             return
 
         if action == "blocks-count":
-            self.write(json.dumps(self.experiment.get_blocks_count(participant_id)))
+            self.write_data(self.experiment.get_blocks_count(participant_id))
         elif action == "block-id":
-            self.write(json.dumps(self.experiment.get_participant_state(participant_id).block_id))
+            self.write_data(self.experiment.get_participant_state(participant_id).block_id)
         elif action == "active":
-            self.write(json.dumps(self.experiment.get_state(participant_id)))
+            self.write_data(self.experiment.get_state(participant_id))
         elif action == "config":
             config = self.experiment.get_config(participant_id)
             if config is not None:
-                logger.info(f"Config returned: {config}")
-                self.write(json.dumps(config, indent=4))
+                log_request("Config returned: {}", lambda: config)
+                self.write_data(config, indent=4)
             else:
                 self.set_status(406)
                 self.write(f"participant {participant_id} not active. A call to `/move-to-next` must be made before calling `/config`")
         elif action == "summary-data":
-            self.write({
+            self.write_data({
                 "participant_index": participant_id if participant_id is not None else self.experiment.default_participant_index,
                 "configs_length": self.experiment.get_blocks_count(participant_id)
             })
+        elif action == "summary":
+            self.write_data(self.experiment.get_summary())
         elif action == "all-configs":
-            self.write(json.dumps(self.experiment.get_all_configs(participant_id), indent=4))
+            since = self.get_argument("since", None, True)
+            if since is None:
+                self.write_data(self.experiment.get_all_configs(participant_id), indent=4)
+                return
+            try:
+                since = int(since)
+            except ValueError:
+                self.set_status(406)
+                self.write(f"`since` should be an integer, got {since}")
+                return
+            self.write_data(self.experiment.get_all_configs_delta(since, participant_id))
         elif action == "status-string":
             self.write(self.experiment.get_participant_state(participant_id).status_string().replace("\n", "&nbsp;&nbsp;&nbsp;"))
+        elif action == "participants":
+            try:
+                arguments = _participants_query(lambda name: self.get_argument(name, None, True), {
+                    "after": "after", "limit": "limit", "active": "active",
+                    "block_name": "block", "first": "first", "last": "last"})
+            except ValueError as e:
+                self.set_status(406)
+                self.write(str(e))
+                return
+            participant_states, next_cursor = self.experiment.list_participants(**arguments)
+            self.write_data({
+                "participants": [{"participant_index": state.participant_index, "block_id": state.block_id,
+                                  "block_name": state.block_name, "active": state.active}
+                                 for state in participant_states],
+                "next": next_cursor,
+            })
         else:
             self.set_status(404)
             self.write("N/A")
@@ -333,8 +559,8 @@ class ExperimentHandler(RequestHandler):
 
             try:
                 block_name = self.experiment.move_to_next(participant_id)
-                logger.info(f"Loading block: {self.experiment.get_participant_state(participant_id).block_name}\n")
-                self.write({"name": block_name})
+                log_request("Loading block: {}\n", lambda: block_name)
+                self.write_data({"name": block_name})
             except KeyError:
                 self.write(f"Participant with ID {participant_id} not known. Consider initializing new participant.")
                 self.set_status(406)
@@ -377,26 +603,43 @@ class ExperimentHandler(RequestHandler):
         elif action == "shutdown":
             if self.experiment.watchdog is not None:
                 self.experiment.watchdog.end_watch()
+            self.experiment.cohort_allocator.flush()
             shutdown_server()
         else:
             self.set_status(404)
             self.write("n/a")
 
-    def put(self, action=None, param=None):
+    async def put(self, action=None, param=None):
         if action == "new-participant":
             if param != None:
                 self.set_status(406)
                 self.write("`new-participant` doesn't take params")
             else:
-                self.write(str(self.experiment.get_next_participant()))
+                self.write(str(await self.executor.get_next_participant()))
+        elif action == "reserve-participants":
+            count = self._get_int_from_param(param)
+            if count is not None:
+                if count < 1:
+                    self.set_status(406)
+                    self.write("param should be > 0")
+                else:
+                    reserved = self.experiment.reserve_participant_indices(count)
+                    self.write_data({"first": reserved.start, "last": reserved.stop - 1})
+        elif action == "release-participant":
+            participant_id = self._get_int_from_param(param)
+            if participant_id is not None:
+                released = self.experiment.release_participant_index(participant_id)
+                if not released:
+                    self.set_status(406)
+                self.write_data(released)
         elif action == "add-participant":
             participant_id = self._get_int_from_param(param)
             if participant_id is not None:
                 try:
-                    added_participant = self.experiment.add_participant_index(participant_id)
+                    added_participant = await self.executor.add_participant_index(participant_id)
                     if not added_participant:
                         self.set_status(406)
-                    self.write(json.dumps(added_participant))
+                    self.write_data(added_participant)
                 except ExperimentServerConfigurationException as e:
                     self.set_status(406)
                     self.write(e.message if e.message is not None else str(e.args))
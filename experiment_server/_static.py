@@ -0,0 +1,164 @@
+"""Serving the static files of the web UI with content-hashed URLs and precompressed bodies."""
+import gzip
+import hashlib
+import mimetypes
+from pathlib import Path
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+from tornado.web import RequestHandler
+
+try:
+    import brotli  # type: ignore
+except ImportError:
+    brotli = None
+
+
+# Directories of `static/` with assets referred to from the pages.
+_ASSET_DIRECTORIES = ("css", "js")
+# Assets are compressed if they are at least this large (bytes) and of one of these types.
+_MIN_COMPRESSED_SIZE = 1024
+_COMPRESSED_SUFFIXES = (".css", ".js", ".html", ".svg", ".json", ".txt")
+# Cache-Control of the assets, their URL changes when their content changes.
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class _Asset:
+    """A static file: its content, the hash of the content and its compressed bodies (created when first requested)."""
+    __slots__ = ("content", "content_type", "content_hash", "compressible", "_encoded")
+
+    def __init__(self, content: bytes, content_type: str, compressible: bool) -> None:
+        self.content = content
+        self.content_type = content_type
+        self.content_hash = hashlib.sha256(content).hexdigest()[:16]
+        self.compressible = compressible
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        """The content compressed with `encoding` ("br" or "gzip"), or as is if None."""
+        if encoding is None:
+            return self.content
+        try:
+            return self._encoded[encoding]
+        except KeyError:
+            pass
+        if encoding == "br":
+            body = brotli.compress(self.content)
+        else:
+            # mtime=0 makes the body the same each time it is created
+            body = gzip.compress(self.content, compresslevel=9, mtime=0)
+        self._encoded[encoding] = body
+        return body
+
+
+class StaticAssets:
+    """
+    The files in `static/css` and `static/js`, and the `index.html` referring to them.
+
+    The files are read once. Each asset is served at `/assets/<content hash>/<path>`, which
+    changes when its content changes, so it can be cached by browsers indefinitely. The
+    references to the assets in `index.html` (e.g. `src="/js/htmx-1.9.10.js"`) are replaced by
+    their hashed URLs, and `index.html` is served with an ETag of its content (and encoding),
+    so a reload of the page only needs a 304 response when nothing changed.
+
+    The assets are compressed with gzip (and brotli, if the `brotli` package is installed)
+    the first time they are requested with that encoding, and the compressed bodies are kept.
+    """
+    def __init__(self, static_dir: Union[str, Path]) -> None:
+        self.static_dir = Path(static_dir)
+        self.assets: Dict[str, _Asset] = {}
+        for directory in _ASSET_DIRECTORIES:
+            for path in sorted((self.static_dir / directory).rglob("*")):
+                if path.is_file():
+                    self.assets[path.relative_to(self.static_dir).as_posix()] = _read_asset(path)
+        self.index = self._page("index.html")
+
+    def url(self, path: str) -> str:
+        """The content-hashed URL of the asset at `path` (relative to `static/`)."""
+        return f"/assets/{self.assets[path].content_hash}/{path}"
+
+    def _page(self, name: str) -> _Asset:
+        """The page `name` with the references to the assets replaced by their hashed URLs."""
+        page = (self.static_dir / name).read_text(encoding="utf-8")
+        page = re.sub(r'(src|href)="/((?:%s)/[^"]+)"' % "|".join(_ASSET_DIRECTORIES),
+                      lambda m: f'{m.group(1)}="{self.url(m.group(2))}"' if m.group(2) in self.assets else m.group(0),
+                      page)
+        return _Asset(page.encode("utf-8"), "text/html; charset=UTF-8", True)
+
+
+def _read_asset(path: Path) -> _Asset:
+    content = path.read_bytes()
+    content_type, _ = mimetypes.guess_type(path.name)
+    if content_type is None:
+        content_type = "application/octet-stream"
+    elif content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=UTF-8"
+    return _Asset(content, content_type, path.suffix in _COMPRESSED_SUFFIXES and len(content) >= _MIN_COMPRESSED_SIZE)
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for a request with the `Accept-Encoding` header `accept_encoding`: "br", "gzip" or None."""
+    accepted: List[Tuple[str, float]] = []
+    for value in accept_encoding.split(","):
+        encoding, _, params = value.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted.append((encoding.strip().lower(), quality))
+    qualities = dict(accepted)
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if qualities.get(encoding, 0.0) > 0:
+            return encoding
+    return None
+
+
+class _StaticAssetMixin:
+    def initialize(self, assets: StaticAssets) -> None:
+        self.assets = assets
+
+    def compute_etag(self) -> Optional[str]:
+        # The ETag is set from the content hash instead of hashing each response
+        return None
+
+    def write_asset(self, asset: _Asset) -> None:
+        self.set_header("Content-Type", asset.content_type)
+        if asset.compressible:
+            self.set_header("Vary", "Accept-Encoding")
+            encoding = _accepted_encoding(self.request.headers.get("Accept-Encoding", ""))
+        else:
+            encoding = None
+        if encoding is None:
+            self.set_header("ETag", f'"{asset.content_hash}"')
+        else:
+            self.set_header("Content-Encoding", encoding)
+            # Each encoding is a different body, so it has its own (strong) ETag
+            self.set_header("ETag", f'"{asset.content_hash}-{encoding}"')
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.write(asset.encoded(encoding))
+
+
+class IndexHandler(_StaticAssetMixin, RequestHandler):
+    """Serves `index.html`, which browsers revalidate on each load (see `StaticAssets`)."""
+    def get(self, _=None) -> None:
+        self.set_header("Cache-Control", "no-cache")
+        self.write_asset(self.assets.index)
+
+
+class AssetHandler(_StaticAssetMixin, RequestHandler):
+    """Serves the assets at their content-hashed URLs, see `StaticAssets`."""
+    def get(self, content_hash: str, path: str) -> None:
+        asset = self.assets.assets.get(path, None)
+        if asset is None or asset.content_hash != content_hash:
+            self.set_status(404)
+            self.write("N/A")
+            return
+        self.set_header("Cache-Control", _IMMUTABLE_CACHE_CONTROL)
+        self.write_asset(asset)
@@ -0,0 +1,99 @@
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from tabulate import tabulate
+
+
+class Span:
+    """A stage of processing a config: its name, start time and duration (in seconds) and attributes (e.g., sizes)."""
+    __slots__ = ("name", "start", "duration", "attributes", "thread_id")
+
+    def __init__(self, name: str, start: float, duration: float, attributes: Dict[str, Any], thread_id: int) -> None:
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attributes = attributes
+        self.thread_id = thread_id
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(name={self.name!r}, duration={self.duration!r}, attributes={self.attributes!r})"
+
+
+class Tracer:
+    """Collects the spans recorded while it is active, see `trace`."""
+    def __init__(self, callback: Optional[Callable[[Span], None]] = None) -> None:
+        self.spans: List[Span] = []
+        self.callback = callback
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """Record the time taken by the body as a span. The yielded attributes can be updated in the body."""
+        start = time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            span = Span(name, start, time.perf_counter() - start, attributes, threading.get_ident())
+            self.spans.append(span)
+            if self.callback is not None:
+                self.callback(span)
+
+    def breakdown(self) -> List[List[Any]]:
+        """Rows of (stage, count, total ms, mean ms, max ms) for each span name, in the order first seen."""
+        durations: Dict[str, List[float]] = {}
+        for span in self.spans:
+            durations.setdefault(span.name, []).append(span.duration * 1000)
+        return [[name, len(d), sum(d), sum(d) / len(d), max(d)] for name, d in durations.items()]
+
+    def format_breakdown(self) -> str:
+        return tabulate(self.breakdown(), headers=["stage", "count", "total (ms)", "mean (ms)", "max (ms)"], floatfmt=".3f")
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """The spans in the Chrome trace event format, can be loaded in chrome://tracing or https://ui.perfetto.dev."""
+        pid = os.getpid()
+        return {
+            "traceEvents": [
+                {"name": span.name, "ph": "X", "ts": span.start * 1e6, "dur": span.duration * 1e6,
+                 "pid": pid, "tid": span.thread_id, "args": span.attributes}
+                for span in self.spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+
+_current_tracer: ContextVar[Optional[Tracer]] = ContextVar("experiment_server_tracer", default=None)
+
+
+@contextmanager
+def trace(callback: Optional[Callable[[Span], None]] = None) -> Iterator[Tracer]:
+    """
+    Record the stages of processing configs (e.g., `process_config_file`) in the body as spans.
+
+    Args:
+        callback: Optional callable called with each `Span` when it ends.
+
+    Returns:
+        The `Tracer` with the recorded spans, e.g.:
+        ```py
+        with trace() as tracer:
+            process_config_file("config.toml", 1)
+        print(tracer.format_breakdown())
+        ```
+    """
+    tracer = Tracer(callback)
+    token = _current_tracer.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current_tracer.reset(token)
+
+
+def span(name: str, **attributes):
+    """Context manager recording a span if tracing (see `trace`), otherwise does nothing."""
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return nullcontext(attributes)
+    return tracer.span(name, **attributes)
@@ -6,19 +6,27 @@ Usage:
 """
 from __future__ import annotations
 
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
 from dataclasses import dataclass
+from functools import partial
+import hashlib
 import json
 import os
 from pathlib import Path
 import re
+import threading
 from typing import Any, Callable, Dict, List, Optional, Iterable, Tuple
 from loguru import logger
 import asyncio
+from rich.style import Style
 from tabulate import tabulate
 
 from textual.app import App, ComposeResult
 from textual.containers import Grid, Horizontal, Vertical, VerticalScroll,HorizontalGroup, VerticalGroup
 from textual.screen import ModalScreen
+from textual.timer import Timer
+from textual.worker import get_current_worker
 from textual.document._document import Document
 from textual.widgets import (
     DirectoryTree,
@@ -39,8 +47,9 @@ from textual.widgets import (
     Switch,
     TextArea
 )
-from experiment_server._api import Experiment, _generate_config_json
-from experiment_server._process_config import _process_config, _get_table_for_participants, verify_config
+from experiment_server._api import Experiment, ParticipantState, _generate_config_json
+from experiment_server._config_diagnostics import ConfigDiagnostics, Diagnostic
+from experiment_server._process_config import _PREVIEW_PARTICIPANTS, _process_config, _ordering_table, check_orderings, compile_config, verify_config
 from experiment_server.utils import new_config_file
 from experiment_server._server import start_server_in_current_ioloop
 import toml  # type: ignore
@@ -253,12 +262,176 @@ class SnippetSelectionScreen(ModalScreen[EditSnippet]):
         self.snippet_insert_location_label.update(insert_location_text)
 
 
+# Refreshes requested within this interval (seconds) are done together, at most once per interval
+_REFRESH_INTERVAL = 1 / 20
+
+
+class RefreshScheduler:
+    """
+    Coalesces the refreshes of the UI.
+
+    `request` can be called from any thread (e.g., the thread watching the config file or the
+    threads of the server). The requested callbacks are called on the Textual loop, at most once
+    per `interval`: a callback requested again before it is called is only called once. Callbacks
+    requested while refreshing are called in the same refresh, unless they were already called.
+
+    The number of requests, requests merged into a pending refresh, callbacks called, requests
+    dropped (e.g., after the loop is closed) and callbacks that failed are kept in `stats`.
+    """
+    def __init__(self, interval: float = _REFRESH_INTERVAL) -> None:
+        self.interval = interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        # Dicts are used as ordered sets, callbacks are called in the order requested
+        self._pending: Dict[Callable[[], None], None] = {}
+        self._scheduled = False
+        self._last_refresh_time = 0.0
+        self.stats = {"requested": 0, "merged": 0, "refreshed": 0, "dropped": 0, "failed": 0}
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Call the callbacks on `loop`. Callbacks requested before are called in the first refresh."""
+        self._loop = loop
+        with self._lock:
+            schedule = len(self._pending) > 0 and not self._scheduled
+            self._scheduled = self._scheduled or schedule
+        if schedule:
+            self._schedule()
+
+    def request(self, callback: Callable[[], None]) -> None:
+        """Call `callback` in the next refresh, if it is not already requested."""
+        with self._lock:
+            self.stats["requested"] += 1
+            if callback in self._pending:
+                self.stats["merged"] += 1
+                return
+            self._pending[callback] = None
+            if self._scheduled or self._loop is None:
+                return
+            self._scheduled = True
+        self._schedule()
+
+    def _schedule(self) -> None:
+        assert self._loop is not None
+        try:
+            self._loop.call_soon_threadsafe(self._schedule_refresh)
+        except RuntimeError:
+            # The loop is closed, the app has exited
+            with self._lock:
+                self.stats["dropped"] += len(self._pending)
+                self._pending.clear()
+                self._scheduled = False
+
+    def _schedule_refresh(self) -> None:
+        assert self._loop is not None
+        delay = max(0.0, self._last_refresh_time + self.interval - self._loop.time())
+        self._loop.call_later(delay, self._refresh)
+
+    def _refresh(self) -> None:
+        assert self._loop is not None
+        self._last_refresh_time = self._loop.time()
+        refreshed = set()
+        while True:
+            with self._lock:
+                callbacks = [c for c in self._pending if c not in refreshed]
+                for callback in callbacks:
+                    del self._pending[callback]
+                if len(callbacks) == 0:
+                    # Callbacks requested again after they were called are left for the next refresh
+                    self._scheduled = len(self._pending) > 0
+                    break
+            for callback in callbacks:
+                refreshed.add(callback)
+                try:
+                    callback()
+                    self.stats["refreshed"] += 1
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    logger.exception(f"Failed to refresh {callback}: {e}")
+        if self._scheduled:
+            self._schedule_refresh()
+
+
+def _add_log_view_sink(log_view: RichLog, refresh_scheduler: RefreshScheduler) -> None:
+    """Write the logs to `log_view`, the messages logged between two refreshes are written together."""
+    messages: deque[str] = deque()
+
+    def write_messages():
+        while len(messages) > 0:
+            log_view.write(messages.popleft())
+
+    def textual_sink(message):
+        # message is a Loguru Message object; str(message) is the formatted text
+        messages.append(str(message))
+        refresh_scheduler.request(write_messages)
+    # Add Textual sink (enqueue=True for thread safety)
+    logger.add(textual_sink, enqueue=True)
+
+
+# Number of order previews and verification results kept, by the hash of the config text
+_CONFIG_RESULTS_CACHE_SIZE = 32
+
+
+class _ContentCache:
+    """
+    The results computed from the most recently used config texts, keyed by the hash of the text.
+
+    Results are put from the workers' threads and read from the UI thread.
+    """
+    def __init__(self, max_size: int = _CONFIG_RESULTS_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._results: OrderedDict[str, Any] = OrderedDict()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """The result for `key` or None."""
+        with self._lock:
+            result = self._results.get(key, None)
+            if result is not None:
+                self._results.move_to_end(key)
+        return result
+
+    def put(self, key: str, result: Any) -> None:
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+
+# Number of participants shown in a page of the participants table
+_PARTICIPANTS_PAGE_SIZE = 100
+
+# Seconds without edits before the whole config being edited is compiled and checked
+_FULL_CHECK_DELAY = 0.5
+# Number of diagnostics listed below the config editor
+_MAX_LISTED_DIAGNOSTICS = 10
+
+
 class ParticipantTab(Vertical):
-    """Participant management tab."""
-    def __init__(self, experiment:Optional[Experiment]):
+    """
+    Participant management tab.
+
+    The participants table shows a page of participants. It is updated from the experiment's
+    `on_participant_change_callback`: only the rows of the participants that changed are
+    updated, the page is reloaded when participants are added to it and everything is
+    reloaded when all participants change (e.g., the config is reloaded).
+    """
+    def __init__(self, experiment:Optional[Experiment], refresh_scheduler:RefreshScheduler):
         super().__init__()
         self.experiment:Optional[Experiment] = None
         self.__experiment_parameter = experiment
+        self._refresh_scheduler = refresh_scheduler
+
+        # Sorted indices of the participants, to find the participants in a page
+        self._participant_indices: List[int] = []
+        self._participants_page = 0
+        # Changes not yet shown in the table. None in the set means all participants changed.
+        self._changed_participants: set[Optional[int]] = set()
+        self._changed_participants_lock = threading.Lock()
 
         # Widgets
         self.update_ppid_input = Input(placeholder="", id="update_ppid_input")
@@ -266,6 +439,7 @@ class ParticipantTab(Vertical):
         self.block_input = Input(placeholder="block id", id="block_input")
         self.block_all_input = Input(placeholder="block id (for all)", id="block_all_input")
         self.participants_table = DataTable(id="participants_table")
+        self.participants_page_label = Static("", id="participants_page_label")
         self.config_pretty = Pretty("", id="config_pretty")
 
         self.monitor_default_switch = Switch(value=True)
@@ -273,15 +447,18 @@ class ParticipantTab(Vertical):
         self.participant_id_to_add_input = Input(placeholder="participant id", id="participant_id_to_add_input")
         self.edit_container = Grid(id="edit_container")
 
-        self.participants_table.add_column("participant_id")
-        self.participants_table.add_column("block_id")
-        self.participants_table.add_column("block_name")
-        self.participants_table.add_column("active")
+        self.participants_table.add_column("participant_id", key="participant_id")
+        self.participants_table.add_column("block_id", key="block_id")
+        self.participants_table.add_column("block_name", key="block_name")
+        self.participants_table.add_column("active", key="active")
 
         # editable inputs map when editing config
         self._edit_inputs: Dict[str, Input] = {}
 
     def set_experiment(self, experiment: Optional[Experiment]):
+        if self.experiment is not None:
+            self.experiment.on_participant_change_callback.remove(self.participant_changed_callback)
+
         self.experiment = experiment
         disabled_state = self.experiment is None
 
@@ -297,6 +474,10 @@ class ParticipantTab(Vertical):
         for switch in query_result:
             switch.disabled = disabled_state
 
+        if self.experiment is not None:
+            self.experiment.on_participant_change_callback.append(self.participant_changed_callback)
+        self._participants_page = 0
+        self.load_participants()
         self.refresh_ui()
 
     def on_mount(self):
@@ -327,6 +508,10 @@ class ParticipantTab(Vertical):
             with Collapsible(title="All participants states:", id="collapse_states"):
                 yield self.participants_table
                 with Grid(id="states_grid"):
+                    yield Button("Previous page", id="btn_participants_previous_page")
+                    yield self.participants_page_label
+                    yield Button("Next page", id="btn_participants_next_page")
+
                     yield Static()  # empty grid
                     yield self.block_all_input
                     yield Button("Move all to block", id="btn_move_all_to_block")
@@ -360,6 +545,10 @@ class ParticipantTab(Vertical):
             return None
 
     def refresh_ui(self) -> None:
+        """Refresh in the next frame, see `RefreshScheduler`."""
+        self._refresh_scheduler.request(self._refresh_ui)
+
+    def _refresh_ui(self) -> None:
         if self.experiment is None:
             return
 
@@ -374,16 +563,6 @@ class ParticipantTab(Vertical):
         self.update_ppid_input.placeholder = str(self.experiment.default_participant_index)
         self.status_box.update(status.replace("\n", " | "))
 
-        # participants
-        try:
-            # rebuild table to avoid stale columns/rows
-            self.participants_table.clear()
-            for idx, st in sorted(self.experiment.global_state.items()):
-                self.participants_table.add_row(str(idx), str(st.block_id), str(st.block_name), str(st.active))
-        except Exception:
-            # If experiment not loaded, leave table empty
-            pass
-
         # config display
         try:
             cfg = self.experiment.get_config(pid)
@@ -395,6 +574,84 @@ class ParticipantTab(Vertical):
         except Exception as e:
             self.config_pretty.update(f"Error: {e}")
 
+    # Participants table
+    def participant_changed_callback(self, participant_index: Optional[int]) -> None:
+        """Queue the change to be shown in the table, can be called from any thread."""
+        with self._changed_participants_lock:
+            self._changed_participants.add(participant_index)
+        self._refresh_scheduler.request(self.update_participants)
+
+    def update_participants(self) -> None:
+        """Show the queued changes in the table."""
+        with self._changed_participants_lock:
+            changed_participants, self._changed_participants = self._changed_participants, set()
+        if self.experiment is None:
+            return
+        if None in changed_participants:
+            self.load_participants()
+            return
+
+        page_start, page_end = self._page_bounds()
+        reload_page = False
+        for participant_index in sorted(changed_participants):
+            position = bisect_left(self._participant_indices, participant_index)
+            if position == len(self._participant_indices) or self._participant_indices[position] != participant_index:
+                # A new participant moves the rows after it by one
+                insort(self._participant_indices, participant_index)
+                reload_page = reload_page or position < page_end
+            elif page_start <= position < page_end and not reload_page:
+                self._update_participant_row(participant_index)
+
+        if reload_page:
+            self._load_participants_page()
+        else:
+            self._update_page_label()
+
+    def load_participants(self) -> None:
+        """Reload all participants and the current page."""
+        with self._changed_participants_lock:
+            self._changed_participants.clear()
+        if self.experiment is None:
+            self._participant_indices = []
+        else:
+            self._participant_indices = sorted(self.experiment.global_state.keys())
+        self._load_participants_page()
+
+    def _page_bounds(self) -> Tuple[int, int]:
+        """Positions in `_participant_indices` of the first participant of the page and after the last one."""
+        pages_count = max(1, -(-len(self._participant_indices) // _PARTICIPANTS_PAGE_SIZE))
+        self._participants_page = min(max(0, self._participants_page), pages_count - 1)
+        page_start = self._participants_page * _PARTICIPANTS_PAGE_SIZE
+        return page_start, page_start + _PARTICIPANTS_PAGE_SIZE
+
+    def _load_participants_page(self) -> None:
+        self.participants_table.clear()
+        page_start, page_end = self._page_bounds()
+        if self.experiment is not None:
+            global_state = self.experiment.global_state
+            for participant_index in self._participant_indices[page_start: page_end]:
+                self.participants_table.add_row(*self._participant_row(global_state[participant_index]), key=str(participant_index))
+        self._update_page_label()
+
+    def _update_participant_row(self, participant_index: int) -> None:
+        assert self.experiment is not None
+        row = self._participant_row(self.experiment.global_state[participant_index])
+        for column_key, value in zip(("participant_id", "block_id", "block_name", "active"), row):
+            self.participants_table.update_cell(str(participant_index), column_key, value)
+
+    def _participant_row(self, state: ParticipantState) -> Tuple[str, str, str, str]:
+        return str(state.participant_index), str(state.block_id), str(state.block_name), str(state.active)
+
+    def _update_page_label(self) -> None:
+        page_start, _ = self._page_bounds()
+        participants_count = len(self._participant_indices)
+        page_end = min(page_start + _PARTICIPANTS_PAGE_SIZE, participants_count)
+        self.participants_page_label.update(f"Participants {min(page_start + 1, participants_count)}-{page_end} of {participants_count}")
+
+    def change_participants_page(self, step: int) -> None:
+        self._participants_page += step
+        self._load_participants_page()
+
     # Actions (synchronous Experiment API usage)
     def move_next(self) -> None:
         if self.experiment is None:
@@ -443,9 +700,7 @@ class ParticipantTab(Vertical):
             return
 
         try:
-            self.participants_table.clear()
-            for idx, st in sorted(self.experiment.global_state.items()):
-                self.participants_table.add_row(str(idx), str(st.block_id), str(st.block_name), str(st.active))
+            self.load_participants()
             logger.info("Listed participants")
         except Exception as e:
             logger.error(f"Error listing participants: {e}")
@@ -661,21 +916,84 @@ class ParticipantTab(Vertical):
             self.cancel_edits()
         elif bid == "btn_update_ppid":
             self.update_ppid()
+        elif bid == "btn_participants_previous_page":
+            self.change_participants_page(-1)
+        elif bid == "btn_participants_next_page":
+            self.change_participants_page(1)
+
+
+class _ConfigTextArea(TextArea):
+    """
+    TOML editor that also highlights the ranges of the diagnostics of the config, see `ConfigEditor`.
+
+    `TextArea` has no public API for extra highlights, this extends its private highlight map and
+    theme. The versions of Textual it works with are pinned in `pyproject.toml` and checked by
+    `test_config_editor_highlights_diagnostics`.
+    """
+    _DIAGNOSTIC_HIGHLIGHT = "experiment_server.diagnostic"
+    _diagnostics: List[Diagnostic] = []
+
+    def set_diagnostics(self, diagnostics: List[Diagnostic]) -> None:
+        # Only the highlights of the diagnostics are replaced, the syntax highlights are kept
+        for diagnostic in self._diagnostics:
+            for row in range(diagnostic.start[0], diagnostic.end[0] + 1):
+                self._highlights[row] = [h for h in self._highlights[row] if h[2] != self._DIAGNOSTIC_HIGHLIGHT]
+        self._diagnostics = diagnostics
+        self._add_diagnostic_highlights()
+        self._line_cache.clear()
+        self.refresh()
+
+    def _add_diagnostic_highlights(self) -> None:
+        for diagnostic in self._diagnostics:
+            (start_row, start_column), (end_row, end_column) = diagnostic.start, diagnostic.end
+            if start_row == end_row:
+                self._highlights[start_row].append((start_column, end_column, self._DIAGNOSTIC_HIGHLIGHT))
+                continue
+            self._highlights[start_row].append((start_column, None, self._DIAGNOSTIC_HIGHLIGHT))
+            for row in range(start_row + 1, end_row):
+                self._highlights[row].append((0, None, self._DIAGNOSTIC_HIGHLIGHT))
+            self._highlights[end_row].append((0, end_column, self._DIAGNOSTIC_HIGHLIGHT))
+
+    def _build_highlight_map(self) -> None:
+        super()._build_highlight_map()
+        self._add_diagnostic_highlights()
+
+    def _set_theme(self, theme: str) -> None:
+        super()._set_theme(theme)
+        # The syntax styles are shared with the theme, add the style of the diagnostics to a copy
+        self._theme.syntax_styles = dict(self._theme.syntax_styles)
+        self._theme.syntax_styles[self._DIAGNOSTIC_HIGHLIGHT] = Style(color="red", underline=True)
 
 
 class ConfigEditor(VerticalScroll):
     """Config editor widget."""
 
-    def __init__(self, config_file:Optional[str|Path]):
+    def __init__(self, config_file:Optional[str|Path], refresh_scheduler:RefreshScheduler):
         super().__init__()
         self.__config_file = config_file
+        self._refresh_scheduler = refresh_scheduler
 
         self.config_edit_message = Static("", classes="message_box")
         self.config_order_log = RichLog(id="order_table")
         self._config_file_box_temp_msg:Optional[str] = None
-        self.config_edit_text = TextArea.code_editor(language="toml", read_only=True)
+        self.config_edit_text = _ConfigTextArea.code_editor(language="toml", read_only=True)
         self.config_edit_text_path:Optional[Path] = None
 
+        # Sections are checked as the text changes, the whole config once the edits pause
+        self.config_diagnostics_message = Static("", id="config_diagnostics")
+        self.config_diagnostics_message.display = False
+        self.config_diagnostics = ConfigDiagnostics()
+        self._diagnostics:List[Diagnostic] = []
+        self._full_check_results = _ContentCache()
+        self._full_check_key:Optional[str] = None
+        self._full_check_error:Optional[str] = None
+        self._full_check_timer:Optional[Timer] = None
+
+        # The order preview and verification run in workers, the results are cached by content
+        self._order_previews = _ContentCache()
+        self._verification_results = _ContentCache()
+        self._order_preview_key:Optional[str] = None
+
         self._edit_search_section_header = re.compile(r'^[ \t]*\[{1,2}[^\]]+\]{1,2}[ \t]*$', re.MULTILINE | re.IGNORECASE)
         self._edit_search_config_section = re.compile(r'^[ \t]*\[configuration\][ \t]*$', re.MULTILINE | re.IGNORECASE)
         self._edit_search_config_variables_section = re.compile(r'^[ \t]*\[configuration.variables\][ \t]*$', re.MULTILINE | re.IGNORECASE)
@@ -689,7 +1007,7 @@ class ConfigEditor(VerticalScroll):
     def compose(self):
         with VerticalScroll():
             yield Static("This is a simple editor. Use preferred text editor for advanced editing operations.")
-            with Collapsible(title="Example ordering for 5 participants"):
+            with Collapsible(title=f"Example ordering for {_PREVIEW_PARTICIPANTS} participants"):
                 yield self.config_order_log
             with HorizontalGroup():
                 yield Static("On save config will try to autoload")
@@ -701,6 +1019,7 @@ class ConfigEditor(VerticalScroll):
                 yield Button("Insert snippet", id="btn_insert_snippet", disabled=True)
                 yield Button("Save config", id="btn_save_config", disabled=True)
                 yield Button("Cancel", id="btn_cancel_config_edit", disabled=True)
+            yield self.config_diagnostics_message
             yield self.config_edit_text
         self.refresh_ui()
 
@@ -777,18 +1096,37 @@ class ConfigEditor(VerticalScroll):
         self.app.push_screen(SnippetSelectionScreen(), _callback)
 
     def save_config(self):
-        replace_match = re.search(self._edit_search_replace_tags, self.config_edit_text.text)
+        text = self.config_edit_text.text
+        replace_match = re.search(self._edit_search_replace_tags, text)
         if replace_match is not None:
             assert isinstance(self.config_edit_text.document, Document)
             replace_location = self.config_edit_text.document.get_location_from_index(replace_match.start())
-            reason = f"Found unreplaced snippet placeholder on line {replace_location[0] + 1}"
-            success = False
-        else:
-            with tempfile.NamedTemporaryFile(mode="w+t", suffix=".toml", delete=False) as f:
-                f.write(self.config_edit_text.text)
-                f.close()
-                success, reason = verify_config(f.name)
-            os.remove(f.name)
+            self._save_verified_config(text, False, f"Found unreplaced snippet placeholder on line {replace_location[0] + 1}")
+            return
+
+        key = _ContentCache.key(text)
+        verification_result = self._verification_results.get(key)
+        if verification_result is not None:
+            self._save_verified_config(text, *verification_result)
+            return
+        self.config_edit_message.update("(Verifying config...)")
+        # Saving again while verifying cancels the earlier verification
+        self.run_worker(partial(self._verify_config_worker, self.app, text, key), group="verify_config", exclusive=True, thread=True)
+
+    def _verify_config_worker(self, app: App, text: str, key: str) -> None:
+        """Verify `text` in a worker thread, then save it from the UI loop."""
+        with tempfile.NamedTemporaryFile(mode="w+t", suffix=".toml", delete=False) as f:
+            f.write(text)
+            f.close()
+            success, reason = verify_config(f.name)
+        os.remove(f.name)
+        self._verification_results.put(key, (success, reason))
+        if not get_current_worker().is_cancelled:
+            app.call_from_thread(self._save_verified_config, text, success, reason)
+
+    def _save_verified_config(self, text: str, success: bool, reason: Optional[str]) -> None:
+        """Save `text` if it is valid, otherwise ask before saving."""
+        self.config_edit_message.update("")
 
         def _callback(is_yes:Optional[bool]):
             if not is_yes:
@@ -806,7 +1144,7 @@ class ConfigEditor(VerticalScroll):
 
             assert self.__config_file is not None
             with open(self.__config_file, "w") as f:
-                f.write(self.config_edit_text.text)
+                f.write(text)
             self.refresh_ui()
 
         if success:
@@ -842,7 +1180,64 @@ class ConfigEditor(VerticalScroll):
         elif bid == "btn_cancel_config_edit":
             self.cancel_config_edit()
 
+    def on_text_area_changed(self, event: TextArea.Changed) -> None:
+        if event.text_area is not self.config_edit_text:
+            return
+        self._update_diagnostics()
+        if self._full_check_timer is not None:
+            self._full_check_timer.stop()
+        self._full_check_timer = self.set_timer(_FULL_CHECK_DELAY, self._start_full_check)
+
+    def _update_diagnostics(self) -> None:
+        """Check the sections of the config that changed, using the tree-sitter tree the editor updates on each edit."""
+        syntax_tree = getattr(self.config_edit_text.document, "_syntax_tree", None)
+        if syntax_tree is None:
+            return
+        self._diagnostics = self.config_diagnostics.update(syntax_tree, self.config_edit_text.text.encode())
+        self.config_edit_text.set_diagnostics(self._diagnostics)
+        self._show_diagnostics()
+
+    def _start_full_check(self) -> None:
+        """Compile the config and check the orders, as `verify_config` does, in a worker unless the text was checked before."""
+        text = self.config_edit_text.text
+        key = self._full_check_key = _ContentCache.key(text)
+        error = self._full_check_results.get(key)
+        if error is not None:
+            self._full_check_done(key, error)
+            return
+        self.run_worker(partial(self._full_check_worker, self.app, text, key), group="full_check", exclusive=True, thread=True)
+
+    def _full_check_worker(self, app: App, text: str, key: str) -> None:
+        try:
+            check_orderings(compile_config(toml.loads(text)))
+            error = ""
+        except Exception as e:
+            error = str(e)
+        self._full_check_results.put(key, error)
+        if not get_current_worker().is_cancelled:
+            app.call_from_thread(self._full_check_done, key, error)
+
+    def _full_check_done(self, key: str, error: str) -> None:
+        # Only the result of the latest text is shown
+        if key != self._full_check_key:
+            return
+        self._full_check_error = error or None
+        self._show_diagnostics()
+
+    def _show_diagnostics(self) -> None:
+        lines = [f"Line {diagnostic.start[0] + 1}: {diagnostic.message}" for diagnostic in self._diagnostics[:_MAX_LISTED_DIAGNOSTICS]]
+        if len(self._diagnostics) > _MAX_LISTED_DIAGNOSTICS:
+            lines.append(f"... and {len(self._diagnostics) - _MAX_LISTED_DIAGNOSTICS} more")
+        if self._full_check_error is not None:
+            lines.append(f"Config: {self._full_check_error}")
+        self.config_diagnostics_message.update("\n".join(lines))
+        self.config_diagnostics_message.display = len(lines) > 0
+
     def refresh_ui(self):
+        """Refresh in the next frame, see `RefreshScheduler`."""
+        self._refresh_scheduler.request(self._refresh_ui)
+
+    def _refresh_ui(self):
         self.config_order_log.clear()
         if self.__config_file is None:
             self.config_order_log.write("No config to load")
@@ -859,12 +1254,7 @@ class ConfigEditor(VerticalScroll):
                 length_of_last_line = len(self.config_edit_text.document[last_line])
                 self.config_edit_text.replace(new_text, (0, 0), (last_line, length_of_last_line))
 
-        try:
-            order_table_out = _get_table_for_participants(self.__config_file)
-            order_table_out = tabulate(order_table_out, headers='firstrow', tablefmt='fancy_grid')
-        except Exception as e:
-            order_table_out = f"Failed to load {self.__config_file}: `{e}`"
-        self.config_order_log.write(order_table_out)
+        self._show_order_preview(new_text)
 
         out = ""
         if self._config_file_box_temp_msg is not None:
@@ -873,13 +1263,45 @@ class ConfigEditor(VerticalScroll):
         self.config_edit_message.update(out)
 
 
+    def _show_order_preview(self, text: str) -> None:
+        """Show the order of the blocks for the first participants, computed in a worker unless `text` was seen before."""
+        key = self._order_preview_key = _ContentCache.key(text)
+        order_table_out = self._order_previews.get(key)
+        if order_table_out is not None:
+            self.config_order_log.write(order_table_out)
+            return
+        self.config_order_log.write("Computing the order...")
+        # A preview of an older text still being computed is cancelled
+        self.run_worker(partial(self._order_preview_worker, self.app, text, key), group="order_preview", exclusive=True, thread=True)
+
+    def _order_preview_worker(self, app: App, text: str, key: str) -> None:
+        try:
+            compiled_config = compile_config(toml.loads(text))
+            check_orderings(compiled_config)
+            order_table = _ordering_table(compiled_config, _PREVIEW_PARTICIPANTS)
+            order_table_out = tabulate(order_table, headers='firstrow', tablefmt='fancy_grid')
+        except Exception as e:
+            order_table_out = f"Failed to load {self.__config_file}: `{e}`"
+        self._order_previews.put(key, order_table_out)
+        if not get_current_worker().is_cancelled:
+            app.call_from_thread(self._order_preview_done, key, order_table_out)
+
+    def _order_preview_done(self, key: str, order_table_out: str) -> None:
+        # Only show the preview of the latest text
+        if key != self._order_preview_key:
+            return
+        self.config_order_log.clear()
+        self.config_order_log.write(order_table_out)
+
+
 class ConfigTab(Vertical):
     """Manage config tab."""
 
-    def __init__(self, experiment:Optional[Experiment]):
+    def __init__(self, experiment:Optional[Experiment], refresh_scheduler:RefreshScheduler):
         super().__init__()
         self.experiment:Optional[Experiment] = None
         self.__experiment_parameter = experiment
+        self._refresh_scheduler = refresh_scheduler
 
         self.gen_box_message = Static("", classes="message_box")
         self._gen_box_temp_msg:Optional[str] = None
@@ -897,7 +1319,8 @@ class ConfigTab(Vertical):
         self.gen_json_path_input = Input(placeholder="output toml path", id="gen_json_path")
         self.generate_indices_input = Input(placeholder="participant indices CSV or range (e.g. 1,2,3 or 1-5)", id="gen_indices")
 
-        self.config_editor = ConfigEditor(None)
+        self.config_editor = ConfigEditor(None, refresh_scheduler)
+        self._config_changed_success = True
         self.config_editor.disabled = True
 
     def set_experiment(self, experiment: Optional[Experiment]):
@@ -969,7 +1392,12 @@ class ConfigTab(Vertical):
         self.refresh_ui()
 
     def config_changed_callback(self, success):
-        if success:
+        """Called from the thread watching the config file, the UI is updated in the next refresh."""
+        self._config_changed_success = success
+        self._refresh_scheduler.request(self._config_changed)
+
+    def _config_changed(self):
+        if self._config_changed_success:
             self._config_file_box_temp_msg = "Success"
         else:
             self._config_file_box_temp_msg = "Errors in config, check logs"
@@ -1135,6 +1563,10 @@ class ConfigTab(Vertical):
             self.generate_json()
 
     def refresh_ui(self):
+        """Refresh in the next frame, see `RefreshScheduler`."""
+        self._refresh_scheduler.request(self._refresh_ui)
+
+    def _refresh_ui(self):
         if self.experiment is not None:
             out = ""
             if self._gen_json_box_temp_msg is not None:
@@ -1160,7 +1592,8 @@ class ExperimentTextualEditorOnlyApp(App):
     def __init__(self, config_file: Optional[str] = None,
                  *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.config_editor = ConfigEditor(config_file)
+        self.refresh_scheduler = RefreshScheduler()
+        self.config_editor = ConfigEditor(config_file, self.refresh_scheduler)
         self.log_view = RichLog(id="log_view", markup=True)
 
     def compose(self) -> ComposeResult:
@@ -1178,17 +1611,17 @@ class ExperimentTextualEditorOnlyApp(App):
     def on_mount(self):
         # Remove default stderr sink so nothing is printed to the CLI
         logger.remove()
-        # Get running loop to safely schedule writes from other threads
-        loop = asyncio.get_running_loop()
-        def textual_sink(message):
-            # message is a Loguru Message object; str(message) is the formatted text
-            loop.call_soon_threadsafe(self.log_view.write, str(message))
-        # Add Textual sink (enqueue=True for thread safety)
-        logger.add(textual_sink, enqueue=True)
+        # Refreshes and log messages from other threads are marshalled onto the running loop
+        self.refresh_scheduler.attach(asyncio.get_running_loop())
+        _add_log_view_sink(self.log_view, self.refresh_scheduler)
 
     def refresh_ui(self):
         self.config_editor.refresh_ui()
 
+    def action_quit(self) -> None:
+        logger.debug(f"UI refreshes: {self.refresh_scheduler.stats}")
+        self.exit()
+
 
 class ExperimentTextualApp(App):
     def __init__(self, config_file: Optional[str] = None,
@@ -1207,6 +1640,7 @@ class ExperimentTextualApp(App):
         self.config_tab: Optional[ConfigTab] = None
         self.log_view = RichLog(id="log_view", markup=True)
         self._config_file_box_temp_msg: Optional[str] = None
+        self.refresh_scheduler = RefreshScheduler()
 
     def compose(self) -> ComposeResult:
         """Called to add widgets to the app."""
@@ -1228,10 +1662,10 @@ class ExperimentTextualApp(App):
             yield Button("Refresh", id="btn_refresh")
         with TabbedContent():
             with TabPane("Participant Management"):
-                self.participant_tab = ParticipantTab(self.experiment)
+                self.participant_tab = ParticipantTab(self.experiment, self.refresh_scheduler)
                 yield self.participant_tab
             with TabPane("Manage Config"):
-                self.config_tab = ConfigTab(self.experiment)
+                self.config_tab = ConfigTab(self.experiment, self.refresh_scheduler)
                 yield self.config_tab
 
         with Collapsible(title="Log:", id="log_group"):
@@ -1242,15 +1676,15 @@ class ExperimentTextualApp(App):
     def on_mount(self):
         # Remove default stderr sink so nothing is printed to the CLI
         logger.remove()
-        # Get running loop to safely schedule writes from other threads
-        loop = asyncio.get_running_loop()
-        def textual_sink(message):
-            # message is a Loguru Message object; str(message) is the formatted text
-            loop.call_soon_threadsafe(self.log_view.write, str(message))
-        # Add Textual sink (enqueue=True for thread safety)
-        logger.add(textual_sink, enqueue=True)
+        # Refreshes and log messages from other threads are marshalled onto the running loop
+        self.refresh_scheduler.attach(asyncio.get_running_loop())
+        _add_log_view_sink(self.log_view, self.refresh_scheduler)
 
     def refresh_ui(self):
+        """Refresh in the next frame, see `RefreshScheduler`."""
+        self.refresh_scheduler.request(self._refresh_ui)
+
+    def _refresh_ui(self):
         if self.experiment is not None:
             out = str(self.experiment._config_file)
             if self._config_file_box_temp_msg is not None:
@@ -1274,35 +1708,54 @@ class ExperimentTextualApp(App):
 
     def process_config(self, path: Path|str):
         if self.experiment is None:
-            self.experiment = Experiment(str(path), self.default_participant_index)
-            if self.participant_tab is not None:
-                self.participant_tab.set_experiment(self.experiment)
-            if self.config_tab is not None:
-                self.config_tab.set_experiment(self.experiment)
-            start_server_in_current_ioloop(self.experiment, self.host, self.port)
+            self._set_experiment(Experiment(str(path), self.default_participant_index))
         else:
             self.experiment.config_file = path
 
+    def _set_experiment(self, experiment: Experiment):
+        self.experiment = experiment
+        if self.participant_tab is not None:
+            self.participant_tab.set_experiment(self.experiment)
+        if self.config_tab is not None:
+            self.config_tab.set_experiment(self.experiment)
+        start_server_in_current_ioloop(self.experiment, self.host, self.port)
+
     def load_config(self, config_loaded_callback:Optional[Callable]=None) -> None:
         def load_config_callback(path: Optional[Path]) -> None:
             if path is None:
                 self.refresh_ui()
                 return
-            try:
-                self.process_config(path)
-                if config_loaded_callback is not None:
-                    config_loaded_callback()
-            except Exception as e:
-                self._config_file_box_temp_msg = f"failed to load {path}"
-                logger.exception(f"Failed to load config: {e}")
-                self.push_screen(ConfirmationScreen(
-                    f"Could not load config file as there were errors: {e}\n\n"+
-                    "Check logs or use\n`experiment-server verify-config-file <config-file>`\n in the CLI for more detailed error report.\n\n" +
-                    "You can also use\n`experiment-server ui --editor-only -c <config-file>`\n to open only the editor.",
-                    yes_or_no=False))
+            self._config_file_box_temp_msg = f"loading {path}"
             self.refresh_ui()
+            self.run_worker(partial(self._load_config_worker, path, config_loaded_callback), group="load_config", exclusive=True, thread=True)
 
         self.push_screen(LoadConfigScreen(os.curdir), load_config_callback)
 
+    def _load_config_worker(self, path: Path, config_loaded_callback:Optional[Callable]) -> None:
+        """Load (and verify) the config in a worker thread, the UI is updated from the UI loop."""
+        try:
+            if self.experiment is None:
+                experiment = Experiment(str(path), self.default_participant_index)
+                self.call_from_thread(self._set_experiment, experiment)
+            else:
+                self.experiment.config_file = path
+            self._config_file_box_temp_msg = None
+            if config_loaded_callback is not None:
+                self.call_from_thread(config_loaded_callback)
+        except Exception as e:
+            logger.exception(f"Failed to load config: {e}")
+            self.call_from_thread(self._load_config_failed, path, e)
+        self.refresh_ui()
+
+    def _load_config_failed(self, path: Path, e: Exception):
+        self._config_file_box_temp_msg = f"failed to load {path}"
+        self.push_screen(ConfirmationScreen(
+            f"Could not load config file as there were errors: {e}\n\n"+
+            "Check logs or use\n`experiment-server verify-config-file <config-file>`\n in the CLI for more detailed error report.\n\n" +
+            "You can also use\n`experiment-server ui --editor-only -c <config-file>`\n to open only the editor.",
+            yes_or_no=False))
+        self.refresh_ui()
+
     def action_quit(self) -> None:
+        logger.debug(f"UI refreshes: {self.refresh_scheduler.stats}")
         self.exit()
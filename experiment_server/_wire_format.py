@@ -0,0 +1,110 @@
+"""Binary encodings of the API responses (MessagePack and CBOR), negotiated with the `Accept` header."""
+from functools import lru_cache
+import json
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from experiment_server.utils import ExperimentServerException
+
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+
+# Wire format name -> media type
+WIRE_FORMATS = {"msgpack": MSGPACK_MEDIA_TYPE, "cbor": CBOR_MEDIA_TYPE}
+# Also accepted in `Accept`/`Content-Type`
+_MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK_MEDIA_TYPE, "application/vnd.msgpack": MSGPACK_MEDIA_TYPE}
+
+
+class _Codec(NamedTuple):
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+@lru_cache(maxsize=None)
+def _codec(media_type: str) -> Optional[_Codec]:
+    """The codec of `media_type`, None if its package is not installed. The packages are
+    optional and only imported when first used."""
+    try:
+        if media_type == MSGPACK_MEDIA_TYPE:
+            import msgpack
+            return _Codec(msgpack.packb, lambda data: msgpack.unpackb(data, raw=False))
+        if media_type == CBOR_MEDIA_TYPE:
+            import cbor2
+            return _Codec(cbor2.dumps, cbor2.loads)
+    except ImportError:
+        pass
+    return None
+
+
+def available_wire_formats() -> List[str]:
+    """The names of the binary wire formats whose package is installed."""
+    return [name for name, media_type in WIRE_FORMATS.items() if _codec(media_type) is not None]
+
+
+def media_type(name: str) -> str:
+    """
+    The media type of the wire format `name` ("msgpack" or "cbor").
+
+    Raises:
+        ExperimentServerException: if `name` is not a wire format or its package is not installed.
+    """
+    if name not in WIRE_FORMATS:
+        raise ExperimentServerException(f"Unknown wire format {name}, expected one of {list(WIRE_FORMATS)}")
+    if _codec(WIRE_FORMATS[name]) is None:
+        raise ExperimentServerException(f"The package for the wire format {name} is not installed, "
+                                        f"install `experiment-server[{name}]`")
+    return WIRE_FORMATS[name]
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """
+    The binary media type to respond with for the `Accept` header `accept`.
+
+    The media types in `accept` are considered in the order of their quality (`q`). The first
+    binary media type whose package is installed is returned, unless JSON (or any type,
+    `*/*`) is accepted with a higher quality.
+
+    Returns:
+        The media type, or None if the response should be JSON.
+    """
+    if not accept:
+        return None
+    accepted: List[Tuple[float, int, str]] = []
+    for position, value in enumerate(accept.split(",")):
+        media_range, *params = [v.strip() for v in value.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.append((-quality, position, media_range.lower()))
+    for _, _, media_range in sorted(accepted):
+        media_range = _MEDIA_TYPE_ALIASES.get(media_range, media_range)
+        if media_range in (JSON_MEDIA_TYPE, "*/*", "application/*"):
+            return None
+        if media_range in WIRE_FORMATS.values() and _codec(media_range) is not None:
+            return media_range
+    return None
+
+
+def dumps(media_type: str, value: Any) -> bytes:
+    """Encode `value` as `media_type`, which should be a binary media type returned by `negotiate`."""
+    codec = _codec(media_type)
+    assert codec is not None
+    return codec.dumps(value)
+
+
+def loads(content_type: str, data: bytes) -> Any:
+    """
+    Decode the response body `data` of `content_type`. JSON if it is not a binary media type.
+    """
+    body_type = content_type.split(";")[0].strip().lower()
+    body_type = _MEDIA_TYPE_ALIASES.get(body_type, body_type)
+    codec = _codec(body_type) if body_type in WIRE_FORMATS.values() else None
+    if codec is None:
+        return json.loads(data)
+    return codec.loads(data)
@@ -1,5 +1,7 @@
 """CLI."""
 
+from contextlib import contextmanager
+import json
 import sys
 import click
 from click.core import ParameterSource
@@ -7,11 +9,10 @@ from loguru import logger
 from pathlib import Path
 from click_aliases import ClickAliasedGroup
 
-from experiment_server._server import _server
-from experiment_server._ui import ExperimentTextualApp, ExperimentTextualEditorOnlyApp
-from experiment_server._process_config import verify_config
-from experiment_server._api import _generate_config_json
-from experiment_server.utils import ExperimentServerException, new_config_file as _new_config_file
+from experiment_server.utils import ExperimentServerException
+
+# The modules used by the commands are imported in the commands, so that a command does not
+# import what it does not use (e.g., `generate-config-json` does not need the TUI).
 
 
 @click.group(cls=ClickAliasedGroup)
@@ -42,16 +43,49 @@ def _ask_default_participant_index_callback(ctx:click.Context, _, flag_value:boo
 @click.option("-h", "--host", default='127.0.0.1')
 @click.option("-p", "--port", default='5000')
 @click.option("-a", "--ask-default-participant-index", is_flag=True, default=False, expose_value=False, callback=_ask_default_participant_index_callback)
-def run(default_participant_index, config_file, host, port):
+@click.option("--hot-path-log-level", default="INFO", type=click.Choice(["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING"], case_sensitive=False),
+              help="Level of the logs of the configs loaded and of each request.")
+@click.option("--log-sample-rate", default=1.0, type=click.FloatRange(min=0, max=1, min_open=True),
+              help="Fraction of the requests that are logged.")
+def run(default_participant_index, config_file, host, port, hot_path_log_level, log_sample_rate):
     """Launch server with the `config-file` used to setup the configurations"""
-    _server(default_participant_index=default_participant_index if default_participant_index > 0 else None, host=host, port=port, config_file=config_file)
+    from experiment_server._server import _server
+
+    _server(default_participant_index=default_participant_index if default_participant_index > 0 else None, host=host, port=port, config_file=config_file,
+            hot_path_log_level=hot_path_log_level.upper(), log_sample_rate=log_sample_rate)
+
+
+@contextmanager
+def _profile(profile:bool, trace_file:str|None):
+    """Trace the config processing in the body. Print the time taken by each stage to stderr
+    if `profile` and write the spans in the Chrome trace format to `trace_file` if not None."""
+    if not profile and trace_file is None:
+        yield
+        return
+
+    from experiment_server._tracing import trace
+
+    with trace() as tracer:
+        try:
+            yield
+        finally:
+            if profile:
+                click.echo(tracer.format_breakdown(), err=True)
+            if trace_file is not None:
+                with open(trace_file, "w") as f:
+                    json.dump(tracer.to_chrome_trace(), f)
 
 
 @cli.command(aliases=["v", "verify"])
 @click.argument("config-file", type=click.Path())
-def verify_config_file(config_file):
+@click.option("--profile", default=False, is_flag=True, help="Print the time taken by each stage of processing the config.")
+@click.option("--trace-file", default=None, type=click.Path(dir_okay=False), help="Write the stages of processing the config to this file in the Chrome trace format.")
+def verify_config_file(config_file, profile, trace_file):
     """Verify if the config-file provided is valid"""
-    verify_config(f=config_file)
+    from experiment_server._process_config import verify_config
+
+    with _profile(profile, trace_file):
+        verify_config(f=config_file)
 
 
 @cli.command(aliases=["g", "generate"])
@@ -59,18 +93,22 @@ def verify_config_file(config_file):
 @click.option("-i", "--participant-index", default=None, type=int)
 @click.option("-r", "--participant-range", default=None, type=int)
 @click.option("-d", "--out-dir", default=None, type=click.Path(file_okay=False))
-def generate_config_json(config_file, participant_index, participant_range, out_dir):
+@click.option("--profile", default=False, is_flag=True, help="Print the time taken by each stage of processing the config.")
+@click.option("--trace-file", default=None, type=click.Path(dir_okay=False), help="Write the stages of processing the config to this file in the Chrome trace format.")
+def generate_config_json(config_file, participant_index, participant_range, out_dir, profile, trace_file):
     """Generate json config files after processing config-file for participant_index or 
     till participant_range. If `out_location` is passed, it is expected to be a directory.
     If not passed will write out the config's to stdout, one line per participant.
     """
+    from experiment_server._api import _generate_config_json
+
     if participant_index is None and participant_range is None:
         logger.error("Both `participant-index` and `participant-range` cannot be empty.")
         return
     elif participant_index is not None and participant_range is not None:
         logger.error("Both `participant-index` and `participant-range` provided. Ignoring `participant-index`.")
 
-    with logger.catch(ExperimentServerException, reraise=False):
+    with _profile(profile, trace_file), logger.catch(ExperimentServerException, reraise=False):
         _generate_config_json(config_file=config_file, participant_indices=range(1, participant_range + 1) if participant_range is not None else [participant_index, ], out_dir=out_dir)
 
 
@@ -83,9 +121,36 @@ def new_config_file(new_file_location):
     If parameter is directory, creates a file named `new_config.toml` in the directory.
     If parents do not exists, create them all!.
     """
+    from experiment_server.utils import new_config_file as _new_config_file
+
     _new_config_file(new_file_location)
 
 
+@cli.command(aliases=["b"])
+@click.argument("config-file", type=click.Path(exists=True, dir_okay=False))
+@click.option("-n", "--participants", default=10, type=click.IntRange(min=1), help="Number of participants simulated concurrently.")
+@click.option("-t", "--trials", default=None, type=click.IntRange(min=1), help="Number of blocks each participant goes through. Defaults to all blocks.")
+@click.option("-h", "--host", default='127.0.0.1')
+@click.option("-p", "--port", default='5000')
+@click.option("-o", "--out-file", default=None, type=click.Path(dir_okay=False), help="Write the results as JSON to this file.")
+@click.option("--json", "as_json", default=False, is_flag=True, help="Write the results as JSON to stdout.")
+def bench(config_file, participants, trials, host, port, out_file, as_json):
+    """Launch the server with `config-file` and simulate concurrent participants going through
+    the blocks (`move-to-next`, `config` and `active` for each block). Reports the throughput and
+    latency percentiles for each endpoint."""
+    from experiment_server._bench import _bench, _format_bench_results
+
+    with logger.catch(ExperimentServerException, reraise=False):
+        results = _bench(config_file=config_file, participants=participants, trials=trials, host=host, port=port)
+        if out_file is not None:
+            with open(out_file, "w") as f:
+                json.dump(results, f, indent=2)
+        if as_json:
+            click.echo(json.dumps(results, indent=2))
+        else:
+            click.echo(_format_bench_results(results))
+
+
 @cli.command(aliases=["ui"])
 @click.option("-c","--config-file", default=None, type=click.Path(exists=True, file_okay=True, dir_okay=False, ))
 @click.option("-i", "--default-participant-index", default=1, type=click.IntRange(min=1, max_open=True), is_eager=True)
@@ -95,6 +160,9 @@ def new_config_file(new_file_location):
 def ui(config_file, default_participant_index, host, port, editor_only):
     """Similar to `run`, but launches TUI. Can be called without the config file. The
     server will be started when an appropriate config file is correctly loaded."""
+    from experiment_server._ui import ExperimentTextualApp, ExperimentTextualEditorOnlyApp
+    from experiment_server._process_config import verify_config
+
     if editor_only:
         if config_file is None:
             logger.error("`--editor-only` requires the config file to be passed with `-c`/`--config-file`.")
@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from experiment_server._allocation import CohortAllocator
+from experiment_server.utils import ExperimentServerConfigurationException
+
+
+@pytest.mark.parametrize(
+    "population_size, k", [
+        (10, 1),
+        (10, 3),
+        (1, 1),
+    ])
+def test_allocate(population_size, k):
+    allocator = CohortAllocator()
+    population = list(range(population_size))
+    values = [v for participant_index in range(1, 11) for v in allocator.allocate("group", population, k, participant_index, 0, 0)]
+    # Every value is allocated once before any value is allocated again
+    for round_start in range(0, len(values) - population_size + 1, population_size):
+        assert sorted(values[round_start: round_start + population_size]) == population
+    assert allocator.allocated_count("group") == 10 * k
+    assert allocator.allocate("group", population, k, 3, 0, 0) == values[2 * k: 3 * k]
+
+
+def test_allocate_persisted(tmp_path):
+    state_file = tmp_path / "allocations.jsonl"
+    population = list(range(100))
+    allocator = CohortAllocator(state_file)
+    values = [allocator.allocate("group", population, 2, participant_index, call_index, 0)
+              for participant_index in range(1, 4) for call_index in range(2)]
+    allocator.flush()
+
+    allocator = CohortAllocator(state_file)
+    assert allocator.allocated_count("group") == 12
+    assert [allocator.allocate("group", population, 2, participant_index, call_index, 0)
+            for participant_index in range(1, 4) for call_index in range(2)] == values
+    new_values = allocator.allocate("group", population, 2, 4, 0, 0)
+    assert not set(new_values) & {v for vs in values for v in vs}
+    assert allocator.allocated_count("group") == 14
+
+
+@pytest.mark.parametrize(
+    "trailing, last_line_kept", [
+        # Cut short while writing the last allocation, it is removed
+        ('{"signature": "group", "partic', False),
+        # Only the newline is missing
+        ('{"signature": "group", "participant_index": 3, "offset": 4, "k": 2, "population_size": 100}', True),
+    ])
+def test_load_corrupt_lines(tmp_path, trailing, last_line_kept):
+    state_file = tmp_path / "allocations.jsonl"
+    lines = [json.dumps({"signature": "group", "participant_index": 1, "offset": 0, "k": 2, "population_size": 100}),
+             "not json",
+             json.dumps({"signature": "group", "participant_index": 2}),
+             json.dumps({"signature": "group", "participant_index": 2, "offset": 2, "k": 2, "population_size": 100})]
+    state_file.write_text("\n".join(lines) + "\n" + trailing)
+
+    allocator = CohortAllocator(state_file)
+    assert allocator.allocated_count("group") == (6 if last_line_kept else 4)
+    assert state_file.read_text().endswith("\n")
+    allocator.allocate("group", list(range(100)), 2, 4, 0, 0)
+    allocator.flush()
+
+    allocator = CohortAllocator(state_file)
+    assert allocator.allocated_count("group") == (8 if last_line_kept else 6)
+
+
+def test_population_change(tmp_path):
+    state_file = tmp_path / "allocations.jsonl"
+    allocator = CohortAllocator(state_file)
+    allocator.allocate("group", list(range(10)), 2, 1, 0, 0)
+    allocator.flush()
+    allocator.check_population("group", 10)
+    allocator.check_population("other", 5)
+
+    allocator = CohortAllocator(state_file)
+    with pytest.raises(ExperimentServerConfigurationException):
+        allocator.check_population("group", 11)
+    with pytest.raises(ExperimentServerConfigurationException):
+        allocator.allocate("group", list(range(11)), 2, 2, 0, 0)
+    assert allocator.allocate("group", list(range(10)), 2, 2, 0, 0)
@@ -1,10 +1,14 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import shutil
 from experiment_server.utils import ExperimentServerException
 import pytest
 import importlib
 import pytest_mock
 from deepdiff import DeepDiff
 import experiment_server._api
+from experiment_server._config_patch import apply_patch
 from experiment_server._process_config import process_config_file
 from .fixtures import config_file, participant_index
 from pathlib import Path
@@ -41,6 +45,10 @@ class TestParticipantState:
         state.move_to_next_block()
         assert state._block_id == 2
 
+    def test_no_dict(self, state):
+        with pytest.raises(AttributeError):
+            state.foo = "bar"
+
     def test_activeOnEnd(self, state):
         state.block_id = 9
         assert state.active == True
@@ -118,6 +126,481 @@ class TestExperiment:
         added = experiment.add_participant_index(3)
         assert added
 
+    def test_reserve_participant_indices(self, experiment):
+        reserved = experiment.reserve_participant_indices(3)
+        assert reserved == range(4, 7)
+        assert all(idx not in experiment.global_state for idx in reserved)
+        assert experiment.get_next_participant() == 7
+        assert experiment.add_participant_index(5)
+        assert experiment.get_next_participant() == 8
+        with pytest.raises(ExperimentServerException):
+            experiment.reserve_participant_indices(0)
+
+    @pytest.mark.parametrize("add", [
+        lambda experiment: experiment.get_next_participant(),
+        lambda experiment: experiment.add_participant_index(2) and 2,
+    ])
+    def test_adding_participant_resolves_without_index_lock(self, config_file, add):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        compiled_config = experiment._compiled_config
+        new_compiled_config = experiment._compile_config_file(config_file)
+        resolve_lazy = compiled_config.resolve_lazy
+        calls = []
+
+        def _resolve_lazy(participant_index, *args, **kwargs):
+            calls.append(experiment._participant_index_lock.locked())
+            # Another thread reloads the config while the participant's config is resolved
+            reload_thread = threading.Thread(target=experiment._publish_compiled_config, args=(new_compiled_config, False))
+            reload_thread.start()
+            reload_thread.join()
+            return resolve_lazy(participant_index, *args, **kwargs)
+
+        compiled_config.resolve_lazy = _resolve_lazy
+        participant_index = add(experiment)
+        assert participant_index == 2
+        assert calls == [False]
+        # Resolved again with the reloaded config
+        assert experiment.get_participant_state(participant_index).config._compiled_config is new_compiled_config
+        assert experiment.get_participants_in_block(-1) == [1, 2]
+
+    def test_release_participant_index(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        assert experiment.reserve_participant_indices(5) == range(2, 7)
+        for participant_index in (5, 3, 4):
+            assert experiment.release_participant_index(participant_index)
+        # Not reserved, added or already released
+        for participant_index in (0, 1, 3, 7):
+            assert not experiment.release_participant_index(participant_index)
+        # A released index can still be added
+        assert experiment.add_participant_index(4)
+        assert experiment.get_next_participant() == 3
+        assert experiment.get_next_participant() == 5
+        assert experiment.get_next_participant() == 7
+        assert not experiment.release_participant_index(5)
+
+    def test_adding_participant_above_next(self, experiment):
+        assert experiment.add_participant_index(20)
+        assert experiment.get_next_participant() == 21
+
+    def test_new_participant_concurrent(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            indices = list(executor.map(lambda _: experiment.get_next_participant(), range(200)))
+        experiment.watchdog.end_watch()
+        assert sorted(indices) == list(range(2, 202))
+        assert sorted(experiment.global_state.keys()) == list(range(1, 202))
+
+    def test_cohort_choices_persisted(self, tmp_path):
+        config_file = tmp_path / "config.toml"
+        config_file.write_text('''
+[[blocks]]
+name = "a"
+config = { stimulus = { function_name = "choices", args = [[1, 2, 3, 4, 5, 6]], params = { scope = "cohort" } } }
+
+[configuration]
+order = ["a"]
+''')
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        participant_indices = [1] + [experiment.get_next_participant() for _ in range(2)]
+        stimuli = [experiment.get_all_configs(i)[0]["stimulus"] for i in participant_indices]
+        experiment.watchdog.end_watch()
+        experiment.cohort_allocator.flush()
+        assert (tmp_path / "config.allocations.jsonl").exists()
+
+        # Restarting gives the same values and continues allocating from the pool
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        participant_indices = [1] + [experiment.get_next_participant() for _ in range(3)]
+        new_stimuli = [experiment.get_all_configs(i)[0]["stimulus"] for i in participant_indices]
+        experiment.watchdog.end_watch()
+        assert new_stimuli[:3] == stimuli
+        assert len({s[0] for s in new_stimuli}) == 4
+
+    def test_cohort_population_change(self, tmp_path):
+        config_file = tmp_path / "config.toml"
+        config = '''
+[[blocks]]
+name = "a"
+
+[blocks.config.stimulus]
+function_name = "choices"
+args = [{population}]
+params = {{ scope = "cohort" }}
+id = "stimuli"
+
+[configuration]
+order = ["a"]
+'''
+        config_file.write_text(config.format(population=[1, 2, 3]))
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        stimulus = experiment.get_all_configs(1)[0]["stimulus"]
+        experiment.watchdog.end_watch()
+
+        # The values allocated are only valid for the population they were allocated from
+        config_file.write_text(config.format(population=[1, 2, 3, 4]))
+        experiment._config_file_modified_callback()
+        assert experiment.reload_failure_count == 1
+        assert experiment.get_all_configs(1)[0]["stimulus"] == stimulus
+
+    def test_participant_change_callback(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        changes = []
+        experiment.on_participant_change_callback.append(changes.append)
+        participant_index = experiment.get_next_participant()
+        experiment.add_participant_index(participant_index)
+        experiment.move_to_next(participant_index)
+        experiment.move_to_block(2, 1)
+        experiment.reset_participant(1)
+        experiment.move_all_to_block(0)
+        experiment._config_file_modified_callback()
+        experiment.watchdog.end_watch()
+        assert changes == [participant_index, participant_index, 1, 1, None, None]
+
+    def test_moves_during_reload(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        participant_indices = [experiment.get_next_participant() for _ in range(8)]
+        blocks_count = experiment.get_blocks_count()
+        moving = threading.Event()
+        moving.set()
+
+        def reload():
+            reloads = 0
+            while moving.is_set():
+                experiment._config_file_modified_callback()
+                reloads += 1
+            return reloads
+
+        def move(participant_index):
+            for moves in range(100):
+                block_id = moves % blocks_count
+                assert experiment.move_to_block(block_id, participant_index) == experiment.get_participant_state(participant_index).config.block_names[block_id]
+                config = experiment.get_config(participant_index)
+                assert config["block_id"] == block_id and config["participant_index"] == participant_index
+                experiment.move_to_next(participant_index)
+
+        try:
+            with ThreadPoolExecutor(max_workers=len(participant_indices) + 1) as executor:
+                reloads = executor.submit(reload)
+                futures = [executor.submit(move, idx) for idx in participant_indices]
+                try:
+                    for future in futures:
+                        future.result()
+                finally:
+                    moving.clear()
+                assert reloads.result() > 0
+        finally:
+            experiment.watchdog.end_watch()
+
+        for participant_index in participant_indices:
+            assert experiment.get_participant_state(participant_index).config == process_config_file(config_file, participant_index)
+
+    @pytest.mark.parametrize("move, expected_block_id", [
+        (lambda experiment: experiment.move_to_next(2), 0),
+        (lambda experiment: experiment.move_to_block(3, 2), 3),
+    ])
+    def test_move_during_reset_reload(self, config_file, mocker, move, expected_block_id):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        experiment.add_participant_index(2)
+        participant_lock = experiment._participant_lock
+        reloaded = threading.Event()
+
+        def _reload():
+            # As when a new config file is loaded, the participants are replaced and moved to START
+            experiment._publish_compiled_config(experiment._compiled_config, reset_states=True)
+
+        def _participant_lock(participant_index):
+            # The config is reloaded by another thread right before the move takes the lock
+            if participant_index == 2 and not reloaded.is_set():
+                reloaded.set()
+                reload_thread = threading.Thread(target=_reload)
+                reload_thread.start()
+                reload_thread.join()
+            return participant_lock(participant_index)
+
+        mocker.patch.object(experiment, "_participant_lock", side_effect=_participant_lock)
+        move(experiment)
+        assert reloaded.is_set()
+        # The move is made on the state that replaced the participant's state
+        participant_state = experiment.get_participant_state(2)
+        assert participant_state.block_id == expected_block_id
+        assert experiment.get_participants_in_block(expected_block_id) == [2]
+
+    def test_config_version(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        assert experiment.config_version == 1
+        experiment._config_file_modified_callback()
+        assert experiment.config_version == 2
+        experiment.move_to_next()
+        assert experiment.config_version == 2
+        experiment.reset_participant()
+        assert experiment.config_version == 3
+        assert experiment.update_config({"new_key": 1})
+        assert experiment.config_version == 4
+
+    def test_update_config(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        assert not experiment.update_config({"new_key": 1})
+        experiment.move_to_next()
+        config = experiment.get_config()
+        assert experiment.update_config({"new_key": 1})
+        assert experiment.get_config() == dict(config, new_key=1)
+        # The config returned earlier is not changed
+        assert "new_key" not in config
+
+    @pytest.mark.parametrize("get_configs", [
+        lambda experiment, participant_index: [experiment.get_config(participant_index)],
+        lambda experiment, participant_index: experiment.get_all_configs(participant_index),
+        lambda experiment, participant_index: experiment.get_all_configs_delta(0, participant_index)["configs"],
+    ])
+    def test_configs_are_not_shared(self, tmp_path, get_configs):
+        config_file = tmp_path / "config.toml"
+        config_file.write_text('''
+[[blocks]]
+name = "a"
+
+[blocks.config]
+sizes = [[1, 2], [3]]
+
+[blocks.config.colors]
+background = "black"
+
+[configuration]
+order = ["a"]
+''')
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        experiment.add_participant_index(2)
+        for participant_index in [1, 2]:
+            experiment.move_to_next(participant_index)
+
+        config = get_configs(experiment, 1)[0]
+        config["sizes"][0].append(4)
+        config["colors"]["background"] = "white"
+        expected_config = {"sizes": [[1, 2], [3]], "colors": {"background": "black"}}
+        assert {k: v for k, v in get_configs(experiment, 2)[0].items() if k in expected_config} == expected_config
+        assert {k: v for k, v in get_configs(experiment, 1)[0].items() if k in expected_config} == expected_config
+
+    def test_get_all_configs_delta(self, config_file, tmp_path):
+        config_file = shutil.copy(config_file, tmp_path / "config.toml")
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        experiment.add_participant_index(2)
+        response = experiment.get_all_configs_delta(0)
+        assert response == {"version": 1, "configs": experiment.get_all_configs()}
+        configs = response["configs"]
+        assert experiment.get_all_configs_delta(1) == {"version": 1, "since": 1, "patch": []}
+
+        experiment.move_to_next()
+        experiment.update_config({"new_key": 1})
+        assert experiment.get_all_configs_delta(1) == {"version": 2, "since": 1, "patch": [{"op": "add", "path": "/0/new_key", "value": 1}]}
+        experiment.update_config({"new_key": 2, "buttonSize": 3})
+        # The changes to other participants are not included
+        experiment.move_to_next(2)
+        experiment.update_config({"other_key": 1}, 2)
+        response = experiment.get_all_configs_delta(1)
+        assert response["version"] == 4
+        assert len(response["patch"]) == 3
+        assert apply_patch(configs, response["patch"]) == experiment.get_all_configs()
+
+        # Reloading the config file logs the changes between the configs before and after it
+        experiment._config_file_modified_callback()
+        response = experiment.get_all_configs_delta(4)
+        assert response["version"] == 5
+        assert sorted(operation["path"] for operation in response["patch"]) == ["/0/buttonSize", "/0/new_key"]
+        assert apply_patch(configs, experiment.get_all_configs_delta(1)["patch"]) == experiment.get_all_configs()
+        # A small edit of the config file is a small patch (a change to each block extending the
+        # block edited)
+        config_file.write_text(config_file.read_text().replace('"dir_100_on"', '"dir_100_on_edited"'))
+        experiment._config_file_modified_callback()
+        assert experiment.get_all_configs_delta(5) == {"version": 6, "since": 5, "patch": [
+            {"op": "replace", "path": f"/{block_id}/conditionId", "value": "dir_100_on_edited"}
+            for block_id, config in enumerate(experiment.get_all_configs()) if config["conditionId"] == "dir_100_on_edited"]}
+
+        # All the configs of a participant whose configs were never all returned are returned
+        assert experiment.get_all_configs_delta(4, 2) == {"version": 6, "configs": experiment.get_all_configs(2)}
+        experiment.update_config({"other_key": 1}, 2)
+        experiment.reset_participant(2)
+        assert experiment.get_all_configs_delta(7) == {"version": 8, "since": 7, "patch": []}
+        assert experiment.get_all_configs_delta(7, 2) == {"version": 8, "since": 7, "patch": [
+            {"op": "remove", "path": f"/{experiment.global_state[2].block_id}/other_key"}]}
+
+        # Only the last changes are kept
+        version = experiment.config_version
+        experiment.move_to_next(2)
+        for value in range(experiment_server._api._CONFIG_CHANGES_LOG_SIZE):
+            experiment.update_config({"other_key": value}, 2)
+        assert experiment.get_all_configs_delta(version)["patch"] == []
+        experiment.update_config({"other_key": -1}, 2)
+        assert experiment.get_all_configs_delta(version) == {"version": experiment.config_version, "configs": experiment.get_all_configs()}
+        # Versions that were not returned yet
+        assert "configs" in experiment.get_all_configs_delta(experiment.config_version + 1)
+
+    def test_get_all_configs_delta_is_lazy(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        experiment.add_participant_index(2)
+        response = experiment.get_all_configs_delta(experiment.config_version, 2)
+        assert response["patch"] == []
+        assert experiment.global_state[2].config.resolved_count == 0
+        experiment.get_all_configs_delta(0, 2)
+        assert experiment.global_state[2].config.resolved_count == experiment.get_blocks_count(2)
+
+    def test_get_all_configs_delta_while_updating(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        experiment.move_to_next()
+
+        def _update_config():
+            for value in range(1000):
+                experiment.update_config({"value": value})
+
+        response = experiment.get_all_configs_delta(0)
+        configs, version = response["configs"], response["version"]
+        thread = threading.Thread(target=_update_config)
+        thread.start()
+        while True:
+            done = not thread.is_alive()
+            response = experiment.get_all_configs_delta(version)
+            configs = apply_patch(configs, response["patch"]) if "patch" in response else response["configs"]
+            version = response["version"]
+            if done:
+                break
+        thread.join()
+        assert version == experiment.config_version
+        assert configs == experiment.get_all_configs()
+
+    def test_get_summary(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+
+        def _expected_summary():
+            states = list(experiment.global_state.values())
+            block_ids, block_names = {}, {}
+            for state in states:
+                if state.active:
+                    block_ids[str(state.block_id)] = block_ids.get(str(state.block_id), 0) + 1
+                block_names[state.block_name] = block_names.get(state.block_name, 0) + 1
+            return {
+                "participants": len(states),
+                "not_started": sum(1 for state in states if state.block_id < 0),
+                "active": sum(1 for state in states if state.active),
+                "finished": sum(1 for state in states if state.block_id >= len(state.config)),
+                "blocks_completed": experiment.blocks_completed_count,
+                "block_ids": dict(sorted(block_ids.items(), key=lambda item: int(item[0]))),
+                "block_names": block_names,
+            }
+
+        blocks_count = experiment.get_blocks_count()
+        operations = [
+            lambda: [experiment.add_participant_index(participant_index) for participant_index in range(2, 6)],
+            lambda: [experiment.move_to_next(participant_index) for participant_index in (1, 2, 2, 3)],
+            lambda: experiment.move_to_block(blocks_count - 1, 4),
+            lambda: experiment.move_to_next(4),
+            lambda: experiment.reset_participant(2),
+            lambda: experiment._config_file_modified_callback(),
+            lambda: experiment.move_all_to_block(1),
+            lambda: experiment.get_next_participant(),
+            lambda: setattr(experiment, "config_file", config_file),
+        ]
+        assert experiment.get_summary() == _expected_summary()
+        for operation in operations:
+            operation()
+            assert experiment.get_summary() == _expected_summary()
+            for block_id in range(-1, blocks_count + 1):
+                assert experiment.get_participants_in_block(block_id) == sorted(
+                    state.participant_index for state in experiment.global_state.values() if state.block_id == block_id)
+        experiment.watchdog.end_watch()
+
+    @pytest.mark.parametrize(
+        "kwargs, expected_pages", [
+            ({}, [[1, 2, 3, 5, 8, 13]]),
+            ({"limit": 4}, [[1, 2, 3, 5], [8, 13]]),
+            ({"limit": 2}, [[1, 2], [3, 5], [8, 13]]),
+            ({"limit": 2, "after": 3}, [[5, 8], [13]]),
+            ({"limit": 2, "first": 3, "last": 8}, [[3, 5], [8]]),
+            ({"active": True}, [[2, 5, 13]]),
+            ({"active": False, "limit": 1}, [[1], [3], [8], []]),
+            ({"block_name": "START"}, [[1, 3, 8]]),
+            ({"block_name": "END"}, [[]]),
+            ({"block_name": "<block 0>"}, [[2, 5, 13]]),
+        ])
+    def test_list_participants(self, config_file, kwargs, expected_pages):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        for participant_index in [8, 3, 13, 2, 5]:
+            experiment.add_participant_index(participant_index)
+        for participant_index in [2, 5, 13]:
+            experiment.move_to_next(participant_index)
+        if kwargs.get("block_name") == "<block 0>":
+            kwargs["block_name"] = experiment.get_participant_state(2).block_name
+
+        pages = []
+        after = kwargs.pop("after", None)
+        while True:
+            participant_states, after = experiment.list_participants(after=after, **kwargs)
+            pages.append([state.participant_index for state in participant_states])
+            if after is None:
+                break
+        assert pages == expected_pages
+
+    def test_list_participants_while_adding(self, config_file):
+        experiment = experiment_server._api.Experiment(config_file, 1)
+        experiment.watchdog.end_watch()
+        for participant_index in range(2, 2001, 2):
+            experiment.add_participant_index(participant_index)
+        participant_indices = set(experiment.global_state.keys())
+        # Added in descending order, each shifting all the participants after it
+        added_participant_indices = list(range(1999, 2, -2))
+        added = threading.Event()
+
+        def _add_participants(thread_index):
+            for participant_index in added_participant_indices[thread_index::4]:
+                experiment.add_participant_index(participant_index)
+
+        def _list_all_participants():
+            listed_participant_indices, after = [], None
+            while True:
+                participant_states, after = experiment.list_participants(after=after, limit=7)
+                listed_participant_indices.extend(state.participant_index for state in participant_states)
+                if after is None:
+                    return listed_participant_indices
+
+        def _list_participants():
+            listings = [_list_all_participants()]
+            while not added.is_set():
+                listings.append(_list_all_participants())
+            return listings
+
+        with ThreadPoolExecutor(5) as executor:
+            listing = executor.submit(_list_participants)
+            for future in [executor.submit(_add_participants, thread_index) for thread_index in range(4)]:
+                future.result()
+            added.set()
+            listings = listing.result()
+
+        for listed_participant_indices in listings:
+            # Each participant once, in order, including all the participants added before listing
+            assert listed_participant_indices == sorted(set(listed_participant_indices))
+            assert participant_indices.issubset(listed_participant_indices)
+        assert _list_all_participants() == sorted(experiment.global_state.keys())
+
+    def test_list_participants_fails(self, experiment):
+        with pytest.raises(ExperimentServerException):
+            experiment.list_participants(limit=0)
+
+    def test_adding_participant_is_lazy(self, experiment):
+        experiment.add_participant_index(4)
+        state = experiment.get_participant_state(4)
+        assert state.config.resolved_count == 0
+        assert state.block_name == "START"
+        experiment.move_to_next(4)
+        assert state.config.resolved_count == 1
+        assert experiment.get_config(4)["block_id"] == 0
+
 
 def test_generate_config_json(tmp_path, config_file):
     out_file_location = tmp_path / "out1"
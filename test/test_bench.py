@@ -0,0 +1,51 @@
+import importlib
+import json
+import socket
+import pytest
+from click.testing import CliRunner
+import experiment_server.cli
+from experiment_server._bench import _latency_summary, _format_bench_results
+from .fixtures import config_file
+
+
+@pytest.mark.parametrize(
+    "latencies, expected",[
+        ([0.001 * i for i in range(1, 101)], {"p50_ms": 50.5, "p95_ms": 95.05, "p99_ms": 99.01, "max_ms": 100, "mean_ms": 50.5}),
+        ([0.002], {"p50_ms": 2, "p95_ms": 2, "p99_ms": 2, "max_ms": 2, "mean_ms": 2}),
+        ])
+def test_latency_summary(latencies, expected):
+    assert _latency_summary(latencies) == pytest.approx(expected)
+
+
+def test_format_bench_results():
+    results = {"participants": 1, "requests": 1, "duration_s": 1, "throughput_rps": 1,
+               "endpoints": {"GET /api/config": dict(count=1, errors=0, **_latency_summary([0.002]))}}
+    assert "GET /api/config" in _format_bench_results(results)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_bench_smoke(config_file, tmp_path):
+    # Undo the mocks of the cli tests
+    importlib.reload(experiment_server.cli)
+    out_file = tmp_path / "results.json"
+    result = CliRunner().invoke(experiment_server.cli.cli, ["bench", str(config_file), "-n", "2", "-t", "2",
+                                                            "-p", str(_free_port()), "-o", str(out_file), "--json"])
+    assert result.exit_code == 0, result.output
+
+    with open(out_file) as f:
+        results = json.load(f)
+    assert json.loads(result.stdout) == results
+    assert {k: results[k] for k in ("config_file", "participants", "trials")} == {"config_file": str(config_file), "participants": 2, "trials": 2}
+    assert results["requests"] == 2 * (2 + 3 * 2)
+    assert results["throughput_rps"] > 0
+    assert {endpoint: summary["count"] for endpoint, summary in results["endpoints"].items()} == {
+        "PUT /api/new-participant": 2, "GET /api/blocks-count": 2, "POST /api/move-to-next": 4, "GET /api/config": 4, "GET /api/active": 4}
+    for summary in results["endpoints"].values():
+        assert summary["errors"] == 0
+        assert 0 < summary["p50_ms"] <= summary["p99_ms"] <= summary["max_ms"]
+    assert "GET /api/config" in _format_bench_results(results)
@@ -1,3 +1,6 @@
+import json
+import subprocess
+import sys
 import pytest
 import importlib
 from click.testing import CliRunner
@@ -5,6 +8,7 @@ import experiment_server
 import pytest_mock
 
 import experiment_server.cli
+from .fixtures import config_file
 
 
 @pytest.fixture(scope="function")
@@ -18,10 +22,18 @@ def mock_function(mocker, mock_function):
     importlib.reload(experiment_server.cli)
 
 
+def test_cli_imports_are_lazy():
+    # In a new interpreter, as the other tests import these modules
+    result = subprocess.run([sys.executable, "-c", "import sys, experiment_server.cli; print([m for m in ('textual', 'tornado', 'requests', 'experiment_server._api') if m in sys.modules])"],
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+
 def test_run(runner, mocker):
     mock_function(mocker, "experiment_server._server._server")
     result = runner.invoke(experiment_server.cli.cli, ["run", "file"])
-    experiment_server._server._server.assert_called_with(default_participant_index=1, host='127.0.0.1', port='5000', config_file='file')
+    experiment_server._server._server.assert_called_with(default_participant_index=1, host='127.0.0.1', port='5000', config_file='file',
+                                                         hot_path_log_level="INFO", log_sample_rate=1.0)
 
 
 def test_verify_config(runner, mocker):
@@ -43,3 +55,32 @@ def test_generate_config_json_1(runner, mocker, params, called_with):
         experiment_server._api._generate_config_json.assert_not_called()
     else:
         experiment_server._api._generate_config_json.assert_called_with(**called_with)
+
+
+@pytest.mark.parametrize(
+    "params, called_with",[
+        ([], {"participants":10, "trials":None, "host":"127.0.0.1", "port":"5000"}),
+        (["-n", "5", "-t", "2", "-p", "5001"], {"participants":5, "trials":2, "host":"127.0.0.1", "port":"5001"}),
+        ])
+def test_bench(runner, mocker, config_file, params, called_with):
+    mocker.patch("experiment_server._bench._format_bench_results", return_value="")
+    mock_function(mocker, "experiment_server._bench._bench")
+    result = runner.invoke(experiment_server.cli.cli, ["bench", str(config_file)] + params)
+    experiment_server._bench._bench.assert_called_with(config_file=str(config_file), **called_with)
+
+
+@pytest.mark.parametrize(
+    "params",[
+        ["verify-config-file"],
+        ["generate-config-json", "-r", "2"],
+        ])
+def test_profile(runner, tmp_path, config_file, params):
+    # Undo the mocks of the other tests
+    importlib.reload(experiment_server.cli)
+    trace_file = tmp_path / "trace.json"
+    result = runner.invoke(experiment_server.cli.cli, [params[0], str(config_file)] + params[1:] + ["--profile", "--trace-file", str(trace_file)])
+    assert result.exit_code == 0
+    assert "toml.load" in result.stderr
+    with open(trace_file) as f:
+        events = json.load(f)["traceEvents"]
+    assert {"toml.load", "compile_config", "ordering"} <= {e["name"] for e in events}
@@ -1,7 +1,7 @@
 import time
 import requests
 import pytest
-from experiment_server import Client
+from experiment_server import Client, _wire_format
 from experiment_server._server import server_process
 from experiment_server._process_config import process_config_file
 from .fixtures import config_file, participant_index
@@ -67,6 +67,19 @@ class TestClient:
         for c1, c2 in zip(exp_config, out):
             assert c1["config"]["name"] == c2["name"]
 
+    def test_get_all_configs_since(self, client):
+        ret, out = client.get_all_configs(since=0)
+        assert ret
+        assert out["configs"] == client.get_all_configs()[1]
+        ret, out = client.get_all_configs(since=out["version"])
+        assert ret
+        assert out["patch"] == []
+        ret, out = client.get_all_configs(since=-1)
+        assert ret
+        assert "configs" in out
+        r = requests.get("http://127.0.0.1:5000/api/all-configs?since=x")
+        assert r.status_code == 406
+
     def test_move_to_block_correct(self, client, exp_config):
         ret, out = client.move_to_block(3)
         assert ret
@@ -149,6 +162,110 @@ class TestClient:
         assert ret
         assert out == exp_config2[3]["config"]
 
+    def test_reserve_participants(self, client):
+        ret, out = client.reserve_participants(2)
+        assert ret
+        assert out == {"first": 4, "last": 5}
+        ret, out = client.new_participant()
+        assert out == 6
+        ret, out = client.reserve_participants(0)
+        assert not ret
+        assert "406" in out["message"]
+
+    def test_list_participants(self, client):
+        ret, out = client.list_participants(limit=2)
+        assert ret
+        assert [p["participant_index"] for p in out["participants"]] == [1, 2]
+        assert out["participants"][0] == {"participant_index": 1, "block_id": 3, "block_name": "4", "active": True}
+        ret, out = client.list_participants(after=out["next"], limit=2)
+        assert ret
+        assert [p["participant_index"] for p in out["participants"]] == [3, 6]
+        ret, out = client.list_participants(active=False, first=3)
+        assert ret
+        assert [p["participant_index"] for p in out["participants"]] == [6]
+        assert out["next"] is None
+        ret, out = client.list_participants(limit=0)
+        assert not ret
+        assert "406" in out["message"]
+
+    def test_release_participant(self, client):
+        ret, out = client.reserve_participants(3)
+        assert out == {"first": 7, "last": 9}
+        for participant_index in (9, 8):
+            ret, out = client.release_participant(participant_index)
+            assert ret
+            assert out is True
+        for participant_index in (8, 6, 100):
+            ret, out = client.release_participant(participant_index)
+            assert not ret
+            assert "406" in out["message"]
+        assert client.new_participant() == (True, 8)
+        assert client.new_participant() == (True, 9)
+        assert client.new_participant() == (True, 10)
+
+    def test_get_summary(self, client):
+        ret, out = client.get_summary()
+        assert ret
+        assert out["participants"] == out["not_started"] + out["active"] + out["finished"]
+        assert sum(out["block_ids"].values()) == out["active"]
+        assert sum(out["block_names"].values()) == out["participants"]
+
+    def test_metrics(self, client):
+        r = requests.get("http://127.0.0.1:5000/metrics")
+        assert r.status_code == 200
+        assert r.headers["Content-Type"].startswith("text/plain")
+        assert 'action="move-to-next",code="200"' in r.text
+
+    def test_static_assets(self, client):
+        r = requests.get("http://127.0.0.1:5000/")
+        assert r.status_code == 200
+        assert r.headers["Cache-Control"] == "no-cache"
+        r2 = requests.get("http://127.0.0.1:5000/", headers={"If-None-Match": r.headers["ETag"]})
+        assert r2.status_code == 304
+        assert r2.content == b""
+
+        # The identity and compressed bodies have different ETags
+        identity = requests.get("http://127.0.0.1:5000/", headers={"Accept-Encoding": "identity"})
+        gzipped = requests.get("http://127.0.0.1:5000/", headers={"Accept-Encoding": "gzip"})
+        assert identity.headers["Vary"] == gzipped.headers["Vary"] == "Accept-Encoding"
+        assert "Content-Encoding" not in identity.headers
+        assert gzipped.headers["ETag"] == identity.headers["ETag"][:-1] + '-gzip"'
+        assert requests.get("http://127.0.0.1:5000/", headers={"Accept-Encoding": "gzip", "If-None-Match": identity.headers["ETag"]}).status_code == 200
+        assert requests.get("http://127.0.0.1:5000/", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]}).status_code == 304
+
+        asset_url = next(url for url in r.text.split('"') if url.startswith("/assets/") and url.endswith("/js/htmx-1.9.10.js"))
+        r = requests.get("http://127.0.0.1:5000" + asset_url, headers={"Accept-Encoding": "gzip"})
+        assert r.status_code == 200
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert "immutable" in r.headers["Cache-Control"]
+        assert r.text.startswith("(function")
+        assert requests.get("http://127.0.0.1:5000/assets/0123456789abcdef/js/htmx-1.9.10.js").status_code == 404
+
+    @pytest.mark.parametrize("wire_format, content_type", [("json", "text/html; charset=UTF-8"),
+                                                           ("msgpack", "application/msgpack"),
+                                                           ("cbor", "application/cbor")])
+    def test_wire_format(self, client, wire_format, content_type):
+        if wire_format != "json":
+            pytest.importorskip({"msgpack": "msgpack", "cbor": "cbor2"}[wire_format])
+        wire_format_client = Client("127.0.0.1", "5000", wire_format=wire_format)
+        assert wire_format_client.get_all_configs() == Client("127.0.0.1", "5000", wire_format="json").get_all_configs()
+        assert wire_format_client.list_participants() == client.list_participants()
+        r = requests.get("http://127.0.0.1:5000/api/all-configs", headers=wire_format_client._headers)
+        assert r.headers["Content-Type"] == content_type
+
+    def test_default_wire_format(self, client, mocker):
+        # MessagePack or CBOR when installed, JSON otherwise
+        available_wire_formats = _wire_format.available_wire_formats()
+        assert client.wire_format == (available_wire_formats[0] if available_wire_formats else "json")
+        r = requests.get("http://127.0.0.1:5000/api/all-configs", headers=client._headers)
+        assert r.headers["Content-Type"] == (_wire_format.media_type(client.wire_format) if available_wire_formats else "text/html; charset=UTF-8")
+        assert client.get_all_configs() == Client("127.0.0.1", "5000", wire_format="json").get_all_configs()
+
+        mocker.patch.object(_wire_format, "available_wire_formats", return_value=[])
+        json_client = Client("127.0.0.1", "5000")
+        assert json_client.wire_format == "json"
+        assert json_client._headers == {}
+
     def test_shutdown(self, client):
         ret, out = client.shutdown()
         assert ret
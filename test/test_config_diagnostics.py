@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import pytest
+from tree_sitter import Language, Parser
+import tree_sitter_toml
+
+from experiment_server._config_diagnostics import ConfigDiagnostics
+
+
+_parser = Parser(Language(tree_sitter_toml.language()))
+
+_CONFIG = '''[configuration]
+order = [["a", "b"]]
+
+[configuration.variables]
+x = 1
+
+[[blocks]]
+name = "a"
+config = {x = "$x"}
+
+[[blocks]]
+name = "b"
+[blocks.config]
+y = 2
+'''
+
+
+def _update(diagnostics, text):
+    source = text.encode()
+    return [(d.start[0], d.message) for d in diagnostics.update(_parser.parse(source), source)]
+
+
+@pytest.mark.parametrize(
+    "old, new, expected", [
+        ('y = 2', 'y = [2', [(13, "Syntax error")]),
+        ('name = "b"', 'nme = "b"', [(10, "Block missing `name`."), (0, "Block `b` does not exist.")]),
+        ('name = "b"', 'name = "a"', [(10, "Duplicate block name: a"), (0, "Block `b` does not exist.")]),
+        ('config = {x = "$x"}', 'extends = "c"', [(6, "Block `c` does not exist.")]),
+        ('config = {x = "$x"}', 'config = {x = {function_name = "foo", args = [1]}}', [(6, "Unknown function foo in block `a`")]),
+        ('config = {x = "$x"}', 'config = {x = {function_name = "choices", args = [1], params = {scope = "x"}}}',
+         [(6, "Allowed values for `scope` of `choices` are ['participant', 'cohort'], got x")]),
+        ('x = 1', 'x = "$z"\nz = "$x"', [(0, "Variables refer to each other in a cycle: x -> z -> x")]),
+        ('["a", "b"]', '["a", "c"]', [(0, "Block `c` does not exist.")]),
+    ])
+def test_config_diagnostics(old, new, expected):
+    diagnostics = ConfigDiagnostics()
+    assert _update(diagnostics, _CONFIG) == []
+    assert _update(diagnostics, _CONFIG.replace(old, new)) == expected
+    assert _update(diagnostics, _CONFIG) == []
+
+
+def test_config_diagnostics_checks_changed_sections():
+    diagnostics = ConfigDiagnostics()
+    _update(diagnostics, _CONFIG)
+    # `[configuration.variables]` is checked with `[configuration]`
+    assert diagnostics.checked_sections_count == 3
+
+    # Only the changed section is checked again
+    assert _update(diagnostics, _CONFIG.replace('name = "b"', 'name = "b"\nconfig = [1')) == [(13, "Syntax error")]
+    assert diagnostics.checked_sections_count == 4
+    # The diagnostics of unchanged sections are moved with them
+    assert _update(diagnostics, "# comment\n\n" + _CONFIG.replace('name = "b"', 'name = "b"\nconfig = [1')) == [(15, "Syntax error")]
+    assert diagnostics.checked_sections_count == 4
+
+
+def test_config_diagnostics_working_file():
+    diagnostics = ConfigDiagnostics()
+    assert _update(diagnostics, (Path(__file__).parent / "test_files" / "working_file.toml").read_text()) == []
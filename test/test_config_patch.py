@@ -0,0 +1,29 @@
+import copy
+
+import pytest
+
+from experiment_server._config_patch import apply_patch, diff_configs
+
+
+@pytest.mark.parametrize(
+    "old, new, expected", [
+        ([{"a": 1}], [{"a": 1}], []),
+        ([{"a": 1}], [{"a": 2}], [{"op": "replace", "path": "/0/a", "value": 2}]),
+        ([{"a": 1}], [{"a": 1.0}], [{"op": "replace", "path": "/0/a", "value": 1.0}]),
+        ([{"a": 1}], [{"a": True}], [{"op": "replace", "path": "/0/a", "value": True}]),
+        ([{"a": 1, "b": 2}], [{"a": 1, "c": 3}], [{"op": "remove", "path": "/0/b"}, {"op": "add", "path": "/0/c", "value": 3}]),
+        ([{"a": {"b": [1, 2]}}], [{"a": {"b": [1, 3]}}], [{"op": "replace", "path": "/0/a/b/1", "value": 3}]),
+        ([{"a": [1, 2]}], [{"a": [1]}], [{"op": "replace", "path": "/0/a", "value": [1]}]),
+        ([{"a/b": 1, "c~": 1}], [{"a/b": 2, "c~": 2}], [{"op": "replace", "path": "/0/a~1b", "value": 2},
+                                                        {"op": "replace", "path": "/0/c~0", "value": 2}]),
+        ([{"a": 1}], [{"a": 1}, {"b": 2}], [{"op": "add", "path": "/1", "value": {"b": 2}}]),
+        ([{"a": 1}, {"b": 2}, {"c": 3}], [{"a": 2}], [{"op": "replace", "path": "/0/a", "value": 2},
+                                                       {"op": "remove", "path": "/2"}, {"op": "remove", "path": "/1"}]),
+        ({"a": 1}, [1], [{"op": "replace", "path": "", "value": [1]}]),
+    ])
+def test_diff_configs(old, new, expected):
+    assert diff_configs(old, new) == expected
+    old_copy = copy.deepcopy(old)
+    assert apply_patch(old, expected) == new
+    # The document is not modified
+    assert old == old_copy
@@ -0,0 +1,76 @@
+import pytest
+from loguru import logger
+from experiment_server._logging import configure_logging, log_hot_path, log_request
+from .fixtures import caplog
+
+
+@pytest.fixture()
+def hot_path_logging():
+    yield configure_logging
+    configure_logging(enqueue=False)
+
+
+def test_log_hot_path(caplog, hot_path_logging):
+    log_hot_path("loaded {}", lambda: "config")
+    assert caplog.messages == ["loaded config"]
+
+
+def test_log_hot_path_not_formatted_below_level(caplog, hot_path_logging, mocker):
+    hot_path_logging(hot_path_log_level="TRACE", enqueue=False)
+    value = mocker.Mock(return_value="config")
+    log_hot_path("loaded {}", value)
+    value.assert_not_called()
+    assert caplog.messages == []
+
+
+@pytest.mark.parametrize(
+    "sample_rate, logged",[
+        (1, 10),
+        (0.5, 5),
+        (0.1, 1),
+        ])
+def test_log_request_sampling(caplog, hot_path_logging, sample_rate, logged):
+    hot_path_logging(request_log_sample_rate=sample_rate, enqueue=False)
+    for i in range(10):
+        log_request("request {}", lambda: i)
+    assert len(caplog.messages) == logged
+
+
+@pytest.mark.parametrize(
+    "kwargs",[
+        {"request_log_sample_rate": 0},
+        {"request_log_sample_rate": 1.5},
+        {"hot_path_log_level": "NOT_A_LEVEL"},
+        ])
+def test_configure_logging_invalid(hot_path_logging, kwargs):
+    with pytest.raises(ValueError):
+        hot_path_logging(enqueue=False, **kwargs)
+
+
+def test_configure_logging_keeps_handlers(hot_path_logging):
+    messages = []
+    handler_id = logger.add(messages.append, format="{message}")
+    try:
+        hot_path_logging()
+        logger.info("kept")
+        assert messages == ["kept\n"]
+    finally:
+        logger.remove(handler_id)
+
+
+def test_resolved_blocks_logged_without_lock(caplog):
+    from experiment_server._process_config import compile_config, _resolve_locks, _RESOLVE_LOCK_STRIPES
+    configuration = {"blocks": [{"name": name, "config": {"x": {"function_name": "choices", "args": [[1, 2]]}}} for name in "abc"],
+                     "configuration": {"order": ["a", "b", "c"]}}
+    participant_index = 3
+    resolve_lock = _resolve_locks[participant_index % _RESOLVE_LOCK_STRIPES]
+    locked = []
+    handler_id = logger.add(lambda message: locked.append(resolve_lock.locked()), level="INFO", format="{message}")
+    try:
+        blocks = compile_config(configuration).resolve_lazy(participant_index)
+        blocks[2]
+    finally:
+        logger.remove(handler_id)
+    # The blocks up to the one requested are resolved in order and logged after releasing the lock
+    assert [m.splitlines()[0] for m in caplog.messages] == [f"Block {block_id} loaded for participant 3: " for block_id in range(3)]
+    assert locked == [False] * 3
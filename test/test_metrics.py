@@ -0,0 +1,51 @@
+import pytest
+import experiment_server._api
+from experiment_server._metrics import Histogram, ServerMetrics
+from .fixtures import config_file
+
+
+@pytest.fixture()
+def experiment(config_file):
+    experiment = experiment_server._api.Experiment(config_file, 1)
+    yield experiment
+    experiment.watchdog.end_watch()
+
+
+@pytest.mark.parametrize(
+    "values, counts",[
+        ([], [0, 0, 0]),
+        ([0.5, 1, 1.5, 2, 3], [2, 2, 1]),
+        ])
+def test_histogram(values, counts):
+    histogram = Histogram((1, 2))
+    for value in values:
+        histogram.observe(value)
+    assert histogram.counts == counts
+    assert histogram.count == len(values)
+    assert histogram.sum == sum(values)
+
+
+def test_render(experiment):
+    metrics = ServerMetrics(experiment)
+    metrics.observe_request("ExperimentHandler", "GET", "config", 200, 0.003)
+    metrics.observe_request("ExperimentHandler", "GET", "config", 200, 0.2)
+    experiment.move_to_next()
+    experiment.move_to_next()
+    experiment.get_config()
+    experiment._config_file_modified_callback()
+
+    lines = metrics.render().splitlines()
+    labels = 'handler="ExperimentHandler",method="GET",action="config",code="200"'
+    assert f'experiment_server_request_duration_seconds_bucket{{{labels},le="0.001"}} 0' in lines
+    assert f'experiment_server_request_duration_seconds_bucket{{{labels},le="0.005"}} 1' in lines
+    assert f'experiment_server_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"experiment_server_request_duration_seconds_count{{{labels}}} 2" in lines
+    assert 'experiment_server_participants{state="active"} 1' in lines
+    assert "experiment_server_blocks_completed_total 1" in lines
+    assert 'experiment_server_config_reloads_total{result="success"} 1' in lines
+    assert "experiment_server_config_reload_duration_seconds_count 1" in lines
+    assert "experiment_server_config_processing_duration_seconds_count 2" in lines
+    # Participant 1 is added again on reload, with the same order
+    assert 'experiment_server_cache_requests_total{cache="ordering_rows",result="miss"} 2' in lines
+    assert 'experiment_server_cache_requests_total{cache="blocks",result="hit"} 1' in lines
+    assert 'experiment_server_cache_requests_total{cache="blocks",result="miss"} 2' in lines
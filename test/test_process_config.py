@@ -1,11 +1,14 @@
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pytest_mock
 from deepdiff import DeepDiff
 import random
+import toml
 
-from experiment_server._process_config import verify_config, _process_toml, resolve_extends, ChoicesFunction, _resolve_function
+from experiment_server._process_config import verify_config, check_orderings, _get_table_for_participants, _process_toml, resolve_extends, ChoicesFunction, _resolve_function, compile_config, compile_config_file, _replace_variables
 from experiment_server.utils import ExperimentServerConfigurationException
+from .fixtures import config_file
 
 
 MAIN_CONFIG_KEYS = ["buttonSize","trialsPerItem","conditionId","relativePosition", "participant_index", "name", "block_id"]
@@ -123,15 +126,19 @@ def test_resolve_extends_exceptions(config, expected):
         (Path(__file__).parent / "test_files/working_file_6.toml", 100, 2),
         ])
 def test_random_seed(mocker, f, seed, pid):
-    spy_seed = mocker.spy(random, "seed")
+    spy_seed = mocker.spy(random.Random, "seed")
+    global_spy_seed = mocker.spy(random, "seed")
     _ = _process_toml(f, pid)
-    spy_seed.assert_called_once_with(seed + pid)
+    spy_seed.assert_called_once_with(mocker.ANY, seed + pid)
+    # The participant's own random number generator is used
+    global_spy_seed.assert_not_called()
 
 
 @pytest.mark.parametrize(
     "params, expected", [
         ("wrong", "should be a dict."),
-        ({"a": 1, "b": 2}, "Function .* expected 0 or 1 keys in params, got [0-9]+"),
+        ({"unique": True, "scope": "cohort"}, "`unique` can not be used with `scope = \"cohort\"`"),
+        ({"scope": "experiment"}, "Allowed values for `scope` of `choices` are .*"),
         ({"a": 1}, f"Unexpected key in .*. Allowed keys: .*"),
     ])
 def test_functions_choices_fail_paramters(params, expected):
@@ -147,7 +154,8 @@ def test_functions_choices_fail_paramters(params, expected):
         ([list(range(10))], None, False),
     ])
 def test_functions_choices_pass_calls(args, params, test_unique):
-    choices_callable = ChoicesFunction(args, params)
+    # `unique` redraws a limited number of times, with the seed the redraws do not run out
+    choices_callable = ChoicesFunction(args, params, random.Random(5))
     out = [c for _ in range(5) for c in choices_callable(args, params)]
     if test_unique:
         assert len(set(out)) == len(out)
@@ -172,3 +180,192 @@ def test__resolve_function_unique_calls():
     [_resolve_function(**caller, function_calls=function_calls) for caller in callers for i in range(3)]
 
     assert len(function_calls) == len(callers)
+
+
+@pytest.mark.parametrize(
+    "f",[
+        (Path(__file__).parent / "test_files/working_file.toml"),
+        (Path(__file__).parent / "test_files/working_file_6.toml"),
+        (Path(__file__).parent / "test_files/working_file_9.toml"),
+        ])
+def test_compiled_config_resolve(f):
+    compiled_config = compile_config_file(f)
+    for pid in range(1, 6):
+        assert DeepDiff(compiled_config.resolve(pid), _process_toml(f, pid)) == {}
+
+
+def test_compiled_config_shares_static_values():
+    configuration = {"blocks": [{"name": "a", "config": {"static": {"x": [1, 2]}, "dynamic": {"v": {"function_name": "choices", "args": [[1, 2, 3]]}}}},
+                                {"name": "b", "extends": "a", "config": {"y": "$var"}}],
+                     "configuration": {"order": ["a", "b"], "variables": {"var": {"z": 1}}}}
+    compiled_config = compile_config(configuration)
+    config_1, config_2 = compiled_config.resolve(1), compiled_config.resolve(2)
+
+    # New dicts for each participant where values are set
+    assert config_1[0] is not config_2[0]
+    assert config_1[0]["config"] is not config_2[0]["config"]
+    assert config_1[0]["config"]["dynamic"] is not config_2[0]["config"]["dynamic"]
+    # Anything else is shared
+    assert config_1[0]["config"]["static"] is config_2[0]["config"]["static"]
+    assert config_1[1]["config"]["y"] is config_2[1]["config"]["y"]
+    assert config_1[0]["config"]["static"] is configuration["blocks"][0]["config"]["static"]
+
+
+@pytest.mark.parametrize(
+    "config, variables, expected", [
+        ({"a": "$x", "b": ["$x", ["$x", {"c": "$x"}]]}, {"x": 1},
+         {"a": 1, "b": [1, [1, {"c": 1}]]}),
+        ({"a": "${dir}/img_${n}.png", "b": "${n}", "c": "n=${n}"}, {"dir": "stim", "n": 1},
+         {"a": "stim/img_1.png", "b": 1, "c": "n=1"}),
+        ({"a": "$img"}, {"dir": "stim", "img": "${dir}/img.png"},
+         {"a": "stim/img.png"}),
+        ({"a": "$imgs"}, {"img": "img.png", "imgs": ["$img", "$img"]},
+         {"a": ["img.png", "img.png"]}),
+        ({"a": "cost 5$", "b": ["no variables"]}, {},
+         {"a": "cost 5$", "b": ["no variables"]}),
+        ({"a": "$$x", "b": "$${x}", "c": "${x}$$", "d": ["cost $$${x}"], "e": "$$$$"}, {"x": 1},
+         {"a": "$x", "b": "${x}", "c": "1$", "d": ["cost $1"], "e": "$$"}),
+        ({"a": "$price"}, {"price": "$$5"},
+         {"a": "$5"}),
+    ])
+def test_replace_variables(config, variables, expected):
+    assert DeepDiff(_replace_variables(config, variables), expected) == {}
+
+
+@pytest.mark.parametrize(
+    "config, variables, expected", [
+        ({"a": [["$y"]]}, {"x": 1}, "The variable `y` does not exsist in `configuration.variables`"),
+        ({"a": "${y}/a"}, {"x": 1}, "The variable `y` does not exsist in `configuration.variables`"),
+        ({"a": "$x"}, {"x": "$y", "y": ["${x}"]}, "Variables refer to each other in a cycle: x -> y -> x"),
+        ({"a": "a/${x}"}, {"x": {"y": 1}}, "The variable `x` is a table/array"),
+    ])
+def test_replace_variables_exceptions(config, variables, expected):
+    with pytest.raises(ExperimentServerConfigurationException, match=expected):
+        _replace_variables(config, variables)
+
+
+def test_replace_variables_shares_static_values():
+    config = {"a": {"b": [1, 2]}, "c": [{"d": "$x"}, {"e": 1}]}
+    output = _replace_variables(config, {"x": 1})
+    assert output["a"] is config["a"]
+    assert output["c"][1] is config["c"][1]
+    assert output["c"] is not config["c"]
+    assert config["c"][0]["d"] == "$x"
+
+
+@pytest.mark.parametrize(
+    "f",[
+        (Path(__file__).parent / "test_files/working_file.toml"),
+        (Path(__file__).parent / "test_files/working_file_6.toml"),
+        (Path(__file__).parent / "test_files/working_file_9.toml"),
+        (Path(__file__).parent.parent / "sample_config.toml"),
+        ])
+def test_compiled_config_resolve_lazy(f):
+    compiled_config = compile_config_file(f)
+    for pid in range(1, 6):
+        expected = compiled_config.resolve(pid)
+        random.seed(0)
+        random_state = random.getstate()
+        blocks = compiled_config.resolve_lazy(pid)
+        assert blocks.resolved_count == 0
+        assert list(blocks.block_names) == [c["name"] for c in expected]
+        # Access out of order
+        for block_id in reversed(range(len(blocks))):
+            assert DeepDiff(blocks[block_id], expected[block_id]) == {}
+        assert blocks.resolved_count == len(expected)
+        assert blocks == expected
+        # Does not change the global random state
+        assert random.getstate() == random_state
+
+
+def test_compiled_config_resolve_lazy_concurrent():
+    compiled_config = compile_config_file(Path(__file__).parent / "test_files/working_file_9.toml")
+    participant_indices = list(range(1, 41))
+    expected = [compiled_config.resolve(pid, suppress_message=True) for pid in participant_indices]
+
+    def _resolve(pid):
+        blocks = compiled_config.resolve_lazy(pid, suppress_message=True)
+        return [blocks[block_id] for block_id in reversed(range(len(blocks)))][::-1]
+
+    # Participants are resolved concurrently, each with their own random number generator
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        assert list(executor.map(_resolve, participant_indices)) == expected
+
+
+def test_compiled_config_resolve_lazy_shares_order(config_file):
+    compiled_config = compile_config_file(config_file)
+    assert compiled_config.resolve_lazy(1).block_names is compiled_config.resolve_lazy(2).block_names
+
+
+def _ordering_configuration(block_names, **configuration):
+    return {"blocks": [{"name": name, "config": {"x": {"function_name": "choices", "args": [[1, 2]], "params": {"unique": True}}}} for name in block_names],
+            "configuration": configuration}
+
+
+@pytest.mark.parametrize(
+    "configuration, expected_period", [
+        ({"order": ["a", "b", "c", "d"]}, 1),
+        ({"order": ["a", "b", "c", "d"], "groups_strategy": "latin_square"}, 4),
+        ({"order": [["a", "b"], ["c", "d"], ["e", "f"]], "groups_strategy": "latin_square"}, 3),
+        ({"order": [["a", "b"], ["c", "d"], ["e", "f"]], "groups_strategy": "latin_square", "within_groups_strategy": "latin_square"}, 6),
+        ({"order": [["a", "b", "c", "d"], ["e", "f", "g", "h"]], "within_groups_strategy": "latin_square"}, 8),
+        ({"order": {1: ["a"], 2: ["b"], 3: ["c"]}}, 3),
+        ({"order": ["a", "b"], "init_blocks": {1: [], 2: ["c"], 3: []}}, 3),
+        ({"order": ["a", "b", "c", "d"], "groups_strategy": "latin_square", "final_blocks": {1: ["e"], 2: ["f"], 3: ["e"]}}, 12),
+    ])
+def test_ordering_period(configuration, expected_period):
+    compiled_config = compile_config(_ordering_configuration("abcdefgh", **configuration))
+    assert compiled_config.ordering_period() == expected_period
+    orders = [compiled_config.block_names(pid) for pid in range(1, 2 * expected_period + 1)]
+    assert orders[:expected_period] == orders[expected_period:]
+
+
+def test_check_orderings():
+    # 24 orders, only the last order (3 blocks) uses up the 2 elements of `choices`
+    compiled_config = compile_config(_ordering_configuration("abcdefghi", order={i + 1: ["a", "b"] if i < 23 else ["c", "d", "e"] for i in range(24)}))
+    with pytest.raises(ExperimentServerConfigurationException, match="more calls to `choices`"):
+        check_orderings(compiled_config)
+    assert check_orderings(compiled_config, max_participants=23) == {
+        "ordering_period": 24, "randomized": False, "participants_checked": 23, "distinct_orders": 1, "coverage": 23 / 24}
+
+    compiled_config = compile_config(_ordering_configuration("ab", order=["a", "b"], groups_strategy="latin_square", random_seed=1))
+    random.seed(0)
+    random_state = random.getstate()
+    assert check_orderings(compiled_config) == {
+        "ordering_period": 2, "randomized": False, "participants_checked": 2, "distinct_orders": 2, "coverage": 1.0}
+    assert random.getstate() == random_state
+
+
+def test_get_table_for_participants_checks_orderings(tmp_path):
+    # 3 calls to `choices` with `unique` over 2 elements
+    configuration = _ordering_configuration("abc", order=[["a", "b", "c"]])
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(toml.dumps(configuration))
+    with pytest.raises(ExperimentServerConfigurationException, match="more calls to `choices`"):
+        _get_table_for_participants(config_file)
+
+
+@pytest.mark.parametrize("call, message", [
+    ({"function_name": "shuffle", "args": [[1, 2]]}, "Unknown function shuffle in block `a`"),
+    ({"args": [[1, 2]], "params": {"unique": True}}, "function call in block `a` is missing `function_name`"),
+    ({"function_name": "choices", "id": 1}, "function call in block `a` is missing `args`"),
+])
+def test_compile_config_validates_function_calls(call, message):
+    configuration = _ordering_configuration("a", order=["a"])
+    configuration["blocks"][0]["config"]["x"] = call
+    with pytest.raises(ExperimentServerConfigurationException, match=message):
+        compile_config(configuration)
+
+
+def test_compiled_config_cohort_choices():
+    configuration = {"blocks": [{"name": name, "config": {"stimulus": {"function_name": "choices", "args": [["w", "x", "y", "z"]], "params": {"scope": "cohort"}}}}
+                                for name in ["a", "b"]],
+                     "configuration": {"order": ["a", "b"]}}
+    compiled_config = compile_config(configuration)
+    stimuli = [c["config"]["stimulus"][0] for pid in range(1, 5) for c in compiled_config.resolve(pid)]
+    # Two rounds over the population, each participant gets the next values
+    assert sorted(stimuli[:4]) == sorted(stimuli[4:]) == ["w", "x", "y", "z"]
+    # A participant gets the same values when resolved again
+    assert [c["config"]["stimulus"][0] for c in compiled_config.resolve(2)] == stimuli[2:4]
+    assert [c["config"]["stimulus"][0] for c in compiled_config.resolve_lazy(3)] == stimuli[4:6]
+    assert [c["config"]["stimulus"][0] for c in compiled_config.resolve_lazy(5)] == [c["config"]["stimulus"][0] for c in compiled_config.resolve(5)]
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import uuid
+import pytest
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httpserver import HTTPServer
+from tornado.netutil import bind_sockets
+import experiment_server._api
+from experiment_server._server import _create_app, _ExperimentExecutor, _Fragments, _participants_query
+from experiment_server.utils import ExperimentServerConfigurationException
+from .fixtures import config_file
+
+
+@pytest.fixture()
+def experiment(config_file):
+    experiment = experiment_server._api.Experiment(config_file, 1)
+    yield experiment
+    experiment.watchdog.end_watch()
+
+
+def test_executor_runs_off_loop(experiment, mocker):
+    threads = []
+    add_participant_index = experiment.add_participant_index
+
+    def _add_participant_index(participant_index):
+        threads.append(threading.current_thread())
+        return add_participant_index(participant_index)
+
+    mocker.patch.object(experiment, "add_participant_index", side_effect=_add_participant_index)
+
+    async def _run():
+        executor = _ExperimentExecutor(experiment)
+        return await executor.add_participant_index(2), await executor.get_next_participant()
+
+    assert asyncio.run(_run()) == (True, 3)
+    assert threads[0] is not threading.main_thread()
+
+
+def test_executor_deduplicates_admissions(experiment, mocker):
+    add_participant_index = experiment.add_participant_index
+    released = threading.Event()
+
+    def _add_participant_index(participant_index):
+        released.wait(5)
+        return add_participant_index(participant_index)
+
+    spy = mocker.patch.object(experiment, "add_participant_index", side_effect=_add_participant_index)
+
+    async def _run():
+        executor = _ExperimentExecutor(experiment)
+        calls = [asyncio.ensure_future(executor.add_participant_index(2)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        released.set()
+        results = await asyncio.gather(*calls)
+        # Already added, the call is not run again
+        results.append(await executor.add_participant_index(2))
+        return results
+
+    assert asyncio.run(_run()) == [True, False, False, False, False, False]
+    spy.assert_called_once_with(2)
+
+
+def test_executor_deduplicated_admission_fails(experiment):
+    async def _run():
+        executor = _ExperimentExecutor(experiment)
+        return await asyncio.gather(executor.add_participant_index(0), executor.add_participant_index(0), return_exceptions=True)
+
+    results = asyncio.run(_run())
+    assert all(isinstance(r, ExperimentServerConfigurationException) for r in results)
+
+
+_PARTICIPANTS_QUERY_NAMES = {"after": "after", "limit": "limit", "active": "active", "block_name": "block", "first": "first", "last": "last"}
+
+
+@pytest.mark.parametrize(
+    "query, expected", [
+        ({}, {}),
+        ({"after": "3", "limit": "10", "block": "a", "first": "", "active": "false"}, {"after": 3, "limit": 10, "block_name": "a", "active": False}),
+        ({"active": "yes"}, ValueError),
+        ({"last": "x"}, ValueError),
+        ({"limit": "0"}, ValueError),
+        ({"limit": "1001"}, ValueError),
+    ])
+def test_participants_query(query, expected):
+    if expected is ValueError:
+        with pytest.raises(ValueError):
+            _participants_query(query.get, _PARTICIPANTS_QUERY_NAMES)
+    else:
+        assert _participants_query(query.get, _PARTICIPANTS_QUERY_NAMES) == expected
+
+
+def test_fragments_cached(experiment):
+    fragments = _Fragments(experiment)
+    assert fragments.render_config("config_table.html", 1) is None
+    experiment.move_to_next(1)
+    config_table = fragments.render_config("config_table.html", 1)
+    assert f"<td>block_id</td><td>0</td>" in config_table
+    assert fragments.render_config("config_table.html", None) is config_table
+    assert (fragments.cache_stats.hits, fragments.cache_stats.misses) == (1, 2)
+
+    experiment.update_config({"extra": "<b>"}, 1)
+    fragments.invalidate(1)
+    config_table = fragments.render_config("config_table.html", 1)
+    assert "<td>&lt;b&gt;</td>" in config_table
+    assert fragments.render_config("config_table.html", 1) is config_table
+
+    # Reloading resolves the config again
+    experiment._config_file_modified_callback()
+    assert "extra" not in fragments.render_config("config_table.html", 1)
+    experiment.move_to_next(1)
+    assert f"<td>block_id</td><td>1</td>" in fragments.render_config("config_table.html", 1)
+    assert 'placeholder="1"' in fragments.render_config("editable_config_table.html", 1)
+
+
+def test_metrics_series_bounded(experiment):
+    async def _run():
+        sockets = bind_sockets(0, "127.0.0.1")
+        server = HTTPServer(_create_app(experiment))
+        server.add_sockets(sockets)
+        url = f"http://127.0.0.1:{sockets[0].getsockname()[1]}"
+        client = AsyncHTTPClient()
+
+        async def _series_count():
+            response = await client.fetch(url + "/metrics")
+            return sum(1 for line in response.body.decode().splitlines()
+                       if line.startswith("experiment_server_request_duration_seconds_count"))
+
+        async def _request_unknown_actions(count):
+            for _ in range(count):
+                action = uuid.uuid4().hex
+                for path in (f"/web/{action}", f"/api/{action}", f"/api/{action}/999"):
+                    await client.fetch(url + path, raise_error=False)
+                await client.fetch(url + f"/api/{action}", method="POST", body="", raise_error=False)
+
+        await client.fetch(url + "/api/config", raise_error=False)
+        await _request_unknown_actions(5)
+        series_count = await _series_count()
+        await _request_unknown_actions(20)
+        counts = series_count, await _series_count()
+        server.stop()
+        return counts
+
+    series_count, series_count_after = asyncio.run(_run())
+    assert series_count_after == series_count
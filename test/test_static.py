@@ -0,0 +1,48 @@
+import gzip
+
+import pytest
+
+from experiment_server._static import StaticAssets, _accepted_encoding
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "css").mkdir()
+    (tmp_path / "js" / "app.js").write_text("console.log(1);\n" * 100)
+    (tmp_path / "css" / "small.css").write_text("body {}")
+    (tmp_path / "index.html").write_text('<script src="/js/app.js"></script><link href="/css/small.css"><img src="/img/x.png">')
+    return tmp_path
+
+
+def test_static_assets(static_dir):
+    assets = StaticAssets(static_dir)
+    app_js = assets.assets["js/app.js"]
+    assert assets.url("js/app.js") == f"/assets/{app_js.content_hash}/js/app.js"
+    assert assets.index.content.decode() == (f'<script src="{assets.url("js/app.js")}"></script>'
+                                             f'<link href="{assets.url("css/small.css")}"><img src="/img/x.png">')
+    assert app_js.compressible
+    assert not assets.assets["css/small.css"].compressible
+    assert gzip.decompress(app_js.encoded("gzip")) == app_js.content
+    # The compressed body is kept
+    assert app_js.encoded("gzip") is app_js.encoded("gzip")
+
+    # The hashes change with the content
+    (static_dir / "js" / "app.js").write_text("console.log(2);\n")
+    changed_assets = StaticAssets(static_dir)
+    assert changed_assets.url("js/app.js") != assets.url("js/app.js")
+    assert changed_assets.index.content_hash != assets.index.content_hash
+    assert changed_assets.url("css/small.css") == assets.url("css/small.css")
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected", [
+        ("", None),
+        ("gzip, deflate", "gzip"),
+        ("GZIP", "gzip"),
+        ("gzip;q=0", None),
+        ("identity", None),
+        ("deflate, gzip;q=0.5", "gzip"),
+    ])
+def test_accepted_encoding(accept_encoding, expected):
+    assert _accepted_encoding(accept_encoding) == expected
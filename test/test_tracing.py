@@ -0,0 +1,35 @@
+from experiment_server._tracing import span, trace
+from experiment_server._process_config import process_config_file
+from .fixtures import config_file
+
+
+def test_span_without_trace():
+    with span("stage", size=1) as attributes:
+        attributes["other"] = 2
+
+
+def test_trace(config_file):
+    received = []
+    with trace(received.append) as tracer:
+        with span("outer", size=1) as attributes:
+            with span("inner"):
+                pass
+            attributes["other"] = 2
+    assert [s.name for s in tracer.spans] == ["inner", "outer"]
+    assert received == tracer.spans
+    assert tracer.spans[1].attributes == {"size": 1, "other": 2}
+    assert tracer.spans[1].duration >= tracer.spans[0].duration
+
+    events = tracer.to_chrome_trace()["traceEvents"]
+    assert [e["name"] for e in events] == ["inner", "outer"]
+    assert all(e["ph"] == "X" for e in events)
+
+
+def test_trace_process_config_file(config_file):
+    with trace() as tracer:
+        process_config_file(config_file, 2, suppress_message=True)
+    spans = {s.name: s for s in tracer.spans}
+    assert list(spans) == ["toml.load", "replace_variables", "resolve_extends", "compile_function_calls", "compile_config", "ordering", "function_calls", "resolve"]
+    assert spans["resolve"].attributes == {"participant_index": 2}
+    assert spans["function_calls"].attributes["blocks"] == 10
+    assert [row[0] for row in tracer.breakdown()] == list(spans)
@@ -0,0 +1,359 @@
+import asyncio
+import threading
+
+from textual.app import App
+
+from experiment_server._api import Experiment
+from experiment_server._ui import (_PARTICIPANTS_PAGE_SIZE, ExperimentTextualEditorOnlyApp, ParticipantTab,
+                                   RefreshScheduler, _ConfigTextArea, _ContentCache)
+from .fixtures import config_file
+
+
+_INTERVAL = 0.05
+# Slack for the timers of the loop
+_TOLERANCE = 0.01
+
+
+def test_refresh_scheduler_coalesces_burst():
+    async def _run():
+        loop = asyncio.get_running_loop()
+        scheduler = RefreshScheduler(_INTERVAL)
+        scheduler.attach(loop)
+        refresh_times = []
+
+        def _callback():
+            refresh_times.append(loop.time())
+
+        def _request_burst():
+            for _ in range(250):
+                scheduler.request(_callback)
+
+        threads = [threading.Thread(target=_request_burst) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await asyncio.sleep(_INTERVAL * 4)
+        return refresh_times, dict(scheduler.stats)
+
+    refresh_times, stats = asyncio.run(_run())
+    assert len(refresh_times) == 1
+    assert stats["requested"] == 1000
+    assert stats["merged"] == 999
+    assert stats["refreshed"] == 1
+
+
+def test_refresh_scheduler_once_per_interval():
+    async def _run():
+        loop = asyncio.get_running_loop()
+        scheduler = RefreshScheduler(_INTERVAL)
+        scheduler.attach(loop)
+        refresh_times = []
+
+        def _callback():
+            refresh_times.append(loop.time())
+
+        start = loop.time()
+        # Requests spread over several intervals
+        while loop.time() - start < _INTERVAL * 5:
+            scheduler.request(_callback)
+            await asyncio.sleep(_INTERVAL / 10)
+        await asyncio.sleep(_INTERVAL * 2)
+        return refresh_times, loop.time() - start
+
+    refresh_times, elapsed = asyncio.run(_run())
+    assert 1 < len(refresh_times) <= elapsed / _INTERVAL + 1
+    assert all(later - earlier >= _INTERVAL - _TOLERANCE for earlier, later in zip(refresh_times, refresh_times[1:]))
+
+
+def test_refresh_scheduler_request_after_refresh():
+    async def _run():
+        loop = asyncio.get_running_loop()
+        scheduler = RefreshScheduler(_INTERVAL)
+        scheduler.attach(loop)
+        refresh_times = []
+
+        def _callback():
+            refresh_times.append(loop.time())
+
+        scheduler.request(_callback)
+        await asyncio.sleep(_INTERVAL / 2)
+        assert len(refresh_times) == 1
+        # Requested from another thread after the refresh
+        thread = threading.Thread(target=scheduler.request, args=(_callback,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(_INTERVAL * 3)
+        return refresh_times
+
+    refresh_times = asyncio.run(_run())
+    assert len(refresh_times) == 2
+    assert _INTERVAL - _TOLERANCE <= refresh_times[1] - refresh_times[0] <= _INTERVAL * 2
+
+
+def test_refresh_scheduler_request_while_refreshing():
+    async def _run():
+        loop = asyncio.get_running_loop()
+        scheduler = RefreshScheduler(_INTERVAL)
+        scheduler.attach(loop)
+        calls = []
+
+        def _other():
+            calls.append(("other", loop.time()))
+
+        def _callback():
+            calls.append(("callback", loop.time()))
+            if len(calls) == 1:
+                # Not called yet, called in the same refresh
+                scheduler.request(_other)
+                # Already called, left for the next refresh
+                scheduler.request(_callback)
+
+        scheduler.request(_callback)
+        await asyncio.sleep(_INTERVAL * 3)
+        return calls
+
+    calls = asyncio.run(_run())
+    assert [name for name, _ in calls] == ["callback", "other", "callback"]
+    assert calls[1][1] - calls[0][1] < _INTERVAL / 2
+    assert calls[2][1] - calls[0][1] >= _INTERVAL - _TOLERANCE
+
+
+class _ParticipantTabApp(App):
+    def __init__(self, experiment: Experiment):
+        super().__init__()
+        self.experiment = experiment
+        self.refresh_scheduler = RefreshScheduler(_INTERVAL)
+
+    def compose(self):
+        # As `ExperimentTextualApp`, the table needs the active app
+        self.participant_tab = ParticipantTab(self.experiment, self.refresh_scheduler)
+        yield self.participant_tab
+
+    def on_mount(self):
+        self.refresh_scheduler.attach(asyncio.get_running_loop())
+
+
+def _run_participant_tab(experiment, test):
+    async def _run():
+        app = _ParticipantTabApp(experiment)
+        async with app.run_test():
+            await asyncio.sleep(_INTERVAL * 3)
+            tab = app.participant_tab
+            page_loads = []
+            load_participants_page = tab._load_participants_page
+            tab._load_participants_page = lambda: (page_loads.append(tab._participants_page), load_participants_page())
+            return await test(tab, page_loads)
+
+    try:
+        return asyncio.run(_run())
+    finally:
+        experiment.watchdog.end_watch()
+
+
+def test_participant_tab_updates_moved_participant_in_place(config_file):
+    experiment = Experiment(str(config_file))
+    for _ in range(10):
+        experiment.get_next_participant()
+
+    async def _test(tab, page_loads):
+        assert tab.participants_table.get_row("3") == ["3", "-1", "START", "False"]
+        # Moved from a thread of the server
+        thread = threading.Thread(target=experiment.move_to_next, args=(3,))
+        thread.start()
+        thread.join()
+        await asyncio.sleep(_INTERVAL * 3)
+        return tab.participants_table.get_row("3"), tab.participants_table.row_count, page_loads
+
+    row, row_count, page_loads = _run_participant_tab(experiment, _test)
+    state = experiment.get_participant_state(3)
+    assert row == ["3", "0", state.block_name, "True"]
+    assert row_count == len(experiment.global_state)
+    assert page_loads == []
+
+
+def test_participant_tab_add_participant_on_other_page(config_file):
+    experiment = Experiment(str(config_file))
+    # Even indices, leaving room for participants added before the second page
+    for participant_index in range(2, _PARTICIPANTS_PAGE_SIZE * 4 + 1, 2):
+        experiment.add_participant_index(participant_index)
+
+    async def _test(tab, page_loads):
+        visible_rows = [row.key.value for row in tab.participants_table.ordered_rows]
+        experiment.add_participant_index(_PARTICIPANTS_PAGE_SIZE * 5)
+        await asyncio.sleep(_INTERVAL * 3)
+        visible_rows_after_add = [row.key.value for row in tab.participants_table.ordered_rows]
+        page_loads_after_add = list(page_loads)
+        # A participant added before the visible page moves its rows
+        tab.change_participants_page(1)
+        page_loads.clear()
+        experiment.add_participant_index(3)
+        await asyncio.sleep(_INTERVAL * 3)
+        return visible_rows, visible_rows_after_add, page_loads_after_add, page_loads, str(tab.participants_page_label.render())
+
+    visible_rows, visible_rows_after_add, page_loads_after_add, page_loads, page_label = _run_participant_tab(experiment, _test)
+    assert visible_rows == visible_rows_after_add
+    assert len(visible_rows) == _PARTICIPANTS_PAGE_SIZE
+    assert page_loads_after_add == []
+    assert page_loads == [1]
+    participants_count = len(experiment.global_state)
+    assert page_label == f"Participants {_PARTICIPANTS_PAGE_SIZE + 1}-{_PARTICIPANTS_PAGE_SIZE * 2} of {participants_count}"
+
+
+async def _wait_for(condition, timeout=10.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "Timed out waiting for the UI"
+        await asyncio.sleep(0.01)
+
+
+def _record_calls(editor, method_name, calls):
+    method = getattr(editor, method_name)
+
+    def _recorded(*args):
+        calls.append((method_name, threading.get_ident(), args))
+        return method(*args)
+    setattr(editor, method_name, _recorded)
+
+
+def _editor_app(config_file, tmp_path):
+    edited_config_file = tmp_path / "config.toml"
+    edited_config_file.write_text(config_file.read_text())
+    return ExperimentTextualEditorOnlyApp(str(edited_config_file))
+
+
+def test_config_editor_workers_off_ui_thread(config_file, tmp_path):
+    app = _editor_app(config_file, tmp_path)
+    editor = app.config_editor
+    calls = []
+    for method_name in ("_order_preview_worker", "_order_preview_done", "_full_check_worker", "_full_check_done",
+                        "_verify_config_worker", "_save_verified_config"):
+        _record_calls(editor, method_name, calls)
+
+    def _called(method_name):
+        return [thread_id for name, thread_id, _ in calls if name == method_name]
+
+    async def _run():
+        async with app.run_test():
+            await _wait_for(lambda: _called("_order_preview_done"))
+            editor.edit_config()
+            # The text is reloaded from the file when the editing starts
+            await asyncio.sleep(app.refresh_scheduler.interval * 3)
+            editor.config_edit_text.insert('\n[[blocks]]\nname = "new"\nconfig = {}\n', editor.config_edit_text.document.end)
+            await _wait_for(lambda: _called("_full_check_done"))
+            editor.save_config()
+            await _wait_for(lambda: _called("_save_verified_config"))
+            return threading.get_ident()
+
+    ui_thread_id = asyncio.run(_run())
+    for method_name in ("_order_preview_worker", "_full_check_worker", "_verify_config_worker"):
+        # Workers can run again, e.g., the order of the saved text is previewed
+        assert len(_called(method_name)) > 0
+        assert ui_thread_id not in _called(method_name)
+    for method_name in ("_order_preview_done", "_full_check_done", "_save_verified_config"):
+        assert set(_called(method_name)) == {ui_thread_id}
+    assert (tmp_path / "config.toml").read_text().endswith('name = "new"\nconfig = {}\n')
+    assert editor._full_check_error is None
+
+
+def test_config_editor_drops_stale_results(config_file, tmp_path):
+    app = _editor_app(config_file, tmp_path)
+    editor = app.config_editor
+    calls = []
+    _record_calls(editor, "_order_preview_done", calls)
+
+    async def _run():
+        async with app.run_test():
+            await _wait_for(lambda: calls)
+            order_log_writes = []
+            editor.config_order_log.write = lambda content, *args, **kwargs: order_log_writes.append(content)
+            key = editor._order_preview_key
+            full_check_error = editor._full_check_error
+            # Results of an older text finishing after the latest text was shown
+            editor._order_preview_done(_ContentCache.key("older text"), "older order")
+            editor._full_check_done(_ContentCache.key("older text"), "older error")
+            return key, full_check_error, order_log_writes
+
+    key, full_check_error, order_log_writes = asyncio.run(_run())
+    assert key == _ContentCache.key((tmp_path / "config.toml").read_text())
+    assert order_log_writes == []
+    assert full_check_error == editor._full_check_error
+
+
+def test_config_editor_results_cached(config_file, tmp_path):
+    app = _editor_app(config_file, tmp_path)
+    editor = app.config_editor
+    calls = []
+    for method_name in ("_order_preview_worker", "_order_preview_done", "_full_check_worker", "_full_check_done",
+                        "_verify_config_worker", "_save_verified_config"):
+        _record_calls(editor, method_name, calls)
+
+    def _count(method_name):
+        return len([name for name, _, _ in calls if name == method_name])
+
+    async def _run():
+        async with app.run_test():
+            await _wait_for(lambda: _count("_order_preview_done") == 1)
+            text = editor.config_edit_text.text
+            editor._show_order_preview(text)
+            editor._start_full_check()
+            await _wait_for(lambda: _count("_full_check_done") == 1)
+            editor._start_full_check()
+            editor.edit_config()
+            editor.save_config()
+            await _wait_for(lambda: _count("_save_verified_config") == 1)
+            editor.edit_config()
+            editor.save_config()
+            await asyncio.sleep(0.1)
+
+    asyncio.run(_run())
+    assert _count("_order_preview_worker") == 1
+    assert _count("_full_check_worker") == 1
+    assert _count("_full_check_done") == 2
+    assert _count("_verify_config_worker") == 1
+    assert _count("_save_verified_config") == 2
+
+
+def test_config_editor_highlights_diagnostics(config_file, tmp_path):
+    # `_ConfigTextArea` extends the private highlighting of `TextArea`, this fails if it changes
+    app = _editor_app(config_file, tmp_path)
+    editor = app.config_editor
+    text_area = editor.config_edit_text
+
+    def _highlight_names():
+        return {highlight[2] for row in text_area._highlights.values() for highlight in row}
+
+    async def _run():
+        async with app.run_test() as pilot:
+            await _wait_for(lambda: text_area.text != "")
+            await _wait_for(lambda: len(_highlight_names()) > 1)
+            highlight_names = _highlight_names()
+            editor.edit_config()
+            await asyncio.sleep(app.refresh_scheduler.interval * 3)
+            end_row = text_area.document.end[0]
+            text_area.insert('\n[[blocks]]\nname = "new"\nconfig = {a = {function_name = "unknown_function", args = [1]}}\n',
+                             text_area.document.end)
+            await _wait_for(lambda: editor.config_diagnostics_message.display)
+            diagnostic_rows = sorted(row for row, highlights in text_area._highlights.items()
+                                     if any(h[2] == _ConfigTextArea._DIAGNOSTIC_HIGHLIGHT for h in highlights))
+            # The diagnostics are rendered with their own style
+            await pilot.pause()
+            diagnostic_style = text_area._theme.syntax_styles.get(_ConfigTextArea._DIAGNOSTIC_HIGHLIGHT)
+            message = str(editor.config_diagnostics_message.render())
+            text_area.undo()
+            await _wait_for(lambda: not editor._diagnostics)
+            diagnostic_rows_after_undo = [row for row, highlights in text_area._highlights.items()
+                                          if any(h[2] == _ConfigTextArea._DIAGNOSTIC_HIGHLIGHT for h in highlights)]
+            return highlight_names, end_row, diagnostic_rows, diagnostic_style, message, diagnostic_rows_after_undo, _highlight_names()
+
+    highlight_names, end_row, diagnostic_rows, diagnostic_style, message, diagnostic_rows_after_undo, highlight_names_after_undo = asyncio.run(_run())
+    assert len(highlight_names) > 1
+    assert _ConfigTextArea._DIAGNOSTIC_HIGHLIGHT not in highlight_names
+    # The errors of a block are shown on its header
+    assert diagnostic_rows == [end_row + 1]
+    assert diagnostic_style is not None
+    assert f"Line {end_row + 2}:" in message
+    assert "unknown_function" in message
+    assert diagnostic_rows_after_undo == []
+    assert highlight_names_after_undo == highlight_names
@@ -0,0 +1,35 @@
+import pytest
+
+from experiment_server import _wire_format
+from experiment_server.utils import ExperimentServerException
+
+
+@pytest.mark.parametrize(
+    "accept, expected", [
+        (None, None),
+        ("*/*", None),
+        ("application/json", None),
+        ("application/msgpack", "application/msgpack"),
+        ("application/x-msgpack", "application/msgpack"),
+        ("application/msgpack, application/json;q=0.5", "application/msgpack"),
+        ("application/json, application/msgpack;q=0.5", None),
+        ("application/msgpack;q=0, application/cbor", "application/cbor"),
+        ("text/html, application/cbor;q=0.9, */*;q=0.8", "application/cbor"),
+    ])
+def test_negotiate(accept, expected):
+    pytest.importorskip("msgpack")
+    pytest.importorskip("cbor2")
+    assert _wire_format.negotiate(accept) == expected
+
+
+@pytest.mark.parametrize("media_type, module", [("application/msgpack", "msgpack"), ("application/cbor", "cbor2")])
+def test_dumps_loads(media_type, module):
+    pytest.importorskip(module)
+    value = [{"name": "a", "config": {"x": 1, "y": [1.5, "b", True, None], "z": {"w": "c"}}}]
+    assert _wire_format.loads(media_type, _wire_format.dumps(media_type, value)) == value
+    assert _wire_format.loads("application/json", b'{"a": 1}') == {"a": 1}
+
+
+def test_media_type_fails():
+    with pytest.raises(ExperimentServerException):
+        _wire_format.media_type("xml")